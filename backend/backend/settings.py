@@ -122,17 +122,44 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
         'LOCATION': 'django_cache',
-    }
-}
-
-CHANNEL_LAYERS = {
-    'default': {
-        # 'BACKEND': 'channels.layers.InMemoryChannelLayer',
-        'BACKEND': 'channels_postgres.core.PostgresChannelLayer',
-        'CONFIG': DATABASES['channels_postgres'],
     },
+    # The shared tier of the term search cache, for example redis://localhost:6379/1
+    'search': env.cache('SEARCH_CACHE_URL', default='dbcache://django_cache'),
 }
 
+# Websocket broadcast backend, either 'postgres', 'socket' (redis compatible pub/sub server) or 'memory' (single process)
+BROADCAST_BACKEND = env('BROADCAST_BACKEND', default='postgres')
+BROADCAST_URL = env('BROADCAST_URL', default='redis://localhost:6379')
+
+if BROADCAST_BACKEND == 'socket':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'tasks.layers.SocketChannelLayer',
+            'CONFIG': {
+                'url': BROADCAST_URL,
+            },
+        },
+    }
+elif BROADCAST_BACKEND == 'memory':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_postgres.core.PostgresChannelLayer',
+            'CONFIG': DATABASES['channels_postgres'],
+        },
+    }
+
+# Websocket group messages sent within the window are coalesced and written in a single statement
+BROADCAST_WINDOW_MS = env.int('BROADCAST_WINDOW_MS', default=20)
+BROADCAST_MAX_BATCH = env.int('BROADCAST_MAX_BATCH', default=500)
+# Task state transitions within the window are published as a single task update
+TASK_EVENT_WINDOW_MS = env.int('TASK_EVENT_WINDOW_MS', default=10)
+
 # Celery settings
 CELERY_BROKER_URL = f'sqla+postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}'
 CELERY_SEND_EVENTS = True
@@ -219,6 +246,64 @@ LOGGING = {
 BLAZEGRAPH_ENABLE = env.bool('BLAZEGRAPH_ENABLE', default=True)
 BLAZEGRAPH_ENDPOINT = env('BLAZEGRAPH_ENDPOINT', default='http://localhost:9999')
 MEILISEARCH_ENDPOINT = env('MEILISEARCH_ENDPOINT', default='http://localhost:7700')
+# Search index ingestion: preparation/upload workers, maximum NDJSON payload size and how long to wait for indexing
+MEILISEARCH_INDEX_WORKERS = env.int('MEILISEARCH_INDEX_WORKERS', default=4)
+MEILISEARCH_BATCH_BYTES = env.int('MEILISEARCH_BATCH_BYTES', default=8 * 1024 * 1024)
+MEILISEARCH_TASK_TIMEOUT = env.int('MEILISEARCH_TASK_TIMEOUT', default=60 * 60 * 6)
+# How long the known search indexes are trusted before they are listed again
+MEILISEARCH_REGISTRY_TTL = env.int('MEILISEARCH_REGISTRY_TTL', default=10)
+# Threads searching the default vocabulary and the dataset search services concurrently
+SEARCH_WORKERS = env.int('SEARCH_WORKERS', default=16)
+# Term search result cache: the in-process tier (entries, bytes and lifetime), the lifetime of results in the shared
+# tier and how long a process keeps using a dataset generation before it sees invalidations by other processes
+SEARCH_CACHE_MAX_ENTRIES = env.int('SEARCH_CACHE_MAX_ENTRIES', default=4096)
+SEARCH_CACHE_MAX_BYTES = env.int('SEARCH_CACHE_MAX_BYTES', default=64 * 1024 * 1024)
+SEARCH_CACHE_TTL = env.int('SEARCH_CACHE_TTL', default=60 * 10)
+SEARCH_CACHE_SHARED_TTL = env.int('SEARCH_CACHE_SHARED_TTL', default=60 * 60 * 24 * 7)
+SEARCH_CACHE_GENERATION_TTL = env.int('SEARCH_CACHE_GENERATION_TTL', default=5)
+# Cached TriplyDB search endpoint discovery: lifetime of found and missing endpoints, and the age after which a found
+# endpoint is rediscovered in the background
+TRIPLYDB_ENDPOINT_TTL = env.int('TRIPLYDB_ENDPOINT_TTL', default=60 * 60 * 24)
+TRIPLYDB_ENDPOINT_NEGATIVE_TTL = env.int('TRIPLYDB_ENDPOINT_NEGATIVE_TTL', default=60)
+TRIPLYDB_ENDPOINT_REFRESH = env.int('TRIPLYDB_ENDPOINT_REFRESH', default=60 * 10)
+
+# Pooled keep-alive HTTP sessions used for the query services
+HTTP_POOL_MAXSIZE = env.int('HTTP_POOL_MAXSIZE', default=10)
+HTTP_POOL_MAX_AGE = env.int('HTTP_POOL_MAX_AGE', default=60 * 10)
+HTTP_POOL_MAX_FAILURES = env.int('HTTP_POOL_MAX_FAILURES', default=3)
+
+# Dataset downloads: files downloaded at once, parallel range segments per large file and resume attempts
+DOWNLOAD_CONCURRENCY = env.int('DOWNLOAD_CONCURRENCY', default=4)
+DOWNLOAD_SEGMENTS = env.int('DOWNLOAD_SEGMENTS', default=4)
+DOWNLOAD_SEGMENT_MIN_SIZE = env.int('DOWNLOAD_SEGMENT_MIN_SIZE', default=64 * 1024 * 1024)
+DOWNLOAD_RETRIES = env.int('DOWNLOAD_RETRIES', default=5)
+# Approximate size of the chunks large N-Triples files are split into before they are loaded into Blazegraph
+IMPORT_CHUNK_SIZE = env.int('IMPORT_CHUNK_SIZE', default=256 * 1024 * 1024)
+
+# Incremental dataset refresh: number of hashed snapshot buckets, triples per SPARQL UPDATE and the maximum number of
+# changed terms updated in place before the search index is rebuilt instead
+REFRESH_BUCKETS = env.int('REFRESH_BUCKETS', default=256)
+REFRESH_UPDATE_BATCH = env.int('REFRESH_UPDATE_BATCH', default=5000)
+REFRESH_MAX_TERMS = env.int('REFRESH_MAX_TERMS', default=50000)
+
+# Maximum number of result rows (or triples) kept in memory per query, the rest of the result is discarded
+QUERY_ROW_WINDOW = env.int('QUERY_ROW_WINDOW', default=100000)
+
+# Paginated query results (cursors) spilled to local storage
+QUERY_CURSOR_TTL = env.int('QUERY_CURSOR_TTL', default=60 * 60)
+QUERY_CURSOR_MAX_ROWS = env.int('QUERY_CURSOR_MAX_ROWS', default=1000000)
+QUERY_CURSOR_MAX_PAGE = env.int('QUERY_CURSOR_MAX_PAGE', default=10000)
+QUERY_CURSOR_SWEEP_INTERVAL = env.int('QUERY_CURSOR_SWEEP_INTERVAL', default=60 * 15)
+
+# Number of queries run concurrently (per dataset) when a cell issues several queries
+QUERY_CONCURRENCY = env.int('QUERY_CONCURRENCY', default=4)
+QUERY_ASYNC_WORKERS = env.int('QUERY_ASYNC_WORKERS', default=16)
+
+# In-process SPARQL result cache
+QUERY_CACHE_ENABLE = env.bool('QUERY_CACHE_ENABLE', default=True)
+QUERY_CACHE_MAX_ENTRIES = env.int('QUERY_CACHE_MAX_ENTRIES', default=1024)
+QUERY_CACHE_MAX_BYTES = env.int('QUERY_CACHE_MAX_BYTES', default=128 * 1024 * 1024)
+QUERY_CACHE_TTL = env.int('QUERY_CACHE_TTL', default=60 * 15)
 
 ROOT_DIR = BASE_DIR.parent.absolute()
 
@@ -261,4 +346,12 @@ SIMPLE_JWT = {
 
 DJANGO_SUPERUSER_USERNAME = env('DJANGO_SUPERUSER_USERNAME', default='admin')
 DJANGO_SUPERUSER_EMAIL = env('DJANGO_SUPERUSER_EMAIL', default='example@example.com')
-DJANGO_SUPERUSER_PASSWORD = env('DJANGO_SUPERUSER_PASSWORD', default='admin')
\ No newline at end of file
+DJANGO_SUPERUSER_PASSWORD = env('DJANGO_SUPERUSER_PASSWORD', default='admin')
+
+# Periodic maintenance tasks, scheduled by celery beat (the worker runs it embedded with -B)
+CELERY_BEAT_SCHEDULE = {
+    'clear-expired-cursors': {
+        'task': 'datasets.tasks.maintenance.clear_expired_cursors',
+        'schedule': QUERY_CURSOR_SWEEP_INTERVAL,
+    },
+}
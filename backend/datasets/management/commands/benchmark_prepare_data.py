@@ -0,0 +1,94 @@
+import re
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management import BaseCommand
+
+from datasets.services.meilisearch import _prepare_data, _prepare_payload
+
+
+def _prepare_data_rowwise(data: pd.DataFrame):
+    # The previous, row by row implementation, kept as the baseline of the benchmark
+    data['is_url'] = data.iri.str.startswith('<http')
+
+    def clean_iri(iri):
+        if not iri.startswith('<http'):
+            return iri
+
+        try:
+            path = iri[1:-1].split('/')[-1]
+            path = re.sub(r"([-_#])", " ", path)
+            path = re.sub((r"(?<![A-Z])([A-Z])"), r" \1", path)
+
+            return path
+        except Exception:
+            return iri
+
+    data['iri_text'] = data.iri.apply(clean_iri)
+
+    return data
+
+
+def _prepare_payload_rowwise(chunk: pd.DataFrame, start_id: int):
+    chunk['id'] = chunk.index + start_id
+    chunk = chunk.replace({np.nan: None})
+    chunk = _prepare_data_rowwise(chunk)
+    return chunk.to_dict(orient='records')
+
+
+def _generate_terms(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    words = np.array(['birthPlace', 'Person', 'has_part', 'subClassOf', 'label', 'DBpediaResource', 'x-ray', 'Q42'])
+    picks = words[rng.integers(0, len(words), size=rows)]
+    ids = rng.integers(0, 10 ** 9, size=rows).astype(str)
+    kinds = rng.integers(0, 10, size=rows)
+
+    iri = np.where(
+        kinds < 6, '<http://example.org/resource/' + picks + '_' + ids + '>',
+        np.where(kinds < 8, '<http://example.org/ontology#' + picks + '>', 'Some literal ' + ids + '@en')
+    )
+    return pd.DataFrame({
+        'iri': iri,
+        'label': np.where(kinds < 3, picks, None),
+        'count': rng.integers(0, 10 ** 6, size=rows),
+        'pos': rng.integers(0, 3, size=rows),
+        'rdf_type': None,
+        'description': None,
+    })
+
+
+class Command(BaseCommand):
+    help = 'Measures the throughput (rows per second) of preparing term documents for the search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10 ** 6)
+        parser.add_argument('--chunk-size', type=int, default=10 ** 5)
+
+    def _measure(self, name: str, fn, data: pd.DataFrame, chunk_size: int) -> float:
+        start = time.perf_counter()
+        for offset in range(0, len(data), chunk_size):
+            fn(data.iloc[offset:offset + chunk_size].copy(), offset)
+        elapsed = time.perf_counter() - start
+
+        rate = len(data) / elapsed
+        self.stdout.write(f'{name:<40} {rate:>12,.0f} rows/s ({elapsed:.2f}s)')
+        return rate
+
+    def handle(self, *args, rows: int, chunk_size: int, **options):
+        data = _generate_terms(rows)
+
+        sample = data.iloc[:10000]
+        expected = _prepare_data_rowwise(sample.copy())['iri_text']
+        actual = _prepare_data(sample.copy())['iri_text']
+        if expected.tolist() != actual.tolist():
+            raise AssertionError('The vectorized search text differs from the row by row search text')
+
+        self.stdout.write(f'Preparing {rows:,} terms in chunks of {chunk_size:,}')
+        before = self._measure('search text (row by row)', lambda c, o: _prepare_data_rowwise(c), data, chunk_size)
+        after = self._measure('search text (vectorized)', lambda c, o: _prepare_data(c), data, chunk_size)
+        self.stdout.write(f'{"speedup":<40} {after / before:>12.1f}x')
+
+        before = self._measure('documents (apply + to_dict)', _prepare_payload_rowwise, data, chunk_size)
+        after = self._measure('documents (vectorized + NDJSON)', _prepare_payload, data, chunk_size)
+        self.stdout.write(f'{"speedup":<40} {after / before:>12.1f}x')
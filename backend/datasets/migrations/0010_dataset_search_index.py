@@ -0,0 +1,18 @@
+# Generated by Django 4.1 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datasets', '0009_create_wikidata_dataset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='search_index',
+            field=models.CharField(max_length=255, null=True),
+        ),
+    ]
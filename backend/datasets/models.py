@@ -6,7 +6,7 @@ from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import User
 
-from datasets.services.query import QueryService, LocalQueryService, SPARQLQueryService
+from datasets.services.query import QueryService, LocalQueryService, SPARQLQueryService, CachedQueryService
 from datasets.services.search import LocalSearchService, WikidataSearchService, SearchService, TriplyDBSearchService
 from shared.models import TimeStampMixin
 from shared.paths import DATA_DIR
@@ -64,6 +64,8 @@ class Dataset(TaskMixin, TimeStampMixin, OwnableMixin):
     """The local blazegraph database identifier of the dataset."""
     sparql_endpoint = models.CharField(max_length=255, null=True)
     """The SPARQL endpoint of the dataset."""
+    search_index = models.CharField(max_length=255, null=True)
+    """The live search index of the dataset, if it is not named after its local database."""
 
     statistics = models.JSONField(null=True)
     """The statistics of the dataset."""
@@ -79,10 +81,11 @@ class Dataset(TaskMixin, TimeStampMixin, OwnableMixin):
     @property
     def search_index_name(self) -> str:
         """
-        The path to the search index of the dataset.
+        The name of the live search index of the dataset. It stays the same when the index is rebuilt (rebuilt indexes
+        are swapped in) or when the dataset is loaded into a new database.
         :return:
         """
-        return self.local_database if self.local_database else None
+        return self.search_index or self.local_database or None
 
     def get_search_service(self) -> SearchService:
         """
@@ -102,23 +105,34 @@ class Dataset(TaskMixin, TimeStampMixin, OwnableMixin):
             case _:
                 raise ValueError(f'Unknown search mode {self.search_mode}')
 
-    def get_query_service(self) -> QueryService:
+    def get_query_service(self, cached: bool = True) -> QueryService:
         """
-        If the mode is local, return a local query service, otherwise return a SPARQL query service
+        If the mode is local, return a local query service, otherwise return a SPARQL query service.
+        Unless disabled, the service is wrapped in the result cache, keyed on the dataset version.
         """
         match self.mode:
             case self.Mode.LOCAL:
                 if not self.local_database:
                     raise Exception('Dataset local database has not been imported yet')
-                return LocalQueryService(str(self.local_database))
+                service = LocalQueryService(str(self.local_database))
             case self.Mode.SPARQL:
-                return SPARQLQueryService(str(self.sparql_endpoint))
+                service = SPARQLQueryService(str(self.sparql_endpoint))
             case _:
                 raise ValueError(f'Unknown mode {self.mode}')
 
+        if not cached or not settings.QUERY_CACHE_ENABLE:
+            return service
+
+        updated_at = self.updated_at.timestamp() if self.updated_at else 0
+        version = f'{self.local_database or self.sparql_endpoint}:{updated_at}'
+        return CachedQueryService(service, dataset_id=str(self.id), version=version)
+
     def can_view(self, user: User):
         return bool(user)
 
+    def get_viewer_ids(self):
+        return None
+
     def can_edit(self, user: User):
         return super().can_edit(user) or self.creator == user
 
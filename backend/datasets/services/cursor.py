@@ -0,0 +1,210 @@
+import json
+import time
+from array import array
+from dataclasses import dataclass, field
+from typing import List
+
+from simple_parsing import Serializable
+
+from backend import settings
+from datasets.services.query import QueryService, QueryExecutionException, is_graph_query
+from shared.logging import get_logger
+from shared.paths import CURSOR_DIR
+from shared.random import random_string
+
+logger = get_logger()
+
+
+class CursorNotFound(Exception):
+    pass
+
+
+@dataclass
+class CursorInfo(Serializable):
+    """
+    Metadata of a spilled query result.
+    """
+    cursor: str
+    """The token by which the pages of the result are retrieved."""
+    dataset_id: str
+    """The dataset the query was run against."""
+    vars: List[str] = field(default_factory=list)
+    """The projected variables of the query."""
+    count: int = 0
+    """The number of spilled rows."""
+    truncated: bool = False
+    """Whether the result was cut off at QUERY_CURSOR_MAX_ROWS."""
+    expires_at: float = 0
+    """The unix time after which the cursor is removed."""
+
+
+def _paths(cursor: str):
+    if not cursor.isalnum():
+        raise CursorNotFound(cursor)
+
+    base = CURSOR_DIR / cursor
+    return base.with_suffix('.json'), base.with_suffix('.jsonl'), base.with_suffix('.idx')
+
+
+def _tmp_path(cursor: str):
+    return (CURSOR_DIR / cursor).with_suffix('.tmp')
+
+
+def create_cursor(
+        service: QueryService,
+        dataset_id: str,
+        query: str,
+        timeout: int = None,
+        ttl: int = None,
+        max_rows: int = None,
+) -> CursorInfo:
+    """
+    It runs a SELECT query once and spills its bindings to disk, so that the result can be paged through by cursor
+    without querying the store again. Rows are stored as JSON lines next to an offset index for constant time seeks.
+
+    :param service: The query service of the dataset
+    :param dataset_id: The id of the dataset
+    :param query: The SELECT query
+    :param timeout: The query timeout in milliseconds
+    :param ttl: The number of seconds the cursor stays valid
+    :param max_rows: The maximum number of rows to spill
+    :return: The cursor metadata.
+    """
+    if is_graph_query(query):
+        raise QueryExecutionException('Cursors are only supported for SELECT queries')
+
+    ttl = ttl or settings.QUERY_CURSOR_TTL
+    max_rows = max_rows or settings.QUERY_CURSOR_MAX_ROWS
+
+    clear_expired_cursors()
+    CURSOR_DIR.mkdir(parents=True, exist_ok=True)
+
+    info = CursorInfo(cursor=random_string(24), dataset_id=str(dataset_id))
+    meta_path, rows_path, index_path = _paths(info.cursor)
+
+    offsets = array('Q')
+    try:
+        with rows_path.open('wb') as rows_file:
+            events = service.stream_select(query, None, timeout, ignore_limit=True)
+            for event, value in events:
+                match event:
+                    case 'head':
+                        info.vars = value.get('vars', [])
+                    case 'binding' if len(offsets) < max_rows:
+                        offsets.append(rows_file.tell())
+                        rows_file.write(json.dumps(value).encode('utf-8'))
+                        rows_file.write(b'\n')
+                    case 'binding':
+                        info.truncated = True
+                        events.close()
+                        break
+
+            offsets.append(rows_file.tell())
+
+        with index_path.open('wb') as index_file:
+            offsets.tofile(index_file)
+
+        info.count = len(offsets) - 1
+        info.expires_at = time.time() + ttl
+
+        # The metadata is written last and atomically, a cursor only becomes visible once it is complete
+        tmp_path = _tmp_path(info.cursor)
+        tmp_path.write_text(json.dumps(info.to_dict()))
+        tmp_path.replace(meta_path)
+    except Exception:
+        delete_cursor(info.cursor)
+        raise
+
+    logger.info(f'Spilled {info.count} rows to cursor {info.cursor}')
+    return info
+
+
+def get_cursor(cursor: str) -> CursorInfo:
+    meta_path, _, _ = _paths(cursor)
+    try:
+        info = CursorInfo.from_dict(json.loads(meta_path.read_text()))
+    except FileNotFoundError:
+        raise CursorNotFound(cursor)
+
+    if info.expires_at < time.time():
+        delete_cursor(cursor)
+        raise CursorNotFound(cursor)
+
+    return info
+
+
+def read_page(cursor: str, offset: int = 0, limit: int = 100) -> dict:
+    """
+    It reads a page of rows from a spilled query result
+
+    :param cursor: The cursor token
+    :param offset: The index of the first row of the page
+    :param limit: The maximum number of rows in the page, at most QUERY_CURSOR_MAX_PAGE
+    :return: The page as a SPARQL JSON results document.
+    """
+    info = get_cursor(cursor)
+    _, rows_path, index_path = _paths(cursor)
+
+    offset = max(0, min(offset, info.count))
+    end = min(offset + max(0, min(limit, settings.QUERY_CURSOR_MAX_PAGE)), info.count)
+
+    bindings = []
+    if end > offset:
+        offsets = array('Q')
+        with index_path.open('rb') as index_file:
+            index_file.seek(offset * offsets.itemsize)
+            offsets.fromfile(index_file, end - offset + 1)
+
+        with rows_path.open('rb') as rows_file:
+            rows_file.seek(offsets[0])
+            data = rows_file.read(offsets[-1] - offsets[0])
+        bindings = [json.loads(line) for line in data.splitlines()]
+
+    return {
+        'head': {'vars': info.vars},
+        'results': {'bindings': bindings},
+    }
+
+
+def delete_cursor(cursor: str):
+    for path in [*_paths(cursor), _tmp_path(cursor)]:
+        path.unlink(missing_ok=True)
+
+
+def clear_expired_cursors() -> int:
+    """
+    It removes all the spilled results whose cursor has expired, and the files of cursors whose build was
+    interrupted (they have no metadata) once they are older than QUERY_CURSOR_TTL
+
+    :return: The number of removed cursors.
+    """
+    if not CURSOR_DIR.exists():
+        return 0
+
+    count = 0
+    for meta_path in CURSOR_DIR.glob('*.json'):
+        try:
+            expires_at = json.loads(meta_path.read_text()).get('expires_at', 0)
+        except (OSError, ValueError):
+            expires_at = 0
+
+        if expires_at < time.time():
+            delete_cursor(meta_path.stem)
+            count += 1
+
+    # A cursor that is still being built keeps writing to its rows file, so only stale orphans are removed
+    deadline = time.time() - settings.QUERY_CURSOR_TTL
+    orphans = {
+        path.stem for pattern in ('*.jsonl', '*.idx', '*.tmp') for path in CURSOR_DIR.glob(pattern)
+        if not path.with_suffix('.json').exists()
+    }
+    for cursor in orphans:
+        paths = [path for path in [*_paths(cursor), _tmp_path(cursor)] if path.exists()]
+        try:
+            if all(path.stat().st_mtime < deadline for path in paths):
+                delete_cursor(cursor)
+                count += 1
+        except (FileNotFoundError, CursorNotFound):
+            pass
+
+    return count
@@ -1,18 +1,96 @@
+import json
 import os
 import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import TypedDict, List
+from typing import TypedDict, List, Iterator, Set, Dict
 
 import meilisearch
 import numpy as np
 import pandas as pd
-from meilisearch.errors import MeilisearchApiError
+from meilisearch.index import Index
 
+from backend import settings
 from backend.settings import MEILISEARCH_ENDPOINT
 
 client = meilisearch.Client(MEILISEARCH_ENDPOINT, 'masterKey')
 
 
+class IndexRegistry:
+    """
+    The known indexes and their settings. All index uids are listed at once and kept for `ttl` seconds, and the
+    settings of an index are fetched when they are first needed. Indexes created, deleted or swapped through this
+    module update the registry right away, the TTL only covers changes made by other processes. Index handles are
+    memoized, so a search is a single request.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._uids: Set[str] = set()
+        self._settings: Dict[str, dict] = {}
+        self._handles: Dict[str, Index] = {}
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def index(self, index_name: str) -> Index:
+        handle = self._handles.get(index_name)
+        if handle is None:
+            handle = self._handles.setdefault(index_name, client.index(index_name))
+        return handle
+
+    def has(self, index_name: str) -> bool:
+        with self._lock:
+            if self._expires_at < time.monotonic():
+                self._uids = self._list_uids()
+                self._settings.clear()
+                self._expires_at = time.monotonic() + self.ttl
+            return index_name in self._uids
+
+    def settings(self, index_name: str) -> dict:
+        with self._lock:
+            if index_name not in self._settings:
+                self._settings[index_name] = self.index(index_name).get_settings()
+            return self._settings[index_name]
+
+    def created(self, index_name: str):
+        with self._lock:
+            self._uids.add(index_name)
+            self._settings.pop(index_name, None)
+
+    def deleted(self, index_name: str):
+        with self._lock:
+            self._uids.discard(index_name)
+            self._settings.pop(index_name, None)
+
+    def changed(self, *index_names: str):
+        with self._lock:
+            for index_name in index_names:
+                self._settings.pop(index_name, None)
+
+    def clear(self):
+        with self._lock:
+            self._uids.clear()
+            self._settings.clear()
+            self._expires_at = 0.0
+
+    @staticmethod
+    def _list_uids() -> Set[str]:
+        uids, offset = set(), 0
+        while True:
+            page = client.get_raw_indexes({'limit': 1000, 'offset': offset})
+            uids.update(index['uid'] for index in page['results'])
+            offset += len(page['results'])
+            if not page['results'] or offset >= page.get('total', offset):
+                return uids
+
+
+registry = IndexRegistry(ttl=settings.MEILISEARCH_REGISTRY_TTL)
+"""The indexes known to this process."""
+
+
 class TermPos(Enum):
     SUBJECT = 'SUBJECT'
     PREDICATE = 'PREDICATE'
@@ -57,9 +135,11 @@ def create_terms_index(index_name: str):
             'primaryKey': 'id',
         }
     )
+    registry.created(index_name)
 
-    client.index(index_name).update_settings({
+    registry.index(index_name).update_settings({
         "filterableAttributes": [
+            "iri",
             "rdf_type",
             "pos",
             "is_url",
@@ -75,94 +155,267 @@ def create_terms_index(index_name: str):
     })
 
 
-def index_terms(
-        index_name: str,
-        data: List[TermIndexDocument],
-        batch_size: int = 5000,
-) -> int:
-    index = client.index(index_name)
+class IndexingError(Exception):
+    pass
 
-    for batch in range(0, len(data), batch_size):
-        index.add_documents(data[batch:batch + batch_size])
 
-    return len(data)
+def iter_ndjson_batches(data: bytes, max_bytes: int) -> Iterator[bytes]:
+    """
+    It splits an NDJSON payload at line boundaries into batches of at most max_bytes (unless a single line is larger)
+    """
+    start = 0
+    while start < len(data):
+        end = start + max_bytes
+        if end < len(data):
+            cut = data.rfind(b'\n', start, end)
+            end = cut + 1 if cut >= start else data.find(b'\n', end) + 1 or len(data)
+        yield data[start:end]
+        start = end
 
 
-def _prepare_data(data: pd.DataFrame):
-    data['is_url'] = data.iri.str.startswith('<http')
+def _upload_ndjson(index_name: str, payload: bytes) -> int:
+    return registry.index(index_name).add_documents_ndjson(payload, primary_key='id').task_uid
+
+
+def wait_for_tasks(task_uids: List[int], timeout: float = None, interval: float = 0.5):
+    """
+    It waits until Meilisearch has processed all the given tasks
+
+    :param task_uids: The uids of the enqueued tasks
+    :param timeout: The maximum number of seconds to wait, defaults to MEILISEARCH_TASK_TIMEOUT
+    :param interval: The number of seconds between polls
+    :raises IndexingError: If any of the tasks failed or the tasks did not finish in time.
+    """
+    timeout = timeout if timeout is not None else settings.MEILISEARCH_TASK_TIMEOUT
+    deadline = time.monotonic() + timeout
+    pending = list(task_uids)
+
+    while pending:
+        failed = []
+        for batch in range(0, len(pending), 500):
+            uids = pending[batch:batch + 500]
+            tasks = client.get_tasks({'uids': [str(uid) for uid in uids], 'limit': len(uids)}).results
+            for task in tasks:
+                if task.status in ('succeeded', 'failed', 'canceled'):
+                    pending.remove(task.uid)
+                if task.status != 'succeeded' and task.status not in ('enqueued', 'processing'):
+                    failed.append(f'{task.uid}: {(task.error or {}).get("message", task.status)}')
+
+        if failed:
+            raise IndexingError(f'{len(failed)} indexing tasks failed: {"; ".join(failed[:5])}')
+        if pending and time.monotonic() > deadline:
+            raise IndexingError(f'{len(pending)} indexing tasks did not finish within {timeout} seconds')
+        if pending:
+            time.sleep(interval)
+
 
-    def clean_iri(iri):
-        if not iri.startswith('<http'):
-            return iri
+_SEPARATORS = str.maketrans('-_#', '   ')
+_CAMEL_CASE_RE = re.compile(r'(?<![A-Z])(?=[A-Z])')
 
-        try:
-            path = iri[1:-1].split('/')[-1]
-            path = re.sub(r"([-_#])", " ", path)
-            path = re.sub((r"(?<![A-Z])([A-Z])"), r" \1", path)
 
-            return path
-        except Exception:
-            return iri
+def _iri_search_texts(iris: List[str]) -> List[str]:
+    """
+    It turns IRIs into search text: the last path segment with separators replaced by spaces and camel case split into
+    words. The segments of the whole batch are joined into a single string, so the replacements run once per batch
+    in C rather than once per IRI.
+    """
+    paths = '\n'.join(iri[max(iri.rfind('/'), 0) + 1:-1] for iri in iris)
+    return _CAMEL_CASE_RE.sub(' ', paths.translate(_SEPARATORS)).split('\n')
 
-    data['iri_text'] = data.iri.apply(clean_iri)
+
+def _prepare_data(data: pd.DataFrame):
+    data['is_url'] = data.iri.str.startswith('<http', na=False).astype(bool)
+
+    data['iri_text'] = data.iri
+    if data['is_url'].any():
+        data.loc[data['is_url'], 'iri_text'] = _iri_search_texts(data.iri[data['is_url']].tolist())
 
     return data
 
 
+def _prepare_payload(chunk: pd.DataFrame, start_id: int) -> bytes:
+    chunk['id'] = np.arange(start_id, start_id + len(chunk))
+    chunk = _prepare_data(chunk)
+    # The whole chunk is serialized at once, missing values become null
+    return chunk.to_json(orient='records', lines=True, force_ascii=False).encode('utf-8')
+
 
 def index_terms_from_csv(
         index_name: str,
         csv_path: str,
         start_id: int = 0,
+        wait: bool = True,
 ):
+    """
+    It adds the terms of a terms file to an index. Parsing the CSV, preparing the documents and uploading them overlap:
+    chunks are prepared and serialized to NDJSON by a pool of workers and uploaded in batches of at most
+    MEILISEARCH_BATCH_BYTES. Indexing only counts as done once Meilisearch has processed every uploaded batch.
+
+    :param index_name: The index to add the terms to
+    :param csv_path: The terms file
+    :param start_id: The id of the first document
+    :param wait: Whether to wait until Meilisearch has processed all documents
+    :return: The number of indexed documents.
+    :raises IndexingError: If Meilisearch failed to index any of the batches.
+    """
     COLUMNS = ['iri', 'label', 'count', 'pos', 'rdf_type', 'description']
 
-    row_count = 0
-    for chunk in pd.read_csv(csv_path, chunksize=10 ** 5, names=COLUMNS, on_bad_lines='skip'):
-        chunk['id'] = chunk.index + start_id
-        chunk = chunk.replace({np.nan: None})
-        chunk = _prepare_data(chunk)
+    with open(csv_path, encoding='utf-8') as f:
+        has_header = f.readline().startswith(f'{COLUMNS[0]},{COLUMNS[1]},')
 
-        data = chunk.to_dict(orient='records')
-        row_count += index_terms(index_name, data)
-        start_id += len(data)
+    row_count = 0
+    task_uids = []
+    workers = settings.MEILISEARCH_INDEX_WORKERS
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='meilisearch-index') as executor:
+        prepared, uploads = deque(), deque()
+
+        def drain(limit: int):
+            # Keeps a bounded number of chunks in flight, so memory stays flat for arbitrarily large files
+            while len(prepared) > limit:
+                for batch in iter_ndjson_batches(prepared.popleft().result(), settings.MEILISEARCH_BATCH_BYTES):
+                    uploads.append(executor.submit(_upload_ndjson, index_name, batch))
+            while len(uploads) > limit:
+                task_uids.append(uploads.popleft().result())
+
+        chunks = pd.read_csv(
+            csv_path, chunksize=10 ** 5, names=COLUMNS, header=0 if has_header else None, on_bad_lines='skip',
+        )
+        for chunk in chunks:
+            prepared.append(executor.submit(_prepare_payload, chunk, start_id + row_count))
+            row_count += len(chunk)
+            drain(workers)
+
+        drain(0)
+
+    if wait:
+        wait_for_tasks(task_uids)
 
     return row_count
 
 
-def search_terms(
-        index_name: str,
-        query: str,
+def _search_params(
         pos: TermPos,
         limit: int = 100,
         offset: int = 0,
         is_url: bool = False,
         min_count: int = None,
         max_count: int = None,
-):
-    index = client.index(index_name)
-
+) -> dict:
     filters = "pos = '{}'".format(pos.to_int())
     if is_url:
         filters += " AND is_url = true"
     if min_count is not None:
-        filters += " AND count >= {}".format(min_count)
+        filters += " AND count >= {:d}".format(int(min_count))
     if max_count is not None:
-        filters += " AND count <= {}".format(max_count)
+        filters += " AND count <= {:d}".format(int(max_count))
 
-    return index.search(query, {
+    return {
         "filter": filters,
         "limit": limit,
         "offset": offset,
-    })
+    }
+
+
+def search_terms(
+        index_name: str,
+        query: str,
+        pos: TermPos,
+        limit: int = 100,
+        offset: int = 0,
+        is_url: bool = False,
+        min_count: int = None,
+        max_count: int = None,
+):
+    index = registry.index(index_name)
+    return index.search(query, _search_params(pos, limit, offset, is_url, min_count, max_count))
+
+
+class TermQuery(TypedDict, total=False):
+    query: str
+    pos: TermPos
+    limit: int
+    offset: int
+    is_url: bool
+    min_count: int
+    max_count: int
+
+
+def multi_search_terms(index_name: str, queries: List[TermQuery]) -> List[dict]:
+    """
+    It runs several term searches on an index in a single request
+
+    :param index_name: The index to search
+    :param queries: The searches, with the arguments of `search_terms`
+    :return: The result of every search, in order.
+    """
+    if not queries:
+        return []
+
+    return client.multi_search([
+        {
+            'indexUid': index_name,
+            'q': query.get('query', ''),
+            **_search_params(**{key: value for key, value in query.items() if key != 'query'}),
+        }
+        for query in queries
+    ])['results']
+
+
+def delete_terms(index_name: str, iris: List[str], batch_size: int = 100):
+    """
+    It removes all the documents (in any position) of the given terms from a terms index
+    """
+    index = registry.index(index_name)
+    filterable_attributes = registry.settings(index_name).get('filterableAttributes', [])
+    if 'iri' not in filterable_attributes:
+        # Indexes created before terms could be filtered by iri
+        client.wait_for_task(
+            index.update_filterable_attributes(['iri', *filterable_attributes]).task_uid,
+            timeout_in_ms=60 * 60 * 1000,
+        )
+        registry.changed(index_name)
+
+    for batch in range(0, len(iris), batch_size):
+        values = ', '.join(json.dumps(iri, ensure_ascii=False) for iri in iris[batch:batch + batch_size])
+        index.delete_documents(filter=f'iri IN [{values}]')
+
+
+def shadow_index_name(index_name: str) -> str:
+    return f'{index_name}_shadow'
+
+
+def delete_index(index_name: str, wait: bool = False):
+    if not has_index(index_name):
+        return
+
+    task_uid = registry.index(index_name).delete().task_uid
+    registry.deleted(index_name)
+    if wait:
+        wait_for_tasks([task_uid])
+
+
+def swap_index(index_name: str, shadow_name: str, expected_count: int):
+    """
+    It atomically replaces the documents of an index with those of its (fully indexed) shadow index. Searches keep
+    being served by the old documents until the swap, after which the shadow index holds the old documents and is
+    deleted.
+
+    :param index_name: The live index
+    :param shadow_name: The rebuilt index
+    :param expected_count: The number of documents the rebuilt index should contain
+    :raises IndexingError: If the rebuilt index is incomplete or the swap failed.
+    """
+    document_count = registry.index(shadow_name).get_stats().number_of_documents
+    if document_count != expected_count:
+        raise IndexingError(f'Index {shadow_name} has {document_count} documents, expected {expected_count}')
+
+    wait_for_tasks([client.swap_indexes([{'indexes': [index_name, shadow_name]}]).task_uid])
+    registry.changed(index_name, shadow_name)
+    delete_index(shadow_name)
 
 
 def has_index(index_name: str):
-    try:
-        client.get_index(index_name)
-        return True
-    except MeilisearchApiError:
-        return False
+    return registry.has(index_name)
 
 
 # create_terms_index('test1234')
@@ -0,0 +1,262 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import re
+import shutil
+import tarfile
+import zipfile
+from pathlib import Path
+from typing import List, Optional, BinaryIO
+
+from backend import settings
+from shared.logging import get_logger
+
+logger = get_logger()
+
+BUFFER_SIZE = 1024 * 1024
+BLOCK_SIZE = 16 * 1024 * 1024
+SNIFF_SIZE = 64 * 1024
+
+COMPRESSION_EXTENSIONS = {'.gz', '.gzip', '.bz2', '.xz', '.lzma', '.zip', '.tar', '.tgz', '.tbz2', '.txz'}
+
+FORMAT_EXTENSIONS = {
+    '.nt': 'nt', '.ntriples': 'nt',
+    '.nq': 'nq', '.nquads': 'nq',
+    '.ttl': 'ttl', '.turtle': 'ttl', '.n3': 'ttl',
+    '.rdf': 'rdf', '.owl': 'rdf', '.xml': 'rdf',
+    '.jsonld': 'jsonld', '.json': 'jsonld',
+    '.trig': 'trig',
+}
+"""The RDF serialization of a file by its extension, used when the contents are inconclusive."""
+
+_TERM = r'(?:<[^>]*>|_:\S+|"(?:[^"\\]|\\.)*"(?:@[A-Za-z0-9-]+|\^\^<[^>]*>)?)'
+_STATEMENT_RE = re.compile(rf'^\s*({_TERM}\s*){{3,4}}\.\s*(#.*)?$')
+_QUAD_RE = re.compile(rf'^\s*({_TERM}\s*){{4}}\.\s*(#.*)?$')
+_TURTLE_DIRECTIVE_RE = re.compile(r'^\s*(@prefix|@base|PREFIX|BASE)\b', re.IGNORECASE)
+_TURTLE_SUBJECT_RE = re.compile(r'^\s*(<[^<>\s]*:[^<>\s]*>|_:\S+)\s')
+
+
+class _RawReader(io.RawIOBase):
+    """
+    Adapts any object with a read method (a decompressor or an archive member) to a raw stream, so that it can be
+    buffered and peeked at without consuming the bytes.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.stream.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+def _buffered(stream) -> io.BufferedReader:
+    return io.BufferedReader(_RawReader(stream), buffer_size=BUFFER_SIZE)
+
+
+def sniff_compression(head: bytes) -> Optional[str]:
+    """
+    It detects the compression (or archive) format of a stream by its magic bytes
+
+    :param head: The first bytes of the stream
+    :return: One of gzip, bz2, xz, zip and tar, or None if the stream is not compressed.
+    """
+    if head.startswith(b'\x1f\x8b'):
+        return 'gzip'
+    if head.startswith(b'BZh'):
+        return 'bz2'
+    if head.startswith(b'\xfd7zXZ\x00') or head.startswith(b'\x5d\x00\x00'):
+        return 'xz'
+    if head.startswith(b'PK\x03\x04'):
+        return 'zip'
+    if head[257:262] == b'ustar':
+        return 'tar'
+
+    return None
+
+
+def sniff_format(head: bytes, name: str = '') -> Optional[str]:
+    """
+    It detects the RDF serialization of a stream by its first bytes, falling back on the extension of its name
+
+    :param head: The first bytes of the (decompressed) stream
+    :param name: The name of the file
+    :return: One of nt, nq, ttl, trig, rdf and jsonld, or None if neither the contents nor the name identify RDF.
+    """
+    by_extension = FORMAT_EXTENSIONS.get(Path(name).suffix.lower(), None)
+    text = head.decode('utf-8', errors='ignore').lstrip('\ufeff')
+    stripped = text.lstrip()
+
+    if stripped.startswith('<?xml') or stripped.startswith('<rdf:RDF'):
+        return 'rdf'
+    if stripped.startswith('{') or stripped.startswith('['):
+        return 'jsonld'
+
+    # The last line may be cut off by the sniff window
+    lines = [
+        line for line in text.splitlines()[:-1]
+        if line.strip() and not line.lstrip().startswith('#')
+    ][:100]
+    if not lines:
+        return by_extension
+
+    if any(_TURTLE_DIRECTIVE_RE.match(line) for line in lines):
+        return 'trig' if by_extension == 'trig' else 'ttl'
+
+    if all(_STATEMENT_RE.match(line) for line in lines):
+        return 'nq' if any(_QUAD_RE.match(line) for line in lines) else 'nt'
+
+    # Turtle without directives still starts with a subject (an absolute IRI or a blank node)
+    if by_extension is None and _TURTLE_SUBJECT_RE.match(lines[0]):
+        return 'ttl'
+
+    return by_extension
+
+
+def _base_name(name: str) -> str:
+    name = Path(name).name
+    while True:
+        stem, suffix = os.path.splitext(name)
+        if not suffix or (suffix.lower() not in COMPRESSION_EXTENSIONS and suffix.lower() not in FORMAT_EXTENSIONS):
+            return name or 'data'
+        name = stem
+
+
+class _Normalizer:
+    def __init__(self, output_dir: Path, chunk_size: int):
+        self.output_dir = output_dir
+        self.chunk_size = chunk_size
+        self.files: List[Path] = []
+
+    def _output_path(self, name: str, fmt: str) -> Path:
+        path = self.output_dir / f'{len(self.files):04d}-{_base_name(name)}.{fmt}'
+        self.files.append(path)
+        return path
+
+    def process_file(self, path: Path):
+        with path.open('rb') as f:
+            compression = sniff_compression(f.read(512))
+
+        if compression == 'zip':
+            with zipfile.ZipFile(path) as archive:
+                for member in archive.infolist():
+                    if not member.is_dir():
+                        with archive.open(member) as stream:
+                            self.process_stream(stream, member.filename)
+            return
+
+        if compression is None:
+            with path.open('rb') as f:
+                fmt = sniff_format(f.read(SNIFF_SIZE), path.name)
+            if fmt is None:
+                logger.warning(f'Skipping {path.name}, not an RDF file')
+                return
+            if fmt not in ('nt', 'nq') or path.stat().st_size <= self.chunk_size:
+                self._link(path, fmt)
+                return
+
+        with path.open('rb') as f:
+            self.process_stream(f, path.name)
+
+    def process_stream(self, stream: BinaryIO, name: str):
+        reader = _buffered(stream)
+        compression = sniff_compression(reader.peek(512)[:512])
+
+        match compression:
+            case 'gzip':
+                self.process_stream(gzip.GzipFile(fileobj=reader), name)
+            case 'bz2':
+                self.process_stream(bz2.BZ2File(reader), name)
+            case 'xz':
+                self.process_stream(lzma.LZMAFile(reader), name)
+            case 'tar':
+                with tarfile.open(fileobj=reader, mode='r|') as archive:
+                    for member in archive:
+                        if member.isfile():
+                            self.process_stream(archive.extractfile(member), member.name)
+            case 'zip':
+                raise ValueError(f'Zip archives nested in a compressed stream are not supported ({name})')
+            case _:
+                fmt = sniff_format(reader.peek(SNIFF_SIZE)[:SNIFF_SIZE], name)
+                if fmt is None:
+                    logger.warning(f'Skipping {name}, not an RDF file')
+                    return
+
+                if fmt in ('nt', 'nq'):
+                    self._split_lines(reader, name, fmt)
+                else:
+                    with self._output_path(name, fmt).open('wb') as f:
+                        shutil.copyfileobj(reader, f, BUFFER_SIZE)
+
+    def _link(self, path: Path, fmt: str):
+        # Files which are fine as they are are linked rather than copied
+        output_path = self._output_path(path.name, fmt)
+        try:
+            os.link(path, output_path)
+        except OSError:
+            shutil.copyfile(path, output_path)
+
+    def _split_lines(self, reader: io.BufferedReader, name: str, fmt: str):
+        """
+        It writes a line based (N-Triples or N-Quads) stream into chunks of about `chunk_size` bytes. Chunks are
+        separate documents to the loader, so once a blank node is seen the rest of the stream stays in one chunk to
+        keep blank node labels consistent.
+        """
+        output, written, split = None, 0, True
+        remainder = b''
+        try:
+            while True:
+                block = reader.read(min(BLOCK_SIZE, max(self.chunk_size // 4, 1)))
+                if not block:
+                    break
+
+                block = remainder + block
+                cut = block.rfind(b'\n') + 1
+                block, remainder = block[:cut], block[cut:]
+                if not block:
+                    continue
+
+                split = split and b'_:' not in block
+                if output is None or (split and written >= self.chunk_size):
+                    if output is not None:
+                        output.close()
+                    output, written = self._output_path(name, fmt).open('wb'), 0
+
+                output.write(block)
+                written += len(block)
+
+            if remainder:
+                if output is None:
+                    output = self._output_path(name, fmt).open('wb')
+                output.write(remainder + b'\n')
+        finally:
+            if output is not None:
+                output.close()
+
+
+def normalize_files(files: List[Path], output_dir: Path, chunk_size: int = None) -> List[Path]:
+    """
+    It prepares downloaded or uploaded files for the Blazegraph loader. Compressed files and archives (gzip, bz2, xz,
+    zip and tar, possibly nested) are decompressed while streaming, the RDF serialization of every file is sniffed
+    from its contents and reflected in its extension, and large N-Triples and N-Quads files are split into chunks.
+    Nothing is fully inflated in memory and uncompressed files that are fine as they are are hard linked, not copied.
+
+    :param files: The files to normalize
+    :param output_dir: The directory to write the normalized files to, it must be visible to Blazegraph
+    :param chunk_size: The approximate size of a chunk in bytes, defaults to IMPORT_CHUNK_SIZE
+    :return: The normalized files.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    normalizer = _Normalizer(output_dir, chunk_size or settings.IMPORT_CHUNK_SIZE)
+    for file in files:
+        logger.info(f'Normalizing {file}')
+        normalizer.process_file(Path(file))
+
+    logger.info(f'Normalized {len(files)} files into {len(normalizer.files)} files')
+    return normalizer.files
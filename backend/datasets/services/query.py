@@ -1,68 +1,163 @@
+import asyncio
+import hashlib
 import json
+import os
+import re
+import threading
+import weakref
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import Tuple, Hashable, Iterator, Any, Dict, Optional
 
-from requests import Session
+from requests import Response
 
+from backend import settings
 from backend.settings import BLAZEGRAPH_ENDPOINT
+from datasets.services.streaming import iter_select_events, iter_response_text, iter_response_lines
+from shared.cache import LRUCache
+from shared.http import get_session, follow_redirects
+from shared.logging import get_logger
+
+logger = get_logger()
 
 
 class QueryExecutionException(Exception):
     pass
 
 
+TRUNCATED = 'truncated'
+"""The key that flags a query result which was cut off at the row window. Truncated results are never cached."""
+
+
 class QueryService(ABC):
+    GRAPH_ACCEPT = 'application/n-triples'
+    """The content type requested for graph (CONSTRUCT / DESCRIBE) queries."""
+
     @abstractmethod
-    def query(self, query: str, limit: int = 10, timeout: int = None, **options) -> dict:
+    def stream(self, query: str, limit: int = 10, timeout: int = None, **options) -> Response:
+        """
+        Executes the query and returns the (not yet consumed) streaming http response
+        """
         pass
 
+    def stream_bindings(self, query: str, limit: int = 10, timeout: int = None, **options) -> Iterator[dict]:
+        """
+        Executes a SELECT query and yields the result bindings one row at a time
+        """
+        for event, value in self.stream_select(query, limit, timeout, **options):
+            if event == 'binding':
+                yield value
+
+    def stream_select(self, query: str, limit: int = 10, timeout: int = None, **options) -> Iterator[Tuple[str, Any]]:
+        """
+        Executes a SELECT or ASK query and yields the parts of the result document as they arrive
+        (see `iter_select_events`)
+        """
+        response = self.stream(query, limit, timeout, **options)
+        try:
+            yield from iter_select_events(iter_response_text(response))
+        finally:
+            response.close()
+
+    def stream_triples(self, query: str, limit: int = 10, timeout: int = None, **options) -> Iterator[str]:
+        """
+        Executes a CONSTRUCT or DESCRIBE query and yields the resulting N-Triples lines one at a time
+        """
+        response = self.stream(query, limit, timeout, **options)
+        try:
+            yield from iter_response_lines(response)
+        finally:
+            response.close()
+
+    def query(self, query: str, limit: int = 10, timeout: int = None, window: int = None, **options) -> dict:
+        """
+        Executes the query and returns its serialized result. The result is streamed from the store and at most
+        `window` rows (or triples) are kept in memory, as text; the remainder is discarded and the result is flagged
+        as truncated.
+        """
+        window = window or settings.QUERY_ROW_WINDOW
+
+        if is_graph_query(query):
+            lines = list(islice(self.stream_triples(query, limit, timeout, **options), window + 1))
+            result = {'application/n-triples': '\n'.join(lines[:window])}
+            if len(lines) > window:
+                logger.warning(f'Graph query result truncated to {window} triples')
+                result[TRUNCATED] = True
+            return result
+
+        head, bindings, boolean, truncated = {}, [], None, False
+        response = self.stream(query, limit, timeout, **options)
+        try:
+            for event, value in iter_select_events(iter_response_text(response), raw_bindings=True):
+                match event:
+                    case 'head':
+                        head = value
+                    case 'boolean':
+                        boolean = value
+                    case 'binding' if len(bindings) < window:
+                        bindings.append(value)
+                    case 'binding':
+                        logger.warning(f'Select query result truncated to {window} rows')
+                        truncated = True
+                        break
+        finally:
+            response.close()
+
+        if boolean is not None:
+            data = f'{{"head": {json.dumps(head)}, "boolean": {json.dumps(boolean)}}}'
+        else:
+            data = f'{{"head": {json.dumps(head)}, "results": {{"bindings": [{", ".join(bindings)}]}}}}'
+
+        result = {'application/sparql-results+json': data}
+        if truncated:
+            result[TRUNCATED] = True
+        return result
+
     def query_select(self, query: str, limit: int = 10, timeout: int = None, **options) -> dict:
         data = self.query(query, limit, timeout, **options)
         return json.loads(data['application/sparql-results+json'])
 
+    def query_cached(self, query: str, limit: int = 10, timeout: int = None, **options) -> Tuple[dict, bool]:
+        """
+        Same as query, but additionally returns whether the result was served from the result cache
+        """
+        return self.query(query, limit, timeout, **options), False
+
 
 class LocalQueryService(QueryService):
+    GRAPH_ACCEPT = 'text/plain'
+
     database: str
 
     def __init__(self, database: str):
         self.database = database
 
-    def query(self, query: str, limit: int = 10, timeout: int = None, ignore_limit=False, **options) -> dict:
+    def stream(self, query: str, limit: int = 10, timeout: int = None, ignore_limit=False, **options) -> Response:
         if 'LIMIT' not in query.upper() and not ignore_limit:
             raise QueryExecutionException(f'SPARQL queries must specify a LIMIT')
 
-        accept = 'text/plain' if is_graph_query(query) else 'application/sparql-results+json'
-
-        with Session() as session:
-            endpoint = f'{BLAZEGRAPH_ENDPOINT}/blazegraph/namespace/{self.database}/sparql'
-            response = session.post(
-                endpoint,
-                data={
-                    'query': query,
-                    'timeout': int(timeout / 1000),
-                    'limit': limit,
-                },
-                headers={
-                    'User-Agent': 'https://github.com/EgorDm/BOLD',
-                    'Accept': accept,
-                },
-                timeout=timeout,
-                allow_redirects=False
-            )
-
-            retry_count = 0
-            while response.status_code // 100 == 3 and retry_count < 3:
-                request = response.request
-                request.url = response.headers.get('Location')
-                response = session.send(response.request)
-                retry_count += 1
-
-        if response.status_code != 200:
-            raise QueryExecutionException(f'{response.status_code} {response.reason}\n{response.text}')
+        accept = self.GRAPH_ACCEPT if is_graph_query(query) else 'application/sparql-results+json'
 
-        if accept == 'text/plain':
-            return {'application/n-triples': response.text}
-        else:
-            return {'application/sparql-results+json': response.text}
+        endpoint = f'{BLAZEGRAPH_ENDPOINT}/blazegraph/namespace/{self.database}/sparql'
+        session = get_session(endpoint)
+        response = session.post(
+            endpoint,
+            data={
+                'query': query,
+                'timeout': int(timeout / 1000),
+                'limit': limit,
+            },
+            headers={
+                'Accept': accept,
+            },
+            timeout=timeout,
+            allow_redirects=False,
+            stream=True,
+        )
+        response = follow_redirects(session, response, timeout=timeout, stream=True)
+        return check_response(response)
 
 
 class SPARQLQueryService(QueryService):
@@ -71,43 +166,180 @@ class SPARQLQueryService(QueryService):
     def __init__(self, endpoint: str):
         self.endpoint = endpoint
 
-    def query(self, query: str, limit: int = 10, timeout: int = None, ignore_limit=False, **options) -> dict:
+    def stream(self, query: str, limit: int = 10, timeout: int = None, ignore_limit=False, **options) -> Response:
         if 'LIMIT' not in query.upper() and not ignore_limit:
             raise QueryExecutionException(f'SPARQL queries must specify a LIMIT')
 
-        accept = 'application/n-triples' if is_graph_query(query) else 'application/sparql-results+json'
-
-        with Session() as session:
-            response = session.post(
-                self.endpoint,
-                data=query,
-                params={
-                    'limit': limit,
-                    'timeout': timeout,
-                },
-                headers={
-                    'User-Agent': 'https://github.com/EgorDm/BOLD',
-                    'Content-Type': 'application/sparql-query',
-                    'Accept': accept,
-                },
-                timeout=timeout,
-                allow_redirects=False
-            )
-
-            retry_count = 0
-            while response.status_code // 100 == 3 and retry_count < 3:
-                request = response.request
-                request.url = response.headers.get('Location')
-                response = session.send(response.request)
-                retry_count += 1
-
-        if response.status_code != 200:
+        accept = self.GRAPH_ACCEPT if is_graph_query(query) else 'application/sparql-results+json'
+
+        session = get_session(self.endpoint)
+        response = session.post(
+            self.endpoint,
+            data=query,
+            params={
+                'limit': limit,
+                'timeout': timeout,
+            },
+            headers={
+                'Content-Type': 'application/sparql-query',
+                'Accept': accept,
+            },
+            timeout=timeout,
+            allow_redirects=False,
+            stream=True,
+        )
+        response = follow_redirects(session, response, timeout=timeout, stream=True)
+        return check_response(response)
+
+
+def check_response(response: Response) -> Response:
+    if response.status_code != 200:
+        try:
             raise QueryExecutionException(f'{response.status_code} {response.reason}\n{response.text}')
+        finally:
+            response.close()
 
-        if accept == 'application/n-triples':
-            return {'application/n-triples': response.text}
-        else:
-            return {'application/sparql-results+json': response.text}
+    return response
+
+
+class CachedQueryService(QueryService):
+    """
+    Wraps a query service with a content-addressed result cache. Results are keyed on the dataset version,
+    the normalized query text, the limit and the accept type.
+    """
+    service: QueryService
+    dataset_id: str
+    version: str
+
+    def __init__(self, service: QueryService, dataset_id: str, version: str = ''):
+        self.service = service
+        self.dataset_id = dataset_id
+        self.version = version
+
+    def stream(self, query: str, limit: int = 10, timeout: int = None, **options) -> Response:
+        return self.service.stream(query, limit, timeout, **options)
+
+    def query(self, query: str, limit: int = 10, timeout: int = None, **options) -> dict:
+        return self.query_cached(query, limit, timeout, **options)[0]
+
+    def query_cached(self, query: str, limit: int = 10, timeout: int = None, **options) -> Tuple[dict, bool]:
+        key = self.cache_key(query, limit, **options)
+        result = query_cache.get(key)
+        if result is not None:
+            return result, True
+
+        result = self.service.query(query, limit, timeout, **options)
+        # A truncated result would look complete to the next client
+        if not result.get(TRUNCATED, False):
+            query_cache.set(key, result, tag=self.dataset_id)
+        return result, False
+
+    def cache_key(
+            self,
+            query: str,
+            limit: int = 10,
+            ignore_limit: bool = False,
+            window: int = None,
+            **options
+    ) -> Hashable:
+        accept = 'graph' if is_graph_query(query) else 'select'
+        digest = hashlib.sha256(normalize_query(query).encode('utf-8')).hexdigest()
+        return self.dataset_id, self.version, digest, limit, bool(ignore_limit), window, accept
+
+
+class AsyncQueryService:
+    """
+    Asyncio interface to a query service. Queries are run on a shared worker pool over the pooled keep-alive
+    sessions, and at most `QUERY_CONCURRENCY` queries per dataset run at the same time within an event loop. The
+    slot is awaited before a query is handed to the pool, so queries waiting on a busy dataset do not occupy workers.
+    Cancelling the awaiting task does not stop a query that is already running; queries that did not start yet are
+    skipped once the `cancelled` event is set.
+    """
+    service: QueryService
+    key: str
+    cancelled: Optional[threading.Event]
+
+    def __init__(self, service: QueryService, key: str, cancelled: threading.Event = None):
+        self.service = service
+        self.key = key
+        self.cancelled = cancelled
+
+    async def query(self, query: str, limit: int = 10, timeout: int = None, **options) -> dict:
+        return (await self.query_cached(query, limit, timeout, **options))[0]
+
+    async def query_cached(self, query: str, limit: int = 10, timeout: int = None, **options) -> Tuple[dict, bool]:
+        return await self._run(self.service.query_cached, query, limit, timeout, **options)
+
+    async def query_select(self, query: str, limit: int = 10, timeout: int = None, **options) -> dict:
+        return await self._run(self.service.query_select, query, limit, timeout, **options)
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        async with _get_dataset_slots(self.key):
+            if self.cancelled is not None and self.cancelled.is_set():
+                raise QueryExecutionException('Query was cancelled')
+            return await loop.run_in_executor(_get_executor(), partial(fn, *args, **kwargs))
+
+
+_executor: Optional[Tuple[int, ThreadPoolExecutor]] = None
+_dataset_slots = weakref.WeakKeyDictionary()
+_async_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _async_lock:
+        # The pool is recreated after a fork, since threads are not inherited by the child process
+        if _executor is None or _executor[0] != os.getpid():
+            _executor = (os.getpid(), ThreadPoolExecutor(
+                max_workers=settings.QUERY_ASYNC_WORKERS,
+                thread_name_prefix='query',
+            ))
+        return _executor[1]
+
+
+def _get_dataset_slots(key: str) -> asyncio.Semaphore:
+    # Asyncio primitives are bound to the loop they are used in, and every run (asyncio.run) has its own loop
+    loop = asyncio.get_running_loop()
+    with _async_lock:
+        slots = _dataset_slots.setdefault(loop, {})
+        if key not in slots:
+            slots[key] = asyncio.Semaphore(settings.QUERY_CONCURRENCY)
+        return slots[key]
+
+
+def _result_size(result: dict) -> int:
+    return sum(len(value) for value in result.values() if isinstance(value, str))
+
+
+query_cache = LRUCache(
+    max_entries=settings.QUERY_CACHE_MAX_ENTRIES,
+    max_bytes=settings.QUERY_CACHE_MAX_BYTES,
+    ttl=settings.QUERY_CACHE_TTL,
+    size_fn=_result_size,
+)
+"""The process-wide SPARQL result cache."""
+
+
+def invalidate_query_cache(dataset_id) -> int:
+    """
+    It removes all the cached query results of the given dataset
+
+    :param dataset_id: The id of the dataset
+    :return: The number of removed results.
+    """
+    return query_cache.invalidate(str(dataset_id))
+
+
+QUERY_TOKEN_PATTERN = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|<[^<>\s]*>)|(?:\s|#[^\n]*)+')
+
+
+def normalize_query(query: str) -> str:
+    """
+    It strips comments and collapses insignificant whitespace in a query while leaving string literals and IRIs
+    untouched. A comment runs until the end of its line, so it is stripped rather than collapsed into the next line.
+    """
+    return QUERY_TOKEN_PATTERN.sub(lambda m: m.group(1) or ' ', query).strip()
 
 
 def is_graph_query(query: str) -> bool:
@@ -1,20 +1,31 @@
 import json
+import os
 import re
+import threading
+import time
 from abc import ABC, abstractmethod
-from collections import defaultdict, deque
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from enum import IntEnum, Enum
 from pathlib import Path
-from typing import List, Optional, Union, Any
+from typing import List, Optional, Union, Any, Tuple
 from rest_framework.serializers import ValidationError
-from fuzzywuzzy import fuzz
+from rapidfuzz import fuzz, process
 
+import numpy as np
 import requests
 from simple_parsing import Serializable
 
+from backend import settings
+from shared.cache import LRUCache, TieredCache
+from shared.http import get_session
+from shared.logging import get_logger
 from datasets.services import meilisearch
 from datasets.services.meilisearch import TermPos, TermIndexDocument
 
+logger = get_logger()
+
 
 @dataclass
 class TermDocument(Serializable):
@@ -30,11 +41,12 @@ class TermDocument(Serializable):
     range: Optional[str] = None
 
     def searchable_text(self):
+        # The description goes last, since long descriptions are cut off when hits are scored
         return ' '.join([
-            self.search_text,
+            self.search_text or '',
             self.label or '',
-            self.description or '',
             self.value or '',
+            self.description or '',
         ])
 
 
@@ -50,13 +62,43 @@ class SearchResult(Serializable):
     hits: List[SearchHit | dict] = field(default_factory=list)
     agg: dict = field(default_factory=dict)
     error: Optional[str] = None
+    partial: bool = False
+    """Whether some of the searched services did not respond in time."""
+
+
+@dataclass
+class SearchQuery:
+    query: str
+    pos: TermPos
+    limit: int = 10
+    offset: int = 0
+    options: dict = field(default_factory=dict)
+    """The filters of the search (url, min_count and max_count)."""
+
+    def cache_key(self) -> str:
+        return f'{self.pos.value}:{self.limit}:{self.offset}:{json.dumps(self.options, sort_keys=True)}:{self.query}'
 
 
 class SearchService(ABC):
+    batched = False
+    """Whether the service runs several searches at once, rather than one search at a time."""
+
     @abstractmethod
     def search(self, query, pos: TermPos, limit: int = 100, offset: int = 0, timeout=5000, **options) -> SearchResult:
         pass
 
+    def search_many(self, queries: List[SearchQuery], timeout=5000) -> List[SearchResult]:
+        return [
+            self.search(query.query, query.pos, query.limit, query.offset, timeout, **query.options)
+            for query in queries
+        ]
+
+    def accepts(self, query: SearchQuery) -> bool:
+        """
+        Whether the service takes part in the given search
+        """
+        return True
+
 
 def parse_int_or_none(value: str) -> int:
     if value is None:
@@ -66,6 +108,7 @@ def parse_int_or_none(value: str) -> int:
 
 class LocalSearchService(SearchService):
     index_name: str
+    batched = True
 
     def __init__(self, index_name: str):
         self.index_name = index_name
@@ -91,6 +134,25 @@ class LocalSearchService(SearchService):
             max_count=max_count,
         )
 
+        return self._parse_result(results)
+
+    def search_many(self, queries: List[SearchQuery], timeout=5000) -> List[SearchResult]:
+        results = meilisearch.multi_search_terms(self.index_name, [
+            meilisearch.TermQuery(
+                query=query.query,
+                pos=query.pos,
+                limit=query.limit,
+                offset=query.offset,
+                is_url=query.options.get('url', None),
+                min_count=query.options.get('min_count', None),
+                max_count=query.options.get('max_count', None),
+            )
+            for query in queries
+        ])
+
+        return [self._parse_result(result) for result in results]
+
+    def _parse_result(self, results: dict) -> SearchResult:
         return SearchResult(
             count=results['estimatedTotalHits'],
             hits=[
@@ -104,24 +166,30 @@ class LocalSearchService(SearchService):
         )
 
     def _parse_doc(self, doc: TermIndexDocument) -> TermDocument:
-
-        type = 'uri' if 'http' in doc['iri'] else 'literal'
-
-        iri, lang = doc['iri'], None
-        if type == 'literal' and re.match(r'^.*@[a-z]*$', doc['iri']):
-            iri, lang = doc['iri'].rsplit('@', 1)
-
-        return TermDocument(
-            type=type,
-            value=doc['iri'].removeprefix('<').removesuffix('>'),
-            lang=lang,
-            pos=TermPos.from_int(doc['pos'] or 0),
-            rdf_type=doc.get('rdf_type', None),
-            label=doc.get('label', None),
-            count=doc.get('count', 0),
-            search_text=doc['iri_text'],
-            description=doc['description'],
-        )
+        return parse_term_document(doc)
+
+
+def parse_term_document(doc: TermIndexDocument) -> TermDocument:
+    """
+    It converts a document of a terms index to a term document
+    """
+    type = 'uri' if 'http' in doc['iri'] else 'literal'
+
+    iri, lang = doc['iri'], None
+    if type == 'literal' and re.match(r'^.*@[a-z]*$', doc['iri']):
+        iri, lang = doc['iri'].rsplit('@', 1)
+
+    return TermDocument(
+        type=type,
+        value=doc['iri'].removeprefix('<').removesuffix('>'),
+        lang=lang,
+        pos=TermPos.from_int(doc['pos'] or 0),
+        rdf_type=doc.get('rdf_type', None),
+        label=doc.get('label', None),
+        count=doc.get('count', 0),
+        search_text=doc['iri_text'],
+        description=doc['description'],
+    )
 
 
 class WikidataSearchService(SearchService):
@@ -144,7 +212,7 @@ class WikidataSearchService(SearchService):
                 'limit': limit,
                 'continue': offset,
             },
-            timeout=timeout,
+            timeout=timeout / 1000,
             headers={
                 'User-Agent': 'https://github.com/EgorDm/BOLD',
             }
@@ -193,23 +261,19 @@ class TriplyDBSearchService(SearchService):
         if not endpoint:
             raise ValidationError('Search endpoint is not reachable')
 
-        query = self.build_query(query, pos, limit, offset)
-        response = requests.post(
-            endpoint,
-            data=json.dumps(query),
-            timeout=timeout,
-            headers={
-                'User-Agent': 'https://github.com/EgorDm/BOLD',
-                'Content-Type': 'application/json',
-                'Accept': 'application/json',
-            },
-        )
+        body = json.dumps(self.build_query(query, pos, limit, offset))
+        response = self._post(endpoint, body, timeout)
+        if response.status_code == 404:
+            # The search service was moved or recreated, the cached endpoint is stale
+            _endpoint_cache.delete(self.namespace)
+            fresh_endpoint = self.get_endpoint()
+            if fresh_endpoint and fresh_endpoint != endpoint:
+                response = self._post(fresh_endpoint, body, timeout)
 
         if response.status_code != 200:
             return SearchResult(error=response.text)
 
         result_data = response.json()
-        print(result_data)
         return SearchResult(
             count=result_data['hits']['total']['value'],
             hits=[
@@ -265,9 +329,57 @@ class TriplyDBSearchService(SearchService):
 
         return base_query
 
-    def get_endpoint(self):
-        response = requests.get(
-            f'https://api.triplydb.com/datasets/{self.namespace}/services/',
+    def _post(self, endpoint: str, body: str, timeout) -> requests.Response:
+        return get_session(endpoint).post(
+            endpoint,
+            data=body,
+            timeout=timeout / 1000,
+            headers={
+                'User-Agent': 'https://github.com/EgorDm/BOLD',
+                'Content-Type': 'application/json',
+                'Accept': 'application/json',
+            },
+        )
+
+    def get_endpoint(self) -> Optional[str]:
+        """
+        It returns the Elasticsearch endpoint of the dataset. Endpoints (and their absence) are cached per namespace,
+        and a cached endpoint that is due for a refresh is still used while it is rediscovered in the background.
+        """
+        now = time.monotonic()
+        entry = _endpoint_cache.get(self.namespace)
+        if entry is None:
+            return self._discover_endpoint().url
+
+        if entry.refresh_at < now:
+            with _endpoint_lock:
+                refresh = self.namespace not in _endpoint_refreshes
+                _endpoint_refreshes.add(self.namespace)
+            if refresh:
+                _get_executor().submit(self._refresh_endpoint)
+
+        return entry.url
+
+    def _refresh_endpoint(self):
+        try:
+            self._discover_endpoint()
+        except requests.RequestException as e:
+            logger.warning(f'Could not refresh the search endpoint of {self.namespace}: {e}')
+        finally:
+            with _endpoint_lock:
+                _endpoint_refreshes.discard(self.namespace)
+
+    def _discover_endpoint(self) -> '_Endpoint':
+        url = self.fetch_endpoint()
+        ttl = settings.TRIPLYDB_ENDPOINT_TTL if url else settings.TRIPLYDB_ENDPOINT_NEGATIVE_TTL
+        entry = _Endpoint(url=url, refresh_at=time.monotonic() + min(settings.TRIPLYDB_ENDPOINT_REFRESH, ttl))
+        _endpoint_cache.set(self.namespace, entry, ttl=ttl)
+        return entry
+
+    def fetch_endpoint(self) -> Optional[str]:
+        url = f'https://api.triplydb.com/datasets/{self.namespace}/services/'
+        response = get_session(url).get(
+            url,
             timeout=5,
             headers={
                 'User-Agent': 'https://github.com/EgorDm/BOLD',
@@ -308,6 +420,18 @@ class TriplyDBSearchService(SearchService):
         )
 
 
+@dataclass
+class _Endpoint:
+    url: Optional[str]
+    refresh_at: float
+
+
+_endpoint_cache = LRUCache(max_entries=1024, ttl=settings.TRIPLYDB_ENDPOINT_TTL)
+"""The discovered search endpoint (or None) per TriplyDB namespace."""
+_endpoint_refreshes = set()
+_endpoint_lock = threading.Lock()
+
+
 def first_or_self(item: Union[List[Any], Any]):
     if isinstance(item, list):
         return item[0]
@@ -315,33 +439,180 @@ def first_or_self(item: Union[List[Any], Any]):
     return item
 
 
+SCORE_TEXT_LENGTH = 96
+"""The number of characters of the searchable text of a hit that are scored, scoring time grows with the length."""
+
+
+def score_hits(hits: List[SearchHit], query: str) -> np.ndarray:
+    """
+    It scores all hits against the query in a single vectorized call (the partial ratio of their searchable text).
+    Hits with the same text, like a term found by several services, are scored once.
+
+    :return: The score (0 to 100) per hit.
+    """
+    if not hits or not query:
+        return np.zeros(len(hits), dtype=np.float32)
+
+    texts = {}
+    positions = [texts.setdefault(hit.document.searchable_text()[:SCORE_TEXT_LENGTH], len(texts)) for hit in hits]
+    scores = process.cdist([query], list(texts), scorer=fuzz.partial_ratio, dtype=np.float32)[0]
+    return scores[positions]
+
+
 def merge_results(
-    a: SearchResult,
-    b: SearchResult,
+    results: List[SearchResult],
     query: str,
 ) -> SearchResult:
-    score_fn = lambda x: fuzz.partial_ratio(x.document.searchable_text(), query)
-    a_hits = deque((score_fn(hit), hit) for hit in a.hits)
-    b_hits = deque((score_fn(hit), hit) for hit in b.hits)
-
+    """
+    It merges the hits of any number of search results by how well they match the query. The hits of all results are
+    scored at once, every result is ordered by score and the ordered results are merged, keeping only the best hit per
+    term (IRI or literal value). Equally scored hits are interleaved by their rank within their result.
+
+    :param results: The results to merge
+    :param query: The search query
+    :return: The merged result.
+    """
+    all_hits = [hit for result in results for hit in result.hits]
+    scores = score_hits(all_hits, query)
+
+    # The rank of every hit within its own result once that result is ordered by score. Equally scored hits keep the
+    # order in which their service ranked them (a stable sort).
+    lengths = [len(result.hits) for result in results]
+    sources = np.repeat(np.arange(len(results)), lengths)
+    ranks = np.empty(len(all_hits), dtype=np.int64)
+    for start, end in zip(np.cumsum([0] + lengths[:-1]), np.cumsum(lengths)):
+        ranks[start + np.argsort(-scores[start:end], kind='stable')] = np.arange(end - start)
+
+    # Merges the ordered results at once: by score, then by rank and then by the order of the results
     seen = set()
     hits = []
-    while a_hits and b_hits:
-        if a_hits[0][0] > b_hits[0][0]:
-            item = a_hits.popleft()[1]
-        else:
-            item = b_hits.popleft()[1]
-
-        if item.document.value not in seen:
-            hits.append(item)
-            seen.add(item.document.value)
-
-    for (_, item) in a_hits + b_hits:
-        if item.document.value not in seen:
-            hits.append(item)
-            seen.add(item.document.value)
+    for i in np.lexsort((sources, ranks, -scores)).tolist():
+        hit = all_hits[i]
+        if hit.document.value not in seen:
+            hits.append(hit)
+            seen.add(hit.document.value)
 
     return SearchResult(
         count=len(hits),
         hits=hits,
+        partial=any(result.partial for result in results),
     )
+
+
+def _result_size(result: dict) -> int:
+    return len(json.dumps(result))
+
+
+search_cache = TieredCache(
+    prefix='search',
+    alias='search',
+    max_entries=settings.SEARCH_CACHE_MAX_ENTRIES,
+    max_bytes=settings.SEARCH_CACHE_MAX_BYTES,
+    ttl=settings.SEARCH_CACHE_TTL,
+    shared_ttl=settings.SEARCH_CACHE_SHARED_TTL,
+    generation_ttl=settings.SEARCH_CACHE_GENERATION_TTL,
+    size_fn=_result_size,
+)
+"""The term search result cache, namespaced per dataset."""
+
+
+def invalidate_search_cache(dataset_id):
+    """
+    It invalidates all the cached search results of the given dataset (in every process)
+
+    :param dataset_id: The id of the dataset
+    """
+    search_cache.invalidate(str(dataset_id))
+
+_executor: Optional[Tuple[int, ThreadPoolExecutor]] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        # The pool is recreated after a fork, since threads are not inherited by the child process
+        if _executor is None or _executor[0] != os.getpid():
+            _executor = (os.getpid(), ThreadPoolExecutor(
+                max_workers=settings.SEARCH_WORKERS,
+                thread_name_prefix='search',
+            ))
+        return _executor[1]
+
+
+def federated_search_many(
+        services: List[SearchService],
+        queries: List[SearchQuery],
+        timeout=5000,
+) -> List[SearchResult]:
+    """
+    It runs several searches on all services at once under a shared deadline, so the slowest service rather than the
+    sum of all services bounds the latency. Services that batch searches get all searches in a single call, the other
+    services get a call per search. The hits of the services are merged per search. Services that fail or miss the
+    deadline are left out and the results are flagged as partial, rather than failing the whole search.
+
+    :param services: The services to search
+    :param queries: The searches
+    :param timeout: The deadline of all searches in milliseconds
+    :return: The result of every search, in order.
+    """
+    deadline = time.monotonic() + timeout / 1000
+    executor = _get_executor()
+
+    # Every call yields the results of some of the searches of a service
+    calls = []
+    for s, service in enumerate(services):
+        accepted = [q for q, query in enumerate(queries) if service.accepts(query)]
+        if service.batched and accepted:
+            future = executor.submit(service.search_many, [queries[q] for q in accepted], timeout)
+            calls.append((s, accepted, future))
+        else:
+            for q in accepted:
+                query = queries[q]
+                future = executor.submit(
+                    service.search, query.query, query.pos, query.limit, query.offset, timeout, **query.options
+                )
+                calls.append((s, [q], future))
+
+    results: List[List[Optional[SearchResult]]] = [[] for _ in queries]
+    partial = [False] * len(queries)
+    for s, accepted, future in calls:
+        try:
+            found = future.result(timeout=max(deadline - time.monotonic(), 0))
+            found = found if isinstance(found, list) else [found]
+        except (TimeoutError, requests.Timeout):
+            future.cancel()
+            logger.warning(f'Search of {type(services[s]).__name__} missed the deadline')
+            found = [None] * len(accepted)
+        except Exception as e:
+            # A failing service (unreachable, an error response) only drops its own hits
+            logger.exception(f'Search of {type(services[s]).__name__} failed: {e}')
+            found = [None] * len(accepted)
+
+        for q, result in zip(accepted, found):
+            if result is None:
+                partial[q] = True
+            else:
+                results[q].append(result)
+
+    merged = []
+    for query, completed, is_partial in zip(queries, results, partial):
+        result = merge_results(completed, query.query) if len(completed) > 1 else \
+            (completed[0] if completed else SearchResult())
+        result.partial = is_partial
+        merged.append(result)
+
+    return merged
+
+
+def federated_search(
+        services: List[SearchService],
+        query, pos: TermPos,
+        limit: int = 100, offset: int = 0,
+        timeout=5000,
+        **options
+) -> SearchResult:
+    """
+    It searches the services concurrently and merges their hits (see `federated_search_many`)
+    """
+    return federated_search_many(services, [SearchQuery(query, pos, limit, offset, options)], timeout)[0]
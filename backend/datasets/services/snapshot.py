@@ -0,0 +1,165 @@
+import gzip
+import hashlib
+import json
+import re
+import shutil
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Iterator, Set, Tuple, Union
+from uuid import UUID
+
+from simple_parsing import Serializable
+
+from backend import settings
+from shared.logging import get_logger
+from shared.paths import SNAPSHOT_DIR
+
+logger = get_logger()
+
+TERM_RE = re.compile(r'<[^>]*>|_:\S+|"(?:[^"\\]|\\.)*"(?:@[A-Za-z0-9-]+|\^\^<[^>]*>)?')
+"""A single N-Triples term: an IRI, a blank node or a literal."""
+
+
+@dataclass
+class Snapshot(Serializable):
+    """
+    The manifest of an imported dataset snapshot. The triples of the dataset are partitioned into buckets by the hash
+    of their N-Triples line, and every bucket is stored sorted next to the hash of its contents.
+    """
+    buckets: List[str] = field(default_factory=list)
+    """The content hash of every bucket (empty for an empty bucket)."""
+    triple_count: int = 0
+    """The number of distinct triples in the snapshot."""
+    next_term_id: int = 0
+    """The id of the next document added to the search index of the dataset."""
+
+
+def snapshot_dir(dataset_id: Union[UUID, str]) -> Path:
+    return SNAPSHOT_DIR / str(UUID(str(dataset_id)))
+
+
+def _bucket_path(path: Path, bucket: int) -> Path:
+    return path / f'{bucket:05d}.nt.gz'
+
+
+def _iter_lines(files: List[Path]) -> Iterator[bytes]:
+    for file in files:
+        with file.open('rb') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith(b'#'):
+                    yield line
+
+
+def build_snapshot(files: List[Path], path: Path, buckets: int = None) -> Optional[Snapshot]:
+    """
+    It partitions the triples of the (normalized) files into hashed buckets. Snapshots can only be taken of N-Triples
+    files without blank nodes, since only then a triple is identified by its line.
+
+    :param files: The normalized files of the dataset
+    :param path: The directory to write the snapshot to
+    :param buckets: The number of buckets, defaults to REFRESH_BUCKETS
+    :return: The snapshot manifest, or None if the files can't be snapshotted.
+    """
+    buckets = buckets or settings.REFRESH_BUCKETS
+    if any(file.suffix != '.nt' for file in files):
+        logger.info('Not taking a snapshot, not all files are N-Triples')
+        return None
+
+    shutil.rmtree(path, ignore_errors=True)
+    path.mkdir(parents=True)
+
+    writers = {}
+    try:
+        for line in _iter_lines(files):
+            if b'_:' in line:
+                logger.info('Not taking a snapshot, the dataset contains blank nodes')
+                shutil.rmtree(path, ignore_errors=True)
+                return None
+
+            bucket = zlib.crc32(line) % buckets
+            writer = writers.get(bucket)
+            if writer is None:
+                writer = writers[bucket] = gzip.open(_bucket_path(path, bucket), 'wb', compresslevel=1)
+            writer.write(line + b'\n')
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    # Buckets are sorted and deduplicated one at a time, so only a single bucket is ever held in memory
+    snapshot = Snapshot(buckets=[''] * buckets)
+    for bucket in writers:
+        lines = sorted(load_bucket(path, bucket))
+        data = b'\n'.join(lines) + b'\n'
+        with gzip.open(_bucket_path(path, bucket), 'wb', compresslevel=1) as f:
+            f.write(data)
+        snapshot.buckets[bucket] = hashlib.sha1(data).hexdigest()
+        snapshot.triple_count += len(lines)
+
+    save_snapshot(path, snapshot)
+    logger.info(f'Took a snapshot of {snapshot.triple_count} triples in {len(writers)} buckets')
+    return snapshot
+
+
+def load_bucket(path: Path, bucket: int) -> Set[bytes]:
+    bucket_path = _bucket_path(path, bucket)
+    if not bucket_path.exists():
+        return set()
+
+    with gzip.open(bucket_path, 'rb') as f:
+        return {line for line in f.read().split(b'\n') if line}
+
+
+def load_snapshot(path: Path) -> Optional[Snapshot]:
+    try:
+        return Snapshot.from_dict(json.loads((path / 'manifest.json').read_text()))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save_snapshot(path: Path, snapshot: Snapshot):
+    tmp_path = path / 'manifest.tmp'
+    tmp_path.write_text(json.dumps(snapshot.to_dict()))
+    tmp_path.replace(path / 'manifest.json')
+
+
+def replace_snapshot(path: Path, new_path: Path):
+    """
+    It replaces the snapshot at path with the one at new_path
+    """
+    old_path = path.with_name(f'{path.name}.old')
+    shutil.rmtree(old_path, ignore_errors=True)
+    if path.exists():
+        path.rename(old_path)
+    new_path.rename(path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def diff_snapshots(
+        old_path: Path,
+        old: Snapshot,
+        new_path: Path,
+        new: Snapshot,
+) -> Iterator[Tuple[Set[bytes], Set[bytes]]]:
+    """
+    It compares two snapshots bucket by bucket. Only buckets whose content hash changed are loaded.
+
+    :return: An iterator of (deleted triples, inserted triples) per changed bucket.
+    """
+    if len(old.buckets) != len(new.buckets):
+        raise ValueError('Snapshots with a different number of buckets can not be compared')
+
+    for bucket, (old_hash, new_hash) in enumerate(zip(old.buckets, new.buckets)):
+        if old_hash == new_hash:
+            continue
+
+        old_lines, new_lines = load_bucket(old_path, bucket), load_bucket(new_path, bucket)
+        yield old_lines - new_lines, new_lines - old_lines
+
+
+def triple_terms(line: bytes) -> List[str]:
+    """
+    It returns the subject, predicate and object of an N-Triples line
+    """
+    return TERM_RE.findall(line.decode('utf-8', errors='replace'))[:3]
@@ -0,0 +1,174 @@
+import json
+from typing import Iterator, Tuple, Any, Optional
+
+from requests import Response
+
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+
+
+class JSONStreamReader:
+    """
+    A minimal incremental JSON reader. It walks the structure of a document token by token and only materializes the
+    values that are explicitly read, so that large arrays can be consumed one element at a time.
+    """
+
+    def __init__(self, chunks: Iterator[str]):
+        self.chunks = chunks
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+
+        for chunk in self.chunks:
+            if not chunk:
+                continue
+            self.buffer = self.buffer[self.pos:] + chunk
+            self.pos = 0
+            return True
+
+        self.eof = True
+        return False
+
+    def peek(self) -> Optional[str]:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return None
+
+    def expect(self, token: str):
+        char = self.peek()
+        if char != token:
+            raise ValueError(f'Expected {token!r} but found {char!r} in JSON stream')
+        self.pos += 1
+
+    def read_value(self, raw: bool = False) -> Any:
+        """
+        It reads the value at the current position
+
+        :param raw: Whether to return the JSON text of the value instead of the decoded value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self._fill():
+                continue
+
+            if raw:
+                value = self.buffer[self.pos:end]
+            self.pos = end
+            return value
+
+    def read_key(self) -> str:
+        key = self.read_value()
+        self.expect(':')
+        return key
+
+    def iter_object(self) -> Iterator[str]:
+        """
+        Yields the keys of the object at the current position. The caller must consume the value of each key.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            yield self.read_key()
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError(f'Unexpected {char!r} in JSON object stream')
+
+    def iter_array(self, raw: bool = False) -> Iterator[Any]:
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.read_value(raw)
+            char = self.peek()
+            self.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError(f'Unexpected {char!r} in JSON array stream')
+
+
+def iter_select_events(chunks: Iterator[str], raw_bindings: bool = False) -> Iterator[Tuple[str, Any]]:
+    """
+    It incrementally parses a SPARQL JSON results document and yields its parts as (event, value) tuples.
+    Events are `head`, `binding` (once per result row) and `boolean` (for ASK queries).
+
+    :param chunks: The decoded text chunks of the document
+    :type chunks: Iterator[str]
+    :param raw_bindings: Whether to yield the JSON text of the bindings rather than the decoded bindings
+    """
+    reader = JSONStreamReader(chunks)
+    for key in reader.iter_object():
+        if key == 'results':
+            for results_key in reader.iter_object():
+                if results_key == 'bindings':
+                    for binding in reader.iter_array(raw_bindings):
+                        yield 'binding', binding
+                else:
+                    reader.read_value()
+        elif key in ('head', 'boolean'):
+            yield key, reader.read_value()
+        else:
+            reader.read_value()
+
+
+def iter_response_text(response: Response, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    It yields the decoded body of a streamed response in chunks
+    """
+    response.encoding = response.encoding or 'utf-8'
+    return response.iter_content(chunk_size=chunk_size, decode_unicode=True)
+
+
+def iter_response_lines(response: Response, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    It yields the non-empty lines of a streamed response (for example N-Triples)
+    """
+    response.encoding = response.encoding or 'utf-8'
+    for line in response.iter_lines(chunk_size=chunk_size, decode_unicode=True):
+        if line:
+            yield line
+
+
+def iter_json(data: dict, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    It serializes a dict in chunks, splitting up large string values, so that a query result can be sent without
+    holding a second (escaped) copy of it in memory
+
+    :param data: The dict to serialize, for example a query result keyed by content type
+    :param chunk_size: The number of characters of a string value that are escaped at once
+    """
+    yield '{'
+    for i, (key, value) in enumerate(data.items()):
+        yield f'{", " if i else ""}{json.dumps(key)}: '
+        if isinstance(value, str):
+            # Characters are escaped one by one, so a string can be escaped in arbitrary slices
+            yield '"'
+            for start in range(0, len(value), chunk_size):
+                yield json.dumps(value[start:start + chunk_size])[1:-1]
+            yield '"'
+        else:
+            yield json.dumps(value)
+    yield '}'
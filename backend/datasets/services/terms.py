@@ -0,0 +1,338 @@
+import csv
+import json
+from collections import Counter
+from pathlib import Path
+from typing import Iterator, List, Dict, Iterable, Optional, Set, Sequence, Tuple
+
+import numpy as np
+import requests
+
+from datasets.services.blazegraph import BLAZEGRAPH_ENDPOINT
+from shared.logging import get_logger
+
+logger = get_logger()
+
+RDFS_LABEL = b'<http://www.w3.org/2000/01/rdf-schema#label>'
+RDFS_COMMENT = b'<http://www.w3.org/2000/01/rdf-schema#comment>'
+RDFS_TYPE = b'<http://www.w3.org/2000/01/rdf-schema#type>'
+
+TSV_ACCEPT = 'text/tab-separated-values'
+BATCH_SIZE = 100000
+
+COMPACT_SIZE = 4 * 1024 * 1024
+"""The minimum number of pending (hash, count) pairs before they are merged into the table of a `TermCounter`."""
+
+TERM_COLUMNS = ['iri', 'label', 'count', 'pos', 'rdf_type', 'description']
+"""The columns of an exported terms file, as read by `meilisearch.index_terms_from_csv`."""
+
+
+def stream_tsv(database: str, query: str, timeout: int) -> Iterator[List[bytes]]:
+    """
+    It runs a SELECT query on a Blazegraph namespace and streams the rows of the TSV result. Terms are kept in their
+    N-Triples syntax and are never materialized as a whole result.
+
+    :param database: The Blazegraph namespace
+    :param query: The SELECT query
+    :param timeout: The query timeout in milliseconds
+    :return: An iterator of rows, one encoded term (or empty value) per column.
+    """
+    response = requests.post(
+        f'{BLAZEGRAPH_ENDPOINT}/blazegraph/namespace/{database}/sparql',
+        headers={'Accept': TSV_ACCEPT},
+        data={'query': query, 'timeout': timeout},
+        stream=True,
+    )
+    response.raise_for_status()
+
+    with response:
+        lines = response.iter_lines(chunk_size=1024 * 1024)
+        next(lines, None)  # The header with the variable names
+        for line in lines:
+            if line:
+                yield line.split(b'\t')
+
+
+def _batched(rows: Iterator[List[bytes]], size: int) -> Iterator[List[List[bytes]]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class TermCounter:
+    """
+    Counts terms by their 64-bit hash in sorted fixed-width arrays, which takes 12 bytes per distinct term instead of
+    a Python object per term. Every batch is reduced into a sorted run of (hash, count) pairs; the runs are merged into
+    the table once they outgrow it, so the table is rewritten a logarithmic number of times.
+    Hashes are only stable within a process, terms have to be hashed by the same process that counted them.
+    """
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.uint32)
+        self._runs: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._pending = 0
+
+    @staticmethod
+    def hash(terms: Sequence[bytes]) -> np.ndarray:
+        return np.fromiter(map(hash, terms), dtype=np.int64, count=len(terms))
+
+    def update(self, terms: Sequence[bytes]):
+        if not terms:
+            return
+
+        keys, counts = np.unique(self.hash(terms), return_counts=True)
+        self._runs.append((keys, counts.astype(np.uint32)))
+        self._pending += len(keys)
+        if self._pending >= max(len(self.keys), COMPACT_SIZE):
+            self._compact()
+
+    def _compact(self):
+        if not self._runs:
+            return
+
+        keys = np.concatenate([self.keys] + [keys for keys, _ in self._runs])
+        counts = np.concatenate([self.counts] + [counts for _, counts in self._runs])
+        self._runs, self._pending = [], 0
+
+        order = np.argsort(keys, kind='stable')
+        keys, counts = keys[order], counts[order]
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        self.keys = keys[starts]
+        self.counts = np.add.reduceat(counts, starts).astype(np.uint32) if len(keys) else counts
+
+    def frequent(self, min_count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        It returns the (sorted) hashes and counts of the terms that occur more than min_count times
+        """
+        self._compact()
+        mask = self.counts > min_count
+        return self.keys[mask], self.counts[mask]
+
+
+def _triple_columns(database: str, timeout: int) -> Iterator[Tuple[Sequence[bytes], Sequence[bytes], Sequence[bytes]]]:
+    """
+    It streams the triples of a namespace in batches of (subject, predicate, object) columns. Objects of rdfs:label
+    triples are left out, they are not counted as terms.
+    """
+    for batch in _batched(stream_tsv(database, 'SELECT ?s ?p ?o { ?s ?p ?o }', timeout), BATCH_SIZE):
+        batch = [row for row in batch if len(row) == 3]
+        if not batch:
+            continue
+
+        subjects, predicates, objects = zip(*batch)
+        yield subjects, predicates, [o for p, o in zip(predicates, objects) if p != RDFS_LABEL]
+
+
+def count_terms(database: str, timeout: int, min_count: int = 0) -> List[Counter]:
+    """
+    It counts how often every term occurs as subject, predicate and object. The first pass over the triples of the
+    namespace counts the hashes of the terms in compact tables, a second pass only materializes the terms which
+    occur more than min_count times. Objects of rdfs:label triples are not counted.
+
+    :param database: The Blazegraph namespace
+    :param timeout: The query timeout in milliseconds
+    :param min_count: The minimum number of occurrences (exclusive) of a returned term
+    :return: The counts of the frequent terms per position (subject, predicate, object).
+    """
+    counters = [TermCounter(), TermCounter(), TermCounter()]
+    triple_count = 0
+    for columns in _triple_columns(database, timeout):
+        for counter, terms in zip(counters, columns):
+            counter.update(terms)
+        triple_count += len(columns[0])
+
+    frequent = [counter.frequent(min_count) for counter in counters]
+    del counters
+    logger.info(
+        f'Counted the terms of {triple_count} triples, {sum(len(keys) for keys, _ in frequent)} occur more than '
+        f'{min_count} times'
+    )
+
+    counts = [Counter(), Counter(), Counter()]
+    if not any(len(keys) for keys, _ in frequent):
+        return counts
+
+    for columns in _triple_columns(database, timeout):
+        for pos_counts, (keys, key_counts), terms in zip(counts, frequent, columns):
+            if not len(keys) or not terms:
+                continue
+
+            hashes = TermCounter.hash(terms)
+            idx = np.minimum(np.searchsorted(keys, hashes), len(keys) - 1)
+            for i in np.flatnonzero(keys[idx] == hashes):
+                pos_counts[terms[i]] = int(key_counts[idx[i]])
+
+    return counts
+
+
+def count_terms_of(database: str, terms: List[str], timeout: int) -> List[Counter]:
+    """
+    It counts how often each of the given terms occurs as subject, predicate and object
+
+    :param database: The Blazegraph namespace
+    :param terms: The terms in N-Triples syntax
+    :param timeout: The query timeout in milliseconds
+    :return: The term counts per position (subject, predicate, object).
+    """
+    iris = ' '.join(term for term in terms if term.startswith('<'))
+    values = ' '.join(terms)
+    patterns = [
+        f'VALUES ?t {{ {iris} }} ?t ?p ?o',
+        f'VALUES ?t {{ {iris} }} ?s ?t ?o',
+        f'VALUES ?t {{ {values} }} ?s ?p ?t FILTER(?p != {RDFS_LABEL.decode()})',
+    ]
+
+    counts = []
+    for pattern in patterns:
+        query = f'SELECT ?t (COUNT(*) AS ?count) {{ {pattern} }} GROUP BY ?t'
+        counts.append(Counter({
+            row[0]: literal_int(row[1])
+            for row in stream_tsv(database, query, timeout)
+            if len(row) == 2
+        }))
+
+    return counts
+
+
+def lookup_values(
+        database: str,
+        predicate: bytes,
+        terms: Set[bytes],
+        timeout: int,
+        english: bool = True,
+        restrict: bool = False,
+) -> Dict[bytes, bytes]:
+    """
+    It looks up the (first) value of a property for each of the given terms. Only the triples of the property are read,
+    which is a small fraction of the namespace.
+
+    :param database: The Blazegraph namespace
+    :param predicate: The property in N-Triples syntax
+    :param terms: The terms to look up
+    :param timeout: The query timeout in milliseconds
+    :param english: Whether to only consider english (or untagged) literals
+    :param restrict: Whether to restrict the query to the given terms with a VALUES clause
+    :return: The value per term.
+    """
+    lang_filter = "FILTER (STRSTARTS(lang(?v), 'en') || lang(?v)='')" if english else ''
+    values = f'VALUES ?t {{ {b" ".join(t for t in terms if t.startswith(b"<")).decode()} }}' if restrict else ''
+    query = f'SELECT ?t ?v {{ {values} ?t {predicate.decode()} ?v {lang_filter} }}'
+
+    result = {}
+    for row in stream_tsv(database, query, timeout):
+        if len(row) == 2 and row[0] in terms and row[0] not in result:
+            result[row[0]] = row[1]
+
+    return result
+
+
+def _unescape(text: bytes) -> str:
+    try:
+        return json.loads(b'"' + text + b'"')
+    except ValueError:
+        return text.decode('utf-8', errors='replace')
+
+
+def literal_text(term: bytes) -> str:
+    """
+    It returns the lexical form of an encoded term (like STR in SPARQL)
+    """
+    if term.startswith(b'"'):
+        end = term.rfind(b'"')
+        return _unescape(term[1:end]) if end > 0 else _unescape(term[1:])
+    if term.startswith(b'<') and term.endswith(b'>'):
+        return term[1:-1].decode('utf-8', errors='replace')
+    return term.decode('utf-8', errors='replace')
+
+
+def literal_int(term: bytes) -> int:
+    return int(literal_text(term) or 0)
+
+
+def index_term(term: bytes) -> str:
+    """
+    It returns the text under which a term is indexed: IRIs and blank nodes as they are, literals as their lexical
+    form with the language tag appended (text@en)
+    """
+    if not term.startswith(b'"'):
+        return term.decode('utf-8', errors='replace')
+
+    end = term.rfind(b'"')
+    text = _unescape(term[1:end])
+    suffix = term[end + 1:]
+    return f'{text}{suffix.decode()}' if suffix.startswith(b'@') else text
+
+
+def write_terms(
+        file: Path,
+        counts: List[Counter],
+        labels: Dict[bytes, bytes],
+        descriptions: Dict[bytes, bytes],
+        types: Dict[bytes, bytes],
+        min_count: int = 0,
+) -> int:
+    """
+    It writes the terms that occur more than min_count times to a terms file (with TERM_COLUMNS, without header)
+
+    :return: The number of written rows.
+    """
+    row_count = 0
+    with file.open('w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        for pos, pos_counts in enumerate(counts):
+            for term, count in pos_counts.items():
+                if count <= min_count:
+                    continue
+
+                writer.writerow([
+                    index_term(term),
+                    literal_text(labels[term]) if term in labels else '',
+                    count,
+                    pos,
+                    index_term(types[term]) if term in types else '',
+                    literal_text(descriptions[term]) if term in descriptions else '',
+                ])
+                row_count += 1
+
+    return row_count
+
+
+def frequent_terms(counts: Iterable[Counter], min_count: int) -> Set[bytes]:
+    return {term for pos_counts in counts for term, count in pos_counts.items() if count > min_count}
+
+
+def export_terms(
+        database: str,
+        file: Path,
+        min_count: int = 3,
+        timeout: int = 60 * 60 * 1000,
+        terms: Optional[List[str]] = None,
+) -> int:
+    """
+    It exports the search terms of a namespace with their counts per position, labels, types and descriptions.
+    The counts of all positions are gathered in two passes over the triples (or only for the given terms), after which
+    the labels, descriptions and types of the frequent terms are joined in with one query per property.
+
+    :param database: The Blazegraph namespace
+    :param file: The terms file to write
+    :param min_count: The minimum number of occurrences (exclusive) of an exported term
+    :param timeout: The query timeout in milliseconds
+    :param terms: Only export these terms (in N-Triples syntax), defaults to all terms
+    :return: The number of exported rows.
+    """
+    counts = count_terms(database, timeout, min_count) if terms is None else count_terms_of(database, terms, timeout)
+
+    frequent = frequent_terms(counts, min_count)
+    restrict = terms is not None
+    labels = lookup_values(database, RDFS_LABEL, frequent, timeout, restrict=restrict)
+    descriptions = lookup_values(database, RDFS_COMMENT, frequent, timeout, restrict=restrict)
+    types = lookup_values(database, RDFS_TYPE, frequent, timeout, english=False, restrict=restrict)
+
+    row_count = write_terms(file, counts, labels, descriptions, types, min_count)
+    logger.info(f'Exported {row_count} search terms to {file}')
+    return row_count
@@ -0,0 +1,204 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from typing import List, Dict, Optional, Tuple
+
+import pandas as pd
+from rapidfuzz.distance import Levenshtein
+
+from datasets.services.meilisearch import TermPos, TermIndexDocument, _prepare_data
+from datasets.services.search import SearchService, SearchResult, SearchHit, SearchQuery, TermDocument, \
+    parse_term_document
+from shared.paths import DEFAULT_VOCABULARY_FILES
+
+WORD_RE = re.compile(r'\w+')
+
+SEARCHABLE_ATTRIBUTES = ['iri_text', 'label', 'description']
+"""The searched attributes of a document, in order of importance (like the searchable attributes of a terms index)."""
+
+EXACT, PREFIX, TYPO = 3, 2, 1
+"""How well a query word matched a word of a document."""
+
+
+def _typos(word: str) -> int:
+    # The number of typos allowed in a word of the given length, like Meilisearch does by default
+    return 2 if len(word) >= 9 else (1 if len(word) >= 5 else 0)
+
+
+def _trigrams(word: str) -> set:
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class VocabularyIndex:
+    """
+    An in-memory terms index for small vocabularies. Words are kept in a sorted array, so that prefixes are found with
+    a binary search, next to the (document, attribute) postings of every word and the trigram postings of the words
+    for typo tolerant matching. Results are ranked like a terms index: by the number of matched query words, how well
+    and in which attribute they matched and finally by the term count.
+    """
+
+    def __init__(self, documents: List[TermIndexDocument]):
+        self.documents = [parse_term_document(doc) for doc in documents]
+        self.ids = [doc['id'] for doc in documents]
+        self.is_url = [bool(doc['is_url']) for doc in documents]
+
+        postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        for i, doc in enumerate(documents):
+            for rank, attribute in enumerate(SEARCHABLE_ATTRIBUTES):
+                for word in WORD_RE.findall((doc.get(attribute, None) or '').lower()):
+                    postings[word].setdefault(i, rank)
+
+        self.words = sorted(postings)
+        self.postings = [postings[word] for word in self.words]
+        self.trigrams: Dict[str, List[int]] = defaultdict(list)
+        for w, word in enumerate(self.words):
+            for trigram in _trigrams(word):
+                self.trigrams[trigram].append(w)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _match_word(self, query_word: str, prefix: bool) -> Dict[int, Tuple[int, int]]:
+        """
+        It finds the documents containing a query word
+
+        :param query_word: The (lower case) query word
+        :param prefix: Whether the word may be the prefix of a word (the last query word is still being typed)
+        :return: The best (match quality, attribute rank) per matched document.
+        """
+        matches: Dict[int, Tuple[int, int]] = {}
+
+        def add(w: int, quality: int):
+            for i, rank in self.postings[w].items():
+                if i not in matches or (quality, -rank) > (matches[i][0], -matches[i][1]):
+                    matches[i] = (quality, rank)
+
+        # The words starting with the query word directly follow it in the sorted words
+        start = end = bisect_left(self.words, query_word)
+        while end < len(self.words) and self.words[end].startswith(query_word):
+            if not prefix and self.words[end] != query_word:
+                break
+            add(end, EXACT if self.words[end] == query_word else PREFIX)
+            end += 1
+
+        typos = _typos(query_word)
+        if typos:
+            # Candidates share enough trigrams with the query word to be within the allowed number of typos
+            shared = defaultdict(int)
+            for trigram in _trigrams(query_word):
+                for w in self.trigrams.get(trigram, ()):
+                    shared[w] += 1
+            min_shared = len(query_word) + 1 - 3 * typos
+            for w, count in shared.items():
+                if count < min_shared or start <= w < end:
+                    continue
+                word = self.words[w][:len(query_word)] if prefix else self.words[w]
+                if Levenshtein.distance(query_word, word, score_cutoff=typos) <= typos:
+                    add(w, TYPO)
+
+        return matches
+
+    def search(
+            self,
+            query: str,
+            pos: TermPos,
+            limit: int = 100,
+            offset: int = 0,
+            is_url: Optional[bool] = None,
+            min_count: Optional[int] = None,
+            max_count: Optional[int] = None,
+    ) -> Tuple[int, List[TermDocument]]:
+        """
+        It searches the documents in a position. When no document matches all query words, the documents matching
+        the first words are returned instead, dropping words from the end of the query.
+
+        :return: The number of matching documents and the requested page of them.
+        """
+        def accepted(i: int) -> bool:
+            doc = self.documents[i]
+            count = doc.count or 0
+            return doc.pos == pos and (not is_url or self.is_url[i]) and \
+                (min_count is None or count >= min_count) and (max_count is None or count <= max_count)
+
+        query_words = WORD_RE.findall(query.lower())
+        if not query_words:
+            found = [i for i in range(len(self.documents)) if accepted(i)]
+            return len(found), [self.documents[i] for i in found[offset:offset + limit]]
+
+        matches = [
+            self._match_word(word, prefix=w == len(query_words) - 1)
+            for w, word in enumerate(query_words)
+        ]
+
+        ranked, seen = [], set()
+        for words in range(len(query_words), 0, -1):
+            candidates = set.intersection(*(set(match) for match in matches[:words])) - seen
+            keys = []
+            for i in candidates:
+                if not accepted(i):
+                    continue
+                quality = sum(match[i][0] for match in matches[:words])
+                attribute = sum(match[i][1] for match in matches[:words])
+                keys.append((-quality, attribute, -(self.documents[i].count or 0), self.ids[i], i))
+            ranked.extend(key[-1] for key in sorted(keys))
+            seen |= candidates
+
+        return len(ranked), [self.documents[i] for i in ranked[offset:offset + limit]]
+
+
+_index: Optional[VocabularyIndex] = None
+_index_lock = threading.Lock()
+
+
+def load_vocabulary_documents() -> List[TermIndexDocument]:
+    """
+    It prepares the documents of the default vocabulary the same way as they are added to a terms index
+    """
+    data = pd.concat([pd.read_csv(file) for file in DEFAULT_VOCABULARY_FILES], ignore_index=True)
+    data['id'] = range(len(data))
+    data = _prepare_data(data)
+    return data.astype(object).where(data.notna(), None).to_dict(orient='records')
+
+
+def get_vocabulary_index() -> VocabularyIndex:
+    """
+    It returns the index of the default vocabulary, which is loaded once per process
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = VocabularyIndex(load_vocabulary_documents())
+    return _index
+
+
+class VocabularySearchService(SearchService):
+    """
+    Searches the default vocabulary (RDF, RDFS, OWL and FOAF) in-process. It only complements searches with a query.
+    """
+    batched = True
+
+    def accepts(self, query: SearchQuery) -> bool:
+        return bool(query.query)
+
+    def search(
+            self,
+            query, pos: TermPos,
+            limit: int = 100, offset: int = 0,
+            timeout=5000,
+            url: Optional[bool] = None,
+            min_count: Optional[int] = None,
+            max_count: Optional[int] = None,
+            **options
+    ) -> SearchResult:
+        count, documents = get_vocabulary_index().search(
+            query, pos, limit, offset, is_url=url, min_count=min_count, max_count=max_count,
+        )
+
+        return SearchResult(
+            count=count,
+            hits=[SearchHit(score=1.0, document=document) for document in documents],
+            agg={}
+        )
@@ -1,70 +1,29 @@
-import cgi
-import os.path
 import shutil
 from pathlib import Path
 from typing import Optional, List
-from urllib.parse import urlparse
-from urllib.request import urlretrieve, urlopen
 
 import requests
 from celery import shared_task
 
+from backend import settings
 from backend.settings import ROOT_DIR, DEBUG
 from datasets.services.blazegraph import BLAZEGRAPH_ENDPOINT
+from datasets.services.normalize import normalize_files
+from datasets.services.snapshot import build_snapshot
+from shared.download import download_files
 from shared.logging import get_logger
-from shared.paths import DOWNLOAD_DIR
+from shared.paths import DOWNLOAD_DIR, IMPORT_DIR
 from shared.random import random_string
 
 logger = get_logger()
 
 
 @shared_task()
-def download_url(url: str, path: str = None) -> Optional[Path]:
-    logger.info(f"Downloading knowledge graph from {url}")
-    download_folder = (Path(path) if path else DOWNLOAD_DIR) / random_string(10)
-    download_folder.mkdir(parents=True)
-
-    try:
-        if 'github.com' in url and 'raw' not in url:
-            logger.info(f"Downloading from github raw")
-            url += ('&raw=true' if urlparse(url).query else '?raw=true')
-    except Exception as e:
-        logger.error(f"Error preprocessing {url}: {e}")
-        raise Exception(e)
-
-    try:
-        filename = None
-
-        logger.info('Trying to infer file name')
-        remotefile = urlopen(url)
-        headerblob = remotefile.info().get('Content-Disposition', None)
-        if headerblob:
-            value, params = cgi.parse_header(headerblob)
-            filename = params.get('filename', None)
-
-        if filename is None:
-            filename = os.path.basename(urlparse(url).path)
-    except Exception as e:
-        logger.error(f"Failed to parse URL {url}. Error: {e}")
-        if not DEBUG:
-            shutil.rmtree(download_folder)
-        raise Exception(e)
-
-    download_path = download_folder / filename
-
-    try:
-        logger.info(f"Downloading {url} to {download_path}")
-        # TODO: add a hook to check if file is not too big
-        urlretrieve(url, download_path)
-        logger.info(f"Downloaded {url} to {download_path}")
-    except Exception as e:
-        logger.error(f"Failed to download {url}. Error: {e}")
-        if not DEBUG:
-            shutil.rmtree(download_folder)
-        raise Exception(e)
-
-    # TODO: We may need to rename the file extension.
-    return download_path
+def download_urls(urls: List[str], path: str = None) -> List[Path]:
+    logger.info(f"Downloading {len(urls)} files")
+    download_paths = download_files(urls, Path(path) if path else DOWNLOAD_DIR)
+    logger.info(f"Downloaded {len(download_paths)} files")
+    return download_paths
 
 
 data = """
@@ -97,7 +56,7 @@ import_content = """
 
 
 @shared_task()
-def import_files(files: List[Path], database: Optional[str] = None) -> str:
+def import_files(files: List[Path], database: Optional[str] = None, snapshot_path: Optional[str] = None) -> str:
     if database is None:
         database = 'a' + random_string(10)
 
@@ -107,10 +66,23 @@ def import_files(files: List[Path], database: Optional[str] = None) -> str:
 
     if isinstance(files, (Path, str)):
         if files.is_dir():
-            files = list(files.glob('**/*'))
+            files = [file for file in files.glob('**/*') if file.is_file()]
         else:
             files = [files]
 
+    normalized_dir = IMPORT_DIR / random_string(10)
+    try:
+        files = normalize_files(list(map(Path, files)), normalized_dir)
+        # The loader renames the files it loaded (durableQueues), so the snapshot is built first
+        if snapshot_path:
+            build_snapshot(files, Path(snapshot_path))
+        return load_files(files, database)
+    finally:
+        if not DEBUG:
+            shutil.rmtree(normalized_dir, ignore_errors=True)
+
+
+def load_files(files: List[Path], database: str, create: bool = True) -> str:
     logger.info(f"Loading KG from {files}")
 
     paths = ','.join([
@@ -118,15 +90,16 @@ def import_files(files: List[Path], database: Optional[str] = None) -> str:
         for file in files
     ])
 
-    response = requests.post(
-        f'{BLAZEGRAPH_ENDPOINT}/blazegraph/namespace',
-        headers={
-            'Content-Type': 'text/plain',
-        },
-        data=data.format(namespace=database)
-    )
-    response.raise_for_status()
-    logger.info(f"Created namespace {database}")
+    if create:
+        response = requests.post(
+            f'{BLAZEGRAPH_ENDPOINT}/blazegraph/namespace',
+            headers={
+                'Content-Type': 'text/plain',
+            },
+            data=data.format(namespace=database)
+        )
+        response.raise_for_status()
+        logger.info(f"Created namespace {database}")
 
     response = requests.post(
         f'{BLAZEGRAPH_ENDPOINT}/blazegraph/dataloader',
@@ -142,3 +115,25 @@ def import_files(files: List[Path], database: Optional[str] = None) -> str:
     logger.info(f"Loaded KG from {files} into {database}")
 
     return database
+
+
+def delete_triples(database: str, lines: List[bytes], batch_size: int = None) -> int:
+    """
+    It removes triples from a database with batched SPARQL DELETE DATA updates
+
+    :param database: The Blazegraph namespace
+    :param lines: The triples as N-Triples lines (without blank nodes)
+    :param batch_size: The number of triples per update, defaults to REFRESH_UPDATE_BATCH
+    :return: The number of removed triples.
+    """
+    batch_size = batch_size or settings.REFRESH_UPDATE_BATCH
+    for batch in range(0, len(lines), batch_size):
+        triples = b'\n'.join(lines[batch:batch + batch_size]).decode('utf-8')
+        response = requests.post(
+            f'{BLAZEGRAPH_ENDPOINT}/blazegraph/namespace/{database}/sparql',
+            data={'update': f'DELETE DATA {{\n{triples}\n}}'},
+        )
+        response.raise_for_status()
+
+    logger.info(f"Deleted {len(lines)} triples from {database}")
+    return len(lines)
@@ -4,6 +4,7 @@ import requests
 from celery import shared_task
 
 from datasets.models import Dataset
+from datasets.services import cursor
 from datasets.services.blazegraph import BLAZEGRAPH_ENDPOINT
 from shared.logging import get_logger
 import xml.etree.ElementTree as ET
@@ -34,10 +35,12 @@ def update_dataset_info(dataset_id: UUID):
                 raise Exception("Dataset has no database")
 
             namespaces = []
-            triple_count = int(dataset.get_query_service().query_select('''
+            bindings = dataset.get_query_service(cached=False).stream_bindings('''
                 SELECT (COUNT(*) AS ?count)
                 WHERE { ?s ?p ?o }
-            ''', limit=1, ignore_limit=True).get('results').get('bindings')[0].get('count').get('value'))
+            ''', limit=1, ignore_limit=True)
+            triple_count = int(next(bindings).get('count').get('value'))
+            bindings.close()
         case _:
             raise Exception(f"Unsupported mode {dataset.mode}")
 
@@ -56,3 +59,9 @@ def update_dataset_info(dataset_id: UUID):
     }
     dataset.save()
     logger.info('Successfully updated dataset info')
+
+
+@shared_task()
+def clear_expired_cursors():
+    count = cursor.clear_expired_cursors()
+    logger.info(f'Removed {count} expired query cursors')
@@ -6,14 +6,20 @@ from uuid import UUID
 import requests
 from celery import shared_task
 
+from backend import settings
 from backend.settings import DEBUG
 from datasets.models import Dataset, DatasetState
 from datasets.services import meilisearch
 from datasets.services.blazegraph import BLAZEGRAPH_ENDPOINT
-from datasets.tasks import download_url, import_files, update_dataset_info, create_search_index, \
-    create_default_search_index
+from datasets.services.query import invalidate_query_cache
+from datasets.services.search import invalidate_search_cache
+from datasets.services.normalize import normalize_files
+from datasets.services.snapshot import snapshot_dir, load_snapshot, save_snapshot, build_snapshot, diff_snapshots, \
+    replace_snapshot, triple_terms
+from datasets.tasks import download_urls, import_files, load_files, delete_triples, update_dataset_info, \
+    create_search_index, update_search_terms
 from shared.logging import get_logger
-from shared.paths import DOWNLOAD_DIR
+from shared.paths import DOWNLOAD_DIR, IMPORT_DIR
 from shared.random import random_string
 
 logger = get_logger()
@@ -43,14 +49,10 @@ def import_dataset(dataset_id: UUID, files: List[str] = None) -> str:
                 if len(urls) == 0:
                     raise Exception("No URLs specified")
 
-                logger.info(f"Downloading {len(urls)} files")
-                files = []
-                for url in set(urls):
-                    file = download_url(url, str(tmp_dir))
-                    files.append(file)
+                files = download_urls(list(dict.fromkeys(urls)), str(tmp_dir))
 
                 logger.info(f"Importing {len(files)} files")
-                dataset.local_database = import_files(files)
+                dataset.local_database = import_files(files, snapshot_path=str(snapshot_dir(dataset_id)))
                 logger.info(f'Created database {dataset.local_database}')
             case (Dataset.Mode.LOCAL.value, 'existing'):
                 dataset.local_database = source.get('database', None)
@@ -68,14 +70,20 @@ def import_dataset(dataset_id: UUID, files: List[str] = None) -> str:
                 raise Exception(f"Unsupported source type {source_type}")
 
         dataset.save()
+        invalidate_query_cache(dataset_id)
+        invalidate_search_cache(dataset_id)
 
         logger.info(f"Updating dataset info")
         update_dataset_info(dataset_id)
 
-        create_default_search_index(force=False)
         if dataset.search_mode == Dataset.SearchMode.LOCAL.value:
             logger.info(f"Creating search index")
-            create_search_index(dataset_id, path=str(tmp_dir))
+            term_count = create_search_index(dataset_id, path=str(tmp_dir))
+
+            snapshot = load_snapshot(snapshot_dir(dataset_id))
+            if snapshot is not None and term_count is not None:
+                snapshot.next_term_id = term_count
+                save_snapshot(snapshot_dir(dataset_id), snapshot)
 
         logger.info(f"Import finished")
         Dataset.objects.filter(id=dataset_id).update(state=DatasetState.IMPORTED.value)
@@ -103,9 +111,10 @@ def delete_dataset(dataset_id: UUID) -> str:
     logger.info(f"Deleting dataset {dataset.name}")
 
     if dataset.search_mode == Dataset.SearchMode.LOCAL.value:
-        if dataset.search_index_name and meilisearch.has_index(dataset.search_index_name):
+        if dataset.search_index_name:
             logger.info(f"Deleting search index {dataset.search_index_name}")
-            meilisearch.client.index(dataset.search_index_name).delete()
+            meilisearch.delete_index(dataset.search_index_name)
+            meilisearch.delete_index(meilisearch.shadow_index_name(dataset.search_index_name))
 
     if dataset.mode == Dataset.Mode.LOCAL.value and dataset.local_database:
         logger.info(f"Deleting database {dataset.local_database}")
@@ -119,4 +128,105 @@ def delete_dataset(dataset_id: UUID) -> str:
         response.raise_for_status()
         logger.info(f"Deleted namespace {dataset.local_database}")
 
+    shutil.rmtree(snapshot_dir(dataset_id), ignore_errors=True)
     dataset.delete()
+    invalidate_query_cache(dataset_id)
+    invalidate_search_cache(dataset_id)
+
+
+@shared_task()
+def refresh_dataset(dataset_id: UUID) -> str:
+    """
+    It updates a dataset imported from urls to the current version of its source files. The new files are compared
+    with the snapshot of the previous import bucket by bucket, and only the changed triples are applied to the
+    database and only the changed terms are updated in the search index. If either version can't be snapshotted
+    (blank nodes or non N-Triples files), the dataset is loaded into a new database instead.
+    """
+    dataset = Dataset.objects.get(id=dataset_id)
+    source = dataset.source
+    if dataset.mode != Dataset.Mode.LOCAL.value or source.get('source_type', None) != 'urls':
+        raise Exception("Only local datasets imported from urls can be refreshed")
+    if not dataset.local_database:
+        raise Exception("Dataset has no database")
+
+    logger.info(f"Refreshing dataset {dataset.name}")
+    Dataset.objects.filter(id=dataset_id).update(
+        state=DatasetState.IMPORTING.value,
+        import_task_id=refresh_dataset.request.id,
+    )
+    tmp_dir = DOWNLOAD_DIR / random_string(10)
+    tmp_dir.mkdir(parents=True)
+    normalized_dir = IMPORT_DIR / random_string(10)
+
+    old_path = snapshot_dir(dataset_id)
+    new_path = old_path.with_name(f'{old_path.name}.{random_string(6)}')
+    try:
+        files = download_urls(list(dict.fromkeys(source.get('urls', []))), str(tmp_dir))
+        files = normalize_files(files, normalized_dir)
+
+        old = load_snapshot(old_path)
+        new = build_snapshot(files, new_path, buckets=len(old.buckets) if old else None)
+
+        if old is None or new is None:
+            logger.info(f"Incremental refresh is not possible, loading {dataset.name} into a new database")
+            old_database = dataset.local_database
+            # The search index keeps its name, so it keeps serving the old terms until the new ones are swapped in
+            dataset.search_index = dataset.search_index_name
+            dataset.local_database = load_files(files, 'a' + random_string(10))
+            dataset.save()
+
+            if dataset.search_mode == Dataset.SearchMode.LOCAL.value:
+                term_count = create_search_index(dataset_id, path=str(tmp_dir), force=True)
+                if new is not None and term_count is not None:
+                    new.next_term_id = term_count
+            requests.delete(f'{BLAZEGRAPH_ENDPOINT}/blazegraph/namespace/{old_database}').raise_for_status()
+        else:
+            inserted_file = normalized_dir / 'inserted.nt'
+            changed_terms, deleted_count, inserted_count = set(), 0, 0
+            with inserted_file.open('wb') as f:
+                for deleted, inserted in diff_snapshots(old_path, old, new_path, new):
+                    deleted_count += delete_triples(dataset.local_database, sorted(deleted))
+                    for line in inserted:
+                        f.write(line + b'\n')
+                    inserted_count += len(inserted)
+
+                    for line in deleted | inserted:
+                        changed_terms.update(triple_terms(line))
+
+            if inserted_count:
+                load_files([inserted_file], dataset.local_database, create=False)
+            logger.info(f"Applied {deleted_count} deletions and {inserted_count} insertions")
+
+            new.next_term_id = old.next_term_id
+            if dataset.search_mode == Dataset.SearchMode.LOCAL.value and changed_terms:
+                if len(changed_terms) > settings.REFRESH_MAX_TERMS:
+                    term_count = create_search_index(dataset_id, path=str(tmp_dir), force=True)
+                    new.next_term_id = term_count or 0
+                else:
+                    new.next_term_id += update_search_terms(
+                        dataset_id, sorted(changed_terms), start_id=old.next_term_id, path=str(tmp_dir),
+                    )
+
+        if new is not None:
+            save_snapshot(new_path, new)
+            replace_snapshot(old_path, new_path)
+        else:
+            shutil.rmtree(old_path, ignore_errors=True)
+
+        # Saving bumps the version of the dataset, which invalidates cached query results in every process
+        dataset.save()
+        invalidate_query_cache(dataset_id)
+        invalidate_search_cache(dataset_id)
+        update_dataset_info(dataset_id)
+
+        logger.info("Refresh finished")
+        Dataset.objects.filter(id=dataset_id).update(state=DatasetState.IMPORTED.value)
+    except Exception as e:
+        logger.error(f"Error refreshing dataset {dataset.name}: {e}")
+        Dataset.objects.filter(id=dataset_id).update(state=DatasetState.FAILED.value)
+        raise e from e
+    finally:
+        shutil.rmtree(new_path, ignore_errors=True)
+        if not DEBUG:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            shutil.rmtree(normalized_dir, ignore_errors=True)
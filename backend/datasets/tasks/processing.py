@@ -1,79 +1,56 @@
 import shutil
 from pathlib import Path
+from typing import List, Callable, Optional
 from uuid import UUID
 
-import requests
 from celery import shared_task
 
-from backend import settings
 from backend.settings import DEBUG
 from datasets.models import Dataset
 from datasets.services import meilisearch
-from datasets.services.blazegraph import BLAZEGRAPH_ENDPOINT
+from datasets.services.search import invalidate_search_cache
+from datasets.services.terms import export_terms, index_term
 from shared.logging import get_logger
-from shared.paths import DOWNLOAD_DIR, DEFAULT_SEARCH_INDEX_NAME
+from shared.paths import DOWNLOAD_DIR, DEFAULT_SEARCH_INDEX_NAME, DEFAULT_VOCABULARY_FILES
 from shared.random import random_string
 
 logger = get_logger()
 
-QUERY_EXPORT_SEARCH = '''
-PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-SELECT
-    ?iri 
-    (STR(?labelRaw) AS ?label) 
-    ?count 
-    ?pos
-    ?rdf_type
-    (STR(?descriptionRaw) AS ?description)  
-{
-    {
-        SELECT (?t as ?iri) (COUNT(?t) as ?count) ({pos} as ?pos)  
-        {triple}
-        GROUP BY ?t HAVING (?count > {min_count})
-    }
-
-    OPTIONAL { 
-        ?iri rdfs:label ?labelRaw.
-        FILTER (STRSTARTS(lang(?labelRaw), 'en') || lang(?labelRaw)='')
-    }
-    OPTIONAL { 
-        ?iri rdfs:comment ?descriptionRaw.
-        FILTER (STRSTARTS(lang(?descriptionRaw), 'en') || lang(?descriptionRaw)='')
-    }
-    OPTIONAL { ?iri rdfs:type ?rdf_type }
-}
-'''
-
-
-# TODO: remove labels from main results
-
-
-def query_to_file(database: str, query: str, file: Path, timeout=5000, **kwargs):
-    endpoint = f'{BLAZEGRAPH_ENDPOINT}/blazegraph/namespace/{database}/sparql'
-    headers = {
-        'Accept': 'text/csv',
-    }
-
-    data = {
-        'query': query,
-        'timeout': timeout,
-    }
-
-    response = requests.post(
-        endpoint,
-        headers=headers,
-        data=data,
-        stream=True,
-    )
-    response.raise_for_status()
-
-    logger.info(f"Saving query results to {file}")
-
-    with file.open('wb') as f:
-        for chunk in response.iter_content(chunk_size=4096):
-            f.write(chunk)
-
-    logger.info(f"Query results saved to {file}")
+
+def build_search_index(index_name: str, build: Callable[[str], int], force: bool = True) -> Optional[int]:
+    """
+    It (re)builds a terms index without taking the live index offline. An existing index is rebuilt into a shadow
+    index, which is only swapped in once all its documents are indexed and counted, so searches keep being served
+    from the old documents for the whole rebuild. A failed rebuild leaves the live index untouched.
+
+    :param index_name: The name of the live index
+    :param build: Adds the documents to the given index, and returns the number of added documents
+    :param force: Whether to rebuild an existing index
+    :return: The number of indexed documents, or None if the index already exists.
+    """
+    exists = meilisearch.has_index(index_name)
+    if exists and not force:
+        logger.info(f"Search index {index_name} already exists")
+        return None
+
+    target = meilisearch.shadow_index_name(index_name) if exists else index_name
+    if exists:
+        logger.info(f"Rebuilding search index {index_name} in {target}")
+        # Left behind by an interrupted rebuild
+        meilisearch.delete_index(target, wait=True)
+
+    try:
+        meilisearch.create_terms_index(target)
+        row_count = build(target)
+        if exists:
+            meilisearch.swap_index(index_name, target, row_count)
+            logger.info(f"Swapped the rebuilt search index into {index_name}")
+    except Exception:
+        if exists:
+            meilisearch.delete_index(target)
+        raise
+
+    return row_count
 
 
 @shared_task()
@@ -90,60 +67,79 @@ def create_search_index(
     if database is None:
         raise Exception("Dataset has no database")
 
-    if meilisearch.has_index(database):
-        if force:
-            logger.info(f"Removing existing search index at {database}")
-            meilisearch.client.index(database).delete()
-        else:
-            logger.info(f"Search index already exists for {dataset.name}")
-            return
-
     tmp_dir = (Path(path) if path else DOWNLOAD_DIR) / random_string(10)
-    tmp_dir.mkdir(parents=True, exist_ok=True)
-    try:
-        terms_files = []
-
-        terms_s_file = tmp_dir / 'terms_s.csv'
-        query = QUERY_EXPORT_SEARCH \
-            .replace('{triple}', '{ ?t ?p ?v }') \
-            .replace('{min_count}', str(min_term_count)) \
-            .replace('{pos}', '0')
-        logger.info(f'Exporting subject search terms {terms_s_file}')
-        query_to_file(database, query, terms_s_file, timeout=60 * 60 * 1000)
-        terms_files.append(terms_s_file)
-
-        terms_p_file = tmp_dir / 'terms_p.csv'
-        query = QUERY_EXPORT_SEARCH \
-            .replace('{triple}', '{ ?s ?t ?v }') \
-            .replace('{min_count}', str(min_term_count)) \
-            .replace('{pos}', '1')
-        logger.info(f'Exporting predicate search terms {terms_p_file}')
-        query_to_file(database, query, terms_p_file, timeout=60 * 60 * 1000)
-        terms_files.append(terms_p_file)
-
-        terms_o_file = tmp_dir / 'terms_o.csv'
-        query = QUERY_EXPORT_SEARCH \
-            .replace('{triple}', '{ ?s ?p ?t FILTER(?p != rdfs:label) }') \
-            .replace('{min_count}', str(min_term_count)) \
-            .replace('{pos}', '2')
-        logger.info(f'Exporting object search terms {terms_o_file}')
-        query_to_file(database, query, terms_o_file, timeout=60 * 60 * 1000)
-        terms_files.append(terms_o_file)
+
+    def build(index_name: str) -> int:
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        # All positions are counted in a single pass over the triples
+        terms_file = tmp_dir / 'terms.csv'
+        logger.info(f'Exporting search terms {terms_file}')
+        export_terms(database, terms_file, min_count=min_term_count)
 
         logger.info('Creating search index from documents')
-        meilisearch.create_terms_index(database)
+        return meilisearch.index_terms_from_csv(
+            index_name=index_name,
+            csv_path=terms_file,
+            start_id=0
+        )
+
+    try:
+        row_count = build_search_index(dataset.search_index_name, build, force=force)
+        if row_count is not None:
+            logger.info(f'Search index created with {row_count} terms')
+            invalidate_search_cache(dataset_id)
+        return row_count
+    finally:
+        logger.info(f"Cleaning up {tmp_dir}")
+        if not DEBUG:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def update_search_terms(
+        dataset_id: UUID,
+        terms: List[str],
+        start_id: int,
+        min_term_count: int = 3,
+        path: str = None,
+        batch_size: int = 500,
+) -> int:
+    """
+    It updates the documents of the given terms in the search index of a dataset after its triples have changed.
+    The documents of the terms are removed and the terms are exported again, so that their counts, labels and
+    descriptions match the updated dataset.
+
+    :param dataset_id: The id of the dataset
+    :param terms: The changed terms (subjects, predicates and objects) in N-Triples syntax
+    :param start_id: The id of the first added document
+    :param min_term_count: The minimum number of occurrences of an indexed term
+    :param path: The directory for temporary files
+    :param batch_size: The number of terms exported per query
+    :return: The number of added documents.
+    """
+    dataset = Dataset.objects.get(id=dataset_id)
+    database, index_name = dataset.local_database, dataset.search_index_name
+    if database is None or not meilisearch.has_index(index_name):
+        return 0
 
+    meilisearch.delete_terms(index_name, [index_term(term.encode('utf-8')) for term in terms])
+
+    tmp_dir = (Path(path) if path else DOWNLOAD_DIR) / random_string(10)
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    try:
         row_count = 0
-        for terms_file in terms_files:
+        for batch in range(0, len(terms), batch_size):
+            terms_file = tmp_dir / f'terms_{batch}.csv'
+            export_terms(database, terms_file, min_count=min_term_count, terms=terms[batch:batch + batch_size])
             row_count += meilisearch.index_terms_from_csv(
-                index_name=database,
+                index_name=index_name,
                 csv_path=terms_file,
-                start_id=row_count
+                start_id=start_id + row_count,
             )
 
-        logger.info(f'Search index created with {row_count} terms')
+        logger.info(f'Updated {len(terms)} search terms with {row_count} documents')
+        invalidate_search_cache(dataset_id)
+        return row_count
     finally:
-        logger.info(f"Cleaning up {tmp_dir}")
         if not DEBUG:
             shutil.rmtree(tmp_dir, ignore_errors=True)
 
@@ -154,30 +150,17 @@ def create_default_search_index(
 ):
     logger.info(f"Creating default search index")
 
-    if meilisearch.has_index(DEFAULT_SEARCH_INDEX_NAME):
-        if force:
-            logger.info(f"Removing existing search index at {DEFAULT_SEARCH_INDEX_NAME}")
-            meilisearch.client.index(DEFAULT_SEARCH_INDEX_NAME).delete()
-        else:
-            logger.info(f"Default search index already exists")
-            return
-
-    terms_files = [
-        settings.BASE_DIR.joinpath('data', 'rdf.csv'),
-        settings.BASE_DIR.joinpath('data', 'rdfs.csv'),
-        settings.BASE_DIR.joinpath('data', 'owl.csv'),
-        settings.BASE_DIR.joinpath('data', 'foaf.csv'),
-    ]
-
-    logger.info('Creating search index from documents')
-    meilisearch.create_terms_index(DEFAULT_SEARCH_INDEX_NAME)
-
-    row_count = 0
-    for terms_file in terms_files:
-        row_count += meilisearch.index_terms_from_csv(
-            index_name=DEFAULT_SEARCH_INDEX_NAME,
-            csv_path=terms_file,
-            start_id=row_count
-        )
+    def build(index_name: str) -> int:
+        logger.info('Creating search index from documents')
+        row_count = 0
+        for terms_file in DEFAULT_VOCABULARY_FILES:
+            row_count += meilisearch.index_terms_from_csv(
+                index_name=index_name,
+                csv_path=terms_file,
+                start_id=row_count
+            )
+        return row_count
 
-    logger.info(f'Search index created with {row_count} terms')
+    row_count = build_search_index(DEFAULT_SEARCH_INDEX_NAME, build, force=force)
+    if row_count is not None:
+        logger.info(f'Search index created with {row_count} terms')
@@ -9,6 +9,10 @@ router.register(r'datasets', views.DatasetViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('datasets/<uuid:id>/search', views.term_search),
+    path('datasets/<uuid:id>/search/batch', views.term_search_batch),
+    path('datasets/search/cache', views.search_cache_stats),
     path('datasets/<uuid:id>/query', views.dataset_query),
+    path('datasets/<uuid:id>/query/cursor', views.dataset_query_cursor),
+    path('datasets/<uuid:id>/query/cursor/<str:cursor>', views.dataset_query_page),
     path('lodc/datasets', views.proxy_lodc_api),
 ]
@@ -1,26 +1,33 @@
 import json
+from typing import List
 from uuid import UUID
 
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from django_filters.rest_framework import DjangoFilterBackend
 
-from django.core.cache import cache
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework import filters
 from rest_framework import viewsets
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, action, authentication_classes, permission_classes
 from rest_framework.request import Request
 from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.exceptions import NotFound
 from rest_framework.serializers import ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 
 from datasets.models import Dataset
 from datasets.serializers import DatasetSerializer
-from datasets.services import meilisearch
-from datasets.services.search import TermPos, LocalSearchService, merge_results
-from datasets.tasks.pipeline import import_dataset, delete_dataset
-from shared.paths import DOWNLOAD_DIR, DEFAULT_SEARCH_INDEX_NAME
+from datasets.services.cursor import create_cursor, read_page, get_cursor, CursorNotFound
+from datasets.services.query import QueryExecutionException
+from datasets.services.streaming import iter_json
+from datasets.services.search import TermPos, SearchQuery, SearchService, federated_search, \
+    federated_search_many, search_cache
+from datasets.services.vocabulary import VocabularySearchService
+from datasets.tasks.pipeline import import_dataset, delete_dataset, refresh_dataset
+from shared.paths import DOWNLOAD_DIR
 from shared.random import random_string
 from users.permissions import IsOwner
 
@@ -88,10 +95,26 @@ class DatasetViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer):
         super().perform_update(serializer)
 
+    @action(detail=True, methods=['post'])
+    def refresh(self, request, pk=None):
+        instance: Dataset = self.get_object()
+        if instance.mode != Dataset.Mode.LOCAL.value or instance.source.get('source_type') != 'urls':
+            raise ValidationError('Only local datasets imported from urls can be refreshed')
+        if instance.has_running_task:
+            raise ValidationError('Dataset is busy with another task')
+
+        instance.apply_async(
+            refresh_dataset,
+            (instance.id,),
+            creator=self.request.user,
+            name=f'Refresh dataset {instance.name}'
+        )
+        return JsonResponse(self.get_serializer(instance).data)
+
     def get_permissions(self):
         permissions = super().get_permissions()
 
-        if self.action in ['destroy']:
+        if self.action in ['destroy', 'refresh']:
             permissions.append(IsOwner())
 
         return permissions
@@ -111,29 +134,130 @@ def parse_int_or_none(value: str) -> int:
     openapi.Parameter('timeout', openapi.IN_QUERY, "Timeout", type=openapi.TYPE_INTEGER),
 ])
 @api_view(['GET'])
+@authentication_classes([JWTStatelessUserAuthentication])
 def term_search(request: Request, id: UUID):
-    dataset = Dataset.objects.get(id=id)
-
     q = request.GET.get('query', '')
     pos = TermPos(request.GET.get('pos', 'OBJECT'))
     limit = int(request.GET.get('limit', 10))
     offset = int(request.GET.get('offset', 0))
     timeout = int(request.GET.get('timeout', 5000))
 
-    cache_key = f'search:{dataset.id}:{pos}:{q}:{limit}:{offset}:{timeout}'
-    result_dict = cache.get(cache_key)
+    # The token is verified without loading the user and the dataset is only loaded on a miss, so a hot hit is
+    # served without touching the database
+    query = SearchQuery(q, pos, limit, offset)
+    # The result is stored under the generation it was looked up in, so an import finishing during the search
+    # invalidates it
+    generation = search_cache.generation(str(id))
+    result_dict = search_cache.get(str(id), query.cache_key(), generation=generation)
     if result_dict is None:
-        result_default = LocalSearchService(DEFAULT_SEARCH_INDEX_NAME).search(q, pos, limit, offset, timeout) \
-            if q and meilisearch.has_index(DEFAULT_SEARCH_INDEX_NAME) else None
-        result_dataset = dataset.get_search_service().search(q, pos, limit, offset, timeout)
-        result = merge_results(result_default, result_dataset, q) if result_default else result_dataset
+        dataset = Dataset.objects.get(id=id)
+        result = federated_search(search_services(dataset), q, pos, limit, offset, timeout)
 
         result_dict = result.to_dict()
-        cache.set(cache_key, result_dict, 60 * 60 * 24 * 7)
+        # Partial results are not cached, so the next search asks the slow service again
+        if not result.partial:
+            search_cache.set(str(id), query.cache_key(), result_dict, generation=generation)
 
     return JsonResponse(result_dict)
 
 
+MAX_BATCH_QUERIES = 32
+
+
+def parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ('true', 'false', '1', '0'):
+        return value.lower() in ('true', '1')
+    raise ValueError(f'{value!r} is not a boolean')
+
+
+SEARCH_OPTION_PARSERS = {
+    'url': parse_bool,
+    'min_count': int,
+    'max_count': int,
+}
+"""The parsers of the filter options of a search query, the options end up in search service filters."""
+
+
+def parse_search_query(data: dict) -> SearchQuery:
+    try:
+        return SearchQuery(
+            query=str(data.get('query', '')),
+            pos=TermPos(data.get('pos', 'OBJECT')),
+            limit=int(data.get('limit', 10)),
+            offset=int(data.get('offset', 0)),
+            options={
+                key: parse(data[key])
+                for key, parse in SEARCH_OPTION_PARSERS.items()
+                if data.get(key, None) is not None
+            },
+        )
+    except (ValueError, TypeError, AttributeError) as e:
+        raise ValidationError(f'Invalid search query: {e}')
+
+
+@swagger_auto_schema(methods=['post'], manual_parameters=[
+    openapi.Parameter('timeout', openapi.IN_QUERY, "Timeout", type=openapi.TYPE_INTEGER),
+], request_body=openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        'queries': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'query': openapi.Schema(type=openapi.TYPE_STRING, description='Search query'),
+                'pos': openapi.Schema(type=openapi.TYPE_STRING, description='Term Position'),
+                'limit': openapi.Schema(type=openapi.TYPE_INTEGER, description='Limit'),
+                'offset': openapi.Schema(type=openapi.TYPE_INTEGER, description='Offset'),
+                'url': openapi.Schema(type=openapi.TYPE_BOOLEAN, description='Only urls'),
+                'min_count': openapi.Schema(type=openapi.TYPE_INTEGER, description='Minimum term count'),
+                'max_count': openapi.Schema(type=openapi.TYPE_INTEGER, description='Maximum term count'),
+            },
+        )),
+    },
+    description='Searches to be executed'
+))
+@api_view(['POST'])
+@authentication_classes([JWTStatelessUserAuthentication])
+def term_search_batch(request: Request, id: UUID):
+    """
+    Runs several term searches at once (for example one per position of a triple pattern). Searches that are not
+    cached are sent to every service together, and the results are returned in the order of the searches.
+    """
+    timeout = int(request.GET.get('timeout', 5000))
+    items = request.data.get('queries', []) if isinstance(request.data, dict) else []
+    if not isinstance(items, list) or len(items) > MAX_BATCH_QUERIES:
+        raise ValidationError(f'Expected a list of at most {MAX_BATCH_QUERIES} queries')
+
+    queries = [parse_search_query(item) for item in items]
+    generation = search_cache.generation(str(id))
+    results = [search_cache.get(str(id), query.cache_key(), generation=generation) for query in queries]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        dataset = Dataset.objects.get(id=id)
+        found = federated_search_many(search_services(dataset), [queries[i] for i in missing], timeout)
+        for i, result in zip(missing, found):
+            results[i] = result.to_dict()
+            if not result.partial:
+                search_cache.set(str(id), queries[i].cache_key(), results[i], generation=generation)
+
+    return JsonResponse({'results': results})
+
+
+def search_services(dataset: Dataset) -> List[SearchService]:
+    """
+    The services searched for the terms of a dataset: the default vocabulary and the search service of the dataset
+    """
+    return [VocabularySearchService(), dataset.get_search_service()]
+
+
+@swagger_auto_schema(methods=['get'])
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def search_cache_stats(request: Request):
+    return JsonResponse(search_cache.stats())
+
+
 @swagger_auto_schema(methods=['post'], manual_parameters=[
     openapi.Parameter('limit', openapi.IN_QUERY, "Limit", type=openapi.TYPE_INTEGER),
     openapi.Parameter('timeout', openapi.IN_QUERY, "Timeout", type=openapi.TYPE_INTEGER),
@@ -149,5 +273,57 @@ def dataset_query(request: Request, id: UUID):
     timeout = int(request.GET.get('timeout', 5000))
     query = request.body.decode('utf-8')
 
-    result = dataset.get_query_service().query(query, limit, timeout)
-    return JsonResponse(result)
+    result, cached = dataset.get_query_service().query_cached(query, limit, timeout)
+    # The result is escaped while it is sent, rather than copied into a response body first
+    response = StreamingHttpResponse(iter_json(result), content_type='application/json')
+    response['X-Cache'] = 'HIT' if cached else 'MISS'
+    return response
+
+
+@swagger_auto_schema(methods=['post'], manual_parameters=[
+    openapi.Parameter('timeout', openapi.IN_QUERY, "Timeout", type=openapi.TYPE_INTEGER),
+], request_body=openapi.Schema(
+    type=openapi.TYPE_STRING,
+    description='Select query to be executed'
+))
+@api_view(['POST'])
+def dataset_query_cursor(request: Request, id: UUID):
+    dataset = Dataset.objects.get(id=id)
+
+    timeout = int(request.GET.get('timeout', 5000))
+    query = request.body.decode('utf-8')
+
+    try:
+        info = create_cursor(dataset.get_query_service(cached=False), dataset.id, query, timeout)
+    except QueryExecutionException as e:
+        raise ValidationError(str(e))
+
+    return JsonResponse(info.to_dict())
+
+
+@swagger_auto_schema(methods=['get'], manual_parameters=[
+    openapi.Parameter('offset', openapi.IN_QUERY, "Offset", type=openapi.TYPE_INTEGER),
+    openapi.Parameter('limit', openapi.IN_QUERY, "Limit", type=openapi.TYPE_INTEGER),
+])
+@api_view(['GET'])
+def dataset_query_page(request: Request, id: UUID, cursor: str):
+    offset = int(request.GET.get('offset', 0))
+    limit = min(int(request.GET.get('limit', 100)), settings.QUERY_CURSOR_MAX_PAGE)
+
+    try:
+        info = get_cursor(cursor)
+        if info.dataset_id != str(id):
+            raise CursorNotFound(cursor)
+        page = read_page(cursor, offset, limit)
+    except CursorNotFound:
+        raise NotFound('Cursor does not exist or has expired')
+
+    next_offset = offset + len(page['results']['bindings'])
+    return JsonResponse({
+        **info.to_dict(),
+        'offset': offset,
+        'next': next_offset if next_offset < info.count else None,
+        'data': {
+            'application/sparql-results+json': json.dumps(page),
+        },
+    })
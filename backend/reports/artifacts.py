@@ -0,0 +1,149 @@
+import gzip
+import hashlib
+import json
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Union, Optional
+
+from shared.logging import get_logger
+from shared.paths import ARTIFACT_DIR
+
+logger = get_logger()
+
+ARTIFACT_REF = '$artifact'
+"""The key which marks a cell output entry in the notebook as a reference to an artifact."""
+
+ARTIFACT_GRACE_PERIOD = 60 * 60
+"""Unreferenced artifacts younger than this (in seconds) are kept, their reference may not be saved yet."""
+
+
+def _artifact_path(report_id: Union[uuid.UUID, str], cell_id: Union[uuid.UUID, str], run: str) -> Path:
+    if not run.isalnum():
+        raise ValueError(f'Invalid artifact run {run}')
+
+    return ARTIFACT_DIR / str(uuid.UUID(str(report_id))) / str(uuid.UUID(str(cell_id))) / f'{run}.json.gz'
+
+
+def is_artifact_ref(value) -> bool:
+    return isinstance(value, dict) and ARTIFACT_REF in value
+
+
+def store_outputs(report_id: Union[uuid.UUID, str], cell_id: Union[uuid.UUID, str], outputs: list) -> Union[dict, list]:
+    """
+    It stores the outputs of a cell run as a compressed artifact on local disk and returns the reference that is kept
+    in the notebook instead. Artifacts are content addressed, so storing the same outputs twice is a no-op.
+    Empty outputs are kept inline. Superseded runs are left in place, see `collect_report_artifacts`.
+
+    :param report_id: The id of the report
+    :param cell_id: The id of the cell
+    :param outputs: The cell outputs
+    :return: The reference to the artifact, or the outputs themselves if they are empty.
+    """
+    if not outputs:
+        return outputs
+
+    data = json.dumps(outputs).encode('utf-8')
+    run = hashlib.sha1(data).hexdigest()
+    path = _artifact_path(report_id, cell_id, run)
+
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with gzip.open(tmp_path, 'wb', compresslevel=6) as f:
+            f.write(data)
+        tmp_path.replace(path)
+
+    return {
+        ARTIFACT_REF: run,
+        'count': len(outputs),
+        'size': len(data),
+    }
+
+
+def load_outputs(report_id: Union[uuid.UUID, str], cell_id: Union[uuid.UUID, str], ref: Union[dict, list]) -> list:
+    """
+    It resolves a cell output entry of the notebook into the cell outputs
+
+    :param report_id: The id of the report
+    :param cell_id: The id of the cell
+    :param ref: The output entry, either an artifact reference or inline outputs
+    :return: The cell outputs.
+    """
+    if not is_artifact_ref(ref):
+        return ref
+
+    try:
+        with gzip.open(_artifact_path(report_id, cell_id, ref[ARTIFACT_REF]), 'rb') as f:
+            return json.loads(f.read())
+    except (FileNotFoundError, ValueError):
+        logger.warning(f'Artifact {ref[ARTIFACT_REF]} of cell {cell_id} in report {report_id} is missing')
+        return []
+
+
+def _map_outputs(notebook: Optional[dict], fn) -> Optional[dict]:
+    outputs = (notebook or {}).get('results', {}).get('outputs', None)
+    if not outputs:
+        return notebook
+
+    return {
+        **notebook,
+        'results': {
+            **notebook['results'],
+            'outputs': {
+                cell_id: fn(cell_id, cell_outputs)
+                for cell_id, cell_outputs in outputs.items()
+            },
+        },
+    }
+
+
+def offload_notebook_outputs(report_id: Union[uuid.UUID, str], notebook: Optional[dict]) -> Optional[dict]:
+    """
+    It moves all the inline cell outputs of a notebook into artifacts
+    """
+    def offload(cell_id, outputs):
+        if is_artifact_ref(outputs):
+            return outputs
+
+        try:
+            return store_outputs(report_id, cell_id, outputs)
+        except ValueError:
+            logger.warning(f'Keeping outputs of cell {cell_id} in report {report_id} inline')
+            return outputs
+
+    return _map_outputs(notebook, offload)
+
+
+def collect_report_artifacts(report_id: Union[uuid.UUID, str], notebook: Optional[dict]):
+    """
+    It removes the artifacts of a report which are no longer referenced by its saved notebook. Recent artifacts are
+    kept regardless, since a cell run may have stored them without having saved the reference yet.
+
+    :param report_id: The id of the report
+    :param notebook: The notebook as saved in the database
+    """
+    outputs = (notebook or {}).get('results', {}).get('outputs', None) or {}
+    referenced = {
+        (cell_id, ref[ARTIFACT_REF])
+        for cell_id, ref in outputs.items()
+        if is_artifact_ref(ref)
+    }
+
+    report_dir = ARTIFACT_DIR / str(uuid.UUID(str(report_id)))
+    deadline = time.time() - ARTIFACT_GRACE_PERIOD
+    for path in report_dir.glob('*/*.json.gz'):
+        run = path.name[:-len('.json.gz')]
+        if (path.parent.name, run) in referenced:
+            continue
+
+        try:
+            if path.stat().st_mtime < deadline:
+                path.unlink(missing_ok=True)
+        except FileNotFoundError:
+            pass
+
+
+def delete_report_artifacts(report_id: Union[uuid.UUID, str]):
+    shutil.rmtree(ARTIFACT_DIR / str(uuid.UUID(str(report_id))), ignore_errors=True)
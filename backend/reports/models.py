@@ -2,14 +2,17 @@ import uuid
 from enum import Enum
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import User
 
 from datasets.models import Dataset
+from reports.artifacts import store_outputs, delete_report_artifacts
 from shared.dict import deepget
 from shared.models import TimeStampMixin
-from shared.query import q_json_update
+from shared.query import q_json_update, json_update_returning
 from shared.websocket import Packet
 from tasks.models import TaskMixin
 from tasks.utils import send_to_group_sync
@@ -59,11 +62,11 @@ class Report(TaskMixin, TimeStampMixin):
 
     @staticmethod
     def update_cell_state(report_id: uuid.UUID, cell_id: uuid.UUID, state: CellState):
-        Report.objects.filter(id=report_id).update(
-            notebook=q_json_update('notebook', ['results', 'states', str(cell_id), 'status'], state.value)
+        state = json_update_returning(
+            Report, report_id, 'notebook',
+            ['results', 'states', str(cell_id), 'status'], state.value,
+            returning=['results', 'states', str(cell_id)],
         )
-        report = Report.objects.get(id=report_id)
-        state = deepget(report.notebook, ['results', 'states', str(cell_id)])
 
         send_to_group_sync(str(report_id), {
             'type': 'task_message',
@@ -75,17 +78,17 @@ class Report(TaskMixin, TimeStampMixin):
 
     @staticmethod
     def update_cell_outputs(report_id: uuid.UUID, cell_id: uuid.UUID, outputs: list):
+        # The outputs are stored out-of-row, the notebook only keeps a reference to them
+        ref = store_outputs(report_id, cell_id, outputs)
         Report.objects.filter(id=report_id).update(
-            notebook=q_json_update('notebook', ['results', 'outputs', str(cell_id)], outputs)
+            notebook=q_json_update('notebook', ['results', 'outputs', str(cell_id)], ref)
         )
-        report = Report.objects.get(id=report_id)
-        result = deepget(report.notebook, ['results', 'outputs', str(cell_id)])
 
         send_to_group_sync(str(report_id), {
             'type': 'task_message',
             'message': Packet(PacketType.CELL_RESULT.value, {
                 'cell_id': str(cell_id),
-                'outputs': result,
+                'outputs': outputs,
             }).dumps()
         })
 
@@ -102,3 +105,16 @@ class Report(TaskMixin, TimeStampMixin):
             self.creator == user or
             self.share_mode != self.ShareModes.PRIVATE
         )
+
+    def get_viewer_ids(self):
+        if self.share_mode != self.ShareModes.PRIVATE:
+            return None
+
+        return [self.creator_id] if self.creator_id else []
+
+
+@receiver(post_delete, sender=Report)
+def handle_report_delete(sender, instance: Report, **kwargs):
+    # Also runs for cascades (e.g. when the dataset is deleted), the artifacts only go once the delete is committed
+    report_id = instance.id
+    transaction.on_commit(lambda: delete_report_artifacts(report_id))
@@ -1,14 +1,46 @@
+from django.db import transaction
 from rest_framework import serializers
 
 from datasets.serializers import DatasetSerializer
+from reports.artifacts import offload_notebook_outputs, collect_report_artifacts
 from reports.models import Report
 from users.serializers import ShortUserSerializer
 
 
 class ReportSerializer(serializers.ModelSerializer):
+    """
+    Serializes a report. Cell outputs are kept out-of-row as artifacts, the notebook only holds references to them.
+    The outputs of a cell are loaded on demand through the `outputs` endpoint of the report.
+    """
     dataset = DatasetSerializer(read_only=True)
     creator = ShortUserSerializer(read_only=True)
 
     class Meta:
         model = Report
         exclude = []
+
+    def create(self, validated_data):
+        instance = super().create(validated_data)
+        notebook = offload_notebook_outputs(instance.id, instance.notebook)
+        if notebook is not instance.notebook:
+            instance.notebook = notebook
+            instance.save(update_fields=['notebook'])
+
+        return instance
+
+    def update(self, instance, validated_data):
+        if 'notebook' in validated_data:
+            validated_data['notebook'] = offload_notebook_outputs(instance.id, validated_data['notebook'])
+
+        instance = super().update(instance, validated_data)
+        if 'notebook' in validated_data:
+            transaction.on_commit(lambda: self.collect_artifacts(instance.id))
+
+        return instance
+
+    @staticmethod
+    def collect_artifacts(report_id):
+        # Read the notebook back, cell runs may have saved newer references since the update
+        notebook = Report.objects.filter(id=report_id).values_list('notebook', flat=True).first()
+        if notebook is not None:
+            collect_report_artifacts(report_id, notebook)
@@ -1,11 +1,14 @@
+import asyncio
 import json
+import threading
 from timeit import default_timer as timer
+from typing import List, Tuple, Optional
 from uuid import UUID
 
 from celery import shared_task
 
 from datasets.models import Dataset, DatasetState
-from datasets.services.query import QueryExecutionException
+from datasets.services.query import QueryExecutionException, AsyncQueryService, TRUNCATED
 from reports.models import Report, CellState
 from shared.logging import get_logger
 from shared.dict import deepget
@@ -51,9 +54,7 @@ def run_cell(report_id: UUID, cell_id: UUID) -> str:
                 outputs, error = run_sparql(dataset, cell.get('source', ''), timeout, limit)
             case _ if cell_type.startswith('widget_'):
                 snapshot = cell.get('data', {})
-                for source in cell.get('source', []):
-                    outputs_s, error = run_sparql(dataset, source, timeout, limit)
-
+                for outputs_s, error in run_sparql_concurrent(dataset, cell.get('source', []), timeout, limit):
                     for output in outputs_s:
                         if output.get('output_type') == 'execute_result':
                             output['snapshot'] = snapshot
@@ -75,20 +76,76 @@ def run_cell(report_id: UUID, cell_id: UUID) -> str:
     Report.update_cell_state(report_id, cell_id, CellState.ERROR if error else CellState.FINISHED)
 
 
+def query_limits(source: str, timeout: int = None, limit: int = None) -> Tuple[Optional[int], int]:
+    """
+    It returns the limit and timeout a cell query runs with. Queries with their own LIMIT clause are not limited.
+    """
+    limit = (limit or DEFAULT_LIMIT) if 'LIMIT ' not in source.upper() else None
+    return limit, timeout or DEFAULT_TIMEOUT
+
+
 def run_sparql(dataset: Dataset, source: str, timeout: int = None, limit: int = None):
     start_time = timer()
-    limit = (limit or DEFAULT_LIMIT) if 'LIMIT ' not in source.upper() else None
-    timeout = timeout or DEFAULT_TIMEOUT
+    limit, timeout = query_limits(source, timeout, limit)
+
+    outputs, error = [], False
+    try:
+        output, cached = dataset.get_query_service().query_cached(source, limit, timeout)
+        outputs.append(result_output(output, cached, float(timer() - start_time)))
+    except QueryExecutionException as e:
+        error = True
+        outputs.append(result_error(e, float(timer() - start_time)))
+
+    return outputs, error
+
+
+def run_sparql_concurrent(
+        dataset: Dataset,
+        sources: List[str],
+        timeout: int = None,
+        limit: int = None
+) -> List[Tuple[list, bool]]:
+    """
+    It runs the queries of a (multi-query) cell concurrently. The results are returned in the order of the sources,
+    up to and including the first one that failed. Queries after it which did not start yet are skipped, running
+    ones are left to finish within their timeout (the store does not stop a query when its client goes away).
+    """
+    if len(sources) <= 1:
+        return [run_sparql(dataset, source, timeout, limit) for source in sources]
+
+    cancelled = threading.Event()
+    service = AsyncQueryService(dataset.get_query_service(), key=str(dataset.id), cancelled=cancelled)
+
+    async def run_all():
+        tasks = [
+            asyncio.create_task(run_sparql_async(service, source, timeout, limit))
+            for source in sources
+        ]
+        results = []
+        try:
+            for task in tasks:
+                outputs, error = await task
+                results.append((outputs, error))
+                if error:
+                    break
+        finally:
+            cancelled.set()
+            for task in tasks:
+                task.cancel()
+
+        return results
+
+    return asyncio.run(run_all())
+
+
+async def run_sparql_async(service: AsyncQueryService, source: str, timeout: int = None, limit: int = None):
+    start_time = timer()
+    limit, timeout = query_limits(source, timeout, limit)
 
     outputs, error = [], False
     try:
-        output = dataset.get_query_service().query(source, limit, timeout)
-        outputs.append({
-            'output_type': 'execute_result',
-            'execute_count': 1,
-            'data': output,
-            'execution_time': float(timer() - start_time)
-        })
+        output, cached = await service.query_cached(source, limit, timeout)
+        outputs.append(result_output(output, cached, float(timer() - start_time)))
     except QueryExecutionException as e:
         error = True
         outputs.append(result_error(e, float(timer() - start_time)))
@@ -96,6 +153,17 @@ def run_sparql(dataset: Dataset, source: str, timeout: int = None, limit: int =
     return outputs, error
 
 
+def result_output(output: dict, cached: bool, duration: float):
+    return {
+        'output_type': 'execute_result',
+        'execute_count': 1,
+        'data': {key: value for key, value in output.items() if key != TRUNCATED},
+        'execution_time': duration,
+        'cached': cached,
+        'truncated': output.get(TRUNCATED, False),
+    }
+
+
 def result_error(e: QueryExecutionException, duration: float):
     return {
         'output_type': 'error',
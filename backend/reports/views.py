@@ -6,12 +6,15 @@ from django.db.models import Q
 from rest_framework import filters
 from rest_framework import viewsets
 from rest_framework.pagination import LimitOffsetPagination
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, action
+from rest_framework.exceptions import NotFound
 from rest_framework.request import Request
+from rest_framework.response import Response
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 
 from backend.settings import OPENAPI_KEY
+from reports.artifacts import load_outputs
 from reports.models import Report
 from reports.permissions import CanEditReport, CanViewReport
 from reports.serializers import ReportSerializer
@@ -52,11 +55,23 @@ class ReportViewSet(viewsets.ModelViewSet):
         if self.action in ['destroy']:
             permissions.append(IsOwner())
 
-        if self.action in ['retrieve']:
+        if self.action in ['retrieve', 'outputs']:
             permissions.append(CanViewReport())
 
         return permissions
 
+    @action(detail=True, methods=['get'], url_path=r'outputs/(?P<cell_id>[^/.]+)')
+    def outputs(self, request: Request, pk=None, cell_id=None):
+        """
+        It returns the outputs of a single cell, which the notebook of the report only references
+        """
+        report: Report = self.get_object()
+        ref = ((report.notebook or {}).get('results', {}).get('outputs', None) or {}).get(cell_id, None)
+        if ref is None:
+            raise NotFound(f'Cell {cell_id} has no outputs')
+
+        return Response(load_outputs(report.id, cell_id, ref))
+
 
 @swagger_auto_schema(methods=['post'], request_body=openapi.Schema(
     type=openapi.TYPE_OBJECT,
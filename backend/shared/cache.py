@@ -0,0 +1,217 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional, Hashable, Callable
+
+from shared.random import random_string
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    size: int
+    expires_at: float
+    tag: Optional[Hashable] = None
+
+
+class LRUCache:
+    """
+    A thread-safe in-process LRU cache with per-entry TTL, an entry count limit and a byte budget.
+    Entries can be tagged (for example with a dataset id) so that they can be invalidated as a group.
+    """
+
+    def __init__(
+            self,
+            max_entries: int = 1024,
+            max_bytes: int = 64 * 1024 * 1024,
+            ttl: float = 300,
+            size_fn: Callable[[Any], int] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size_fn = size_fn or (lambda value: 1)
+        self.size = 0
+        self._entries: 'OrderedDict[Hashable, CacheEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            if entry.expires_at < time.monotonic():
+                self._remove(key)
+                return default
+
+            self._entries.move_to_end(key)
+            return entry.value
+
+    def set(self, key: Hashable, value: Any, ttl: float = None, tag: Hashable = None) -> bool:
+        size = self.size_fn(value)
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = CacheEntry(
+                value=value,
+                size=size,
+                expires_at=time.monotonic() + (ttl if ttl is not None else self.ttl),
+                tag=tag,
+            )
+            self.size += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+        return True
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidate(self, tag: Hashable) -> int:
+        """
+        It removes all the entries with the given tag
+
+        :param tag: The tag of the entries to remove
+        :return: The number of removed entries.
+        """
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if entry.tag == tag]
+            for key in keys:
+                self._remove(key)
+
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self.size -= entry.size
+
+
+class TieredCache:
+    """
+    A bounded in-process LRU cache in front of a shared Django cache. Entries belong to a namespace (for example a
+    dataset) and are keyed on the current generation of that namespace, so bumping the generation invalidates all of
+    its entries in every process at once. The generations are kept in-process for `generation_ttl` seconds, which
+    means a hot hit never reaches the shared cache, and other processes see an invalidation within that time.
+    """
+
+    def __init__(
+            self,
+            prefix: str,
+            alias: str = 'default',
+            max_entries: int = 1024,
+            max_bytes: int = 64 * 1024 * 1024,
+            ttl: float = 300,
+            shared_ttl: float = 60 * 60 * 24,
+            generation_ttl: float = 5,
+            size_fn: Callable[[Any], int] = None,
+    ):
+        self.prefix = prefix
+        self.alias = alias
+        self.shared_ttl = shared_ttl
+        self.local = LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl, size_fn=size_fn)
+        self.generations = LRUCache(max_entries=max_entries, ttl=generation_ttl)
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def _generation_key(self, namespace: str) -> str:
+        return f'{self.prefix}:generation:{namespace}'
+
+    def generation(self, namespace: str) -> str:
+        """
+        It returns the current generation of a namespace. Generations are random rather than sequential, so an
+        evicted generation can never bring back the entries of an older one.
+        """
+        generation = self.generations.get(namespace)
+        if generation is None:
+            key = self._generation_key(namespace)
+            generation = self.shared.get(key)
+            if generation is None:
+                self.shared.add(key, random_string(12), timeout=None)
+                generation = self.shared.get(key)
+            self.generations.set(namespace, generation)
+
+        return generation
+
+    def _key(self, namespace: str, key: str, generation: Optional[str] = None) -> str:
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return f'{self.prefix}:{namespace}:{generation or self.generation(namespace)}:{digest}'
+
+    def get(self, namespace: str, key: str, default=None, generation: Optional[str] = None):
+        """
+        It looks up an entry in the local and then the shared cache. A value computed after a miss should be stored
+        with the generation of the lookup, so that it is dropped if the namespace was invalidated in the meantime.
+
+        :param namespace: The namespace of the entry
+        :param key: The key of the entry
+        :param default: The value returned on a miss
+        :param generation: The generation to look in, defaults to the current generation of the namespace
+        """
+        full_key = self._key(namespace, key, generation)
+        value = self.local.get(full_key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+
+        value = self.shared.get(full_key)
+        if value is not None:
+            self._count('shared_hits')
+            self.local.set(full_key, value, tag=namespace)
+            return value
+
+        self._count('misses')
+        return default
+
+    def set(self, namespace: str, key: str, value: Any, generation: Optional[str] = None):
+        full_key = self._key(namespace, key, generation)
+        self.local.set(full_key, value, tag=namespace)
+        self.shared.set(full_key, value, timeout=self.shared_ttl)
+
+    def invalidate(self, namespace: str):
+        """
+        It invalidates all the entries of a namespace by moving it to a new generation
+        """
+        generation = random_string(12)
+        self.shared.set(self._generation_key(namespace), generation, timeout=None)
+        self.generations.set(namespace, generation)
+        self.local.invalidate(namespace)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.local_hits + self.shared_hits + self.misses
+            return {
+                'local_hits': self.local_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': (self.local_hits + self.shared_hits) / lookups if lookups else 0.0,
+                'entries': len(self.local),
+                'bytes': self.local.size,
+            }
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
@@ -0,0 +1,228 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+from pathlib import Path
+from typing import List, Optional, Tuple, Iterator
+from urllib.parse import urlparse, unquote
+
+from requests import Response, RequestException
+
+from backend import settings
+from shared.http import get_session
+from shared.logging import get_logger
+from shared.random import random_string
+
+logger = get_logger()
+
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = (10, 60)
+
+
+class DownloadError(Exception):
+    pass
+
+
+def prepare_url(url: str) -> str:
+    """
+    It rewrites the url of a (github) page to the url of the raw file
+    """
+    if 'github.com' in url and 'raw' not in url:
+        logger.info(f"Downloading from github raw")
+        url += ('&raw=true' if urlparse(url).query else '?raw=true')
+
+    return url
+
+
+def filename_from_response(response: Response) -> str:
+    """
+    It infers the name of the downloaded file from the Content-Disposition header, falling back to the url path
+
+    :param response: The response of the download request
+    :type response: Response
+    :return: The file name.
+    """
+    filename = None
+    disposition = response.headers.get('Content-Disposition', None)
+    if disposition:
+        message = Message()
+        message['Content-Disposition'] = disposition
+        filename = message.get_filename()
+
+    if not filename:
+        filename = unquote(os.path.basename(urlparse(response.url).path))
+
+    # Never let the server pick a path outside the download folder
+    return os.path.basename(filename.replace('\\', '/')) or 'download'
+
+
+def _content_range(response: Response) -> Tuple[Optional[int], bool]:
+    """
+    It returns the total size of the file and whether the server accepts range requests
+    """
+    accepts_ranges = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+    if response.status_code == 206:
+        total = response.headers.get('Content-Range', '').rpartition('/')[2]
+        return (int(total) if total.isdigit() else None), True
+
+    length = response.headers.get('Content-Length', None)
+    encoded = response.headers.get('Content-Encoding', 'identity') != 'identity'
+    return (int(length) if length and length.isdigit() and not encoded else None), accepts_ranges
+
+
+def _write_segment(response: Response, path: Path, start: int, end: Optional[int]) -> Iterator[int]:
+    """
+    It streams a response body into the file at the given offset, stopping at the end of the segment.
+    The number of bytes is yielded after every written chunk, so the caller knows where to resume on failure.
+    """
+    written = 0
+    with path.open('r+b') as f:
+        f.seek(start)
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if end is not None and start + written + len(chunk) > end:
+                chunk = chunk[:end - start - written]
+            f.write(chunk)
+            written += len(chunk)
+            yield len(chunk)
+            if end is not None and start + written >= end:
+                break
+
+        if end is None:
+            f.truncate(start + written)
+
+
+def _download_segment(
+        url: str,
+        path: Path,
+        start: int,
+        end: Optional[int],
+        response: Response = None,
+        resumable: bool = True,
+):
+    """
+    It downloads the byte range [start, end) of a url into the file. Interrupted transfers are resumed with a range
+    request from the last written byte, or restarted if the server does not support range requests.
+    """
+    retries = 0
+    initial_start = start
+    while end is None or start < end:
+        try:
+            if response is None:
+                # Without range support the whole body is fetched again, it is written from the start of the segment
+                byte_range = f'bytes={start}-{end - 1}' if end is not None else f'bytes={start}-'
+                headers = {'Range': byte_range} if resumable else {}
+                response = get_session(url).get(url, headers=headers, stream=True, timeout=TIMEOUT)
+                response.raise_for_status()
+                if resumable and response.status_code != 206 and start > 0:
+                    raise DownloadError(f'Server ignored range request for {url}')
+
+            written = 0
+            with response:
+                for count in _write_segment(response, path, start, end):
+                    start += count
+                    written += count
+            response = None
+
+            if end is None:
+                return
+            if written == 0 or (not resumable and start < end):
+                raise DownloadError(f'Unexpected end of data for {url} at byte {start}')
+        except (RequestException, DownloadError) as e:
+            response = None
+            if not resumable:
+                start = initial_start
+            retries += 1
+            if retries > settings.DOWNLOAD_RETRIES:
+                raise DownloadError(f'Failed to download {url}: {e}') from e
+            logger.warning(f'Resuming download of {url} at byte {start} ({retries}/{settings.DOWNLOAD_RETRIES}): {e}')
+
+
+def download_file(url: str, folder: Path) -> Path:
+    """
+    It downloads a file into a new subfolder of the given folder. The file name is taken from the same response that is
+    downloaded. Large files are split into segments which are downloaded in parallel with range requests, and
+    interrupted transfers are resumed where they stopped.
+
+    :param url: The url of the file
+    :type url: str
+    :param folder: The folder to download the file into
+    :type folder: Path
+    :return: The path of the downloaded file.
+    """
+    url = prepare_url(url)
+    download_folder = folder / random_string(10)
+    download_folder.mkdir(parents=True)
+
+    response = get_session(url).get(url, stream=True, timeout=TIMEOUT)
+    try:
+        response.raise_for_status()
+    except RequestException as e:
+        response.close()
+        raise DownloadError(f'Failed to download {url}: {e}') from e
+
+    path = download_folder / filename_from_response(response)
+    size, accepts_ranges = _content_range(response)
+    # Range requests go to the final location of the file, after redirects
+    url = response.url
+    logger.info(f"Downloading {url} ({size if size is not None else 'unknown'} bytes) to {path}")
+
+    with path.open('wb') as f:
+        if size is not None:
+            f.truncate(size)
+
+    try:
+        if size is None or not accepts_ranges:
+            _download_segment(url, path, 0, size, response, resumable=accepts_ranges)
+            return path
+
+        # Every segment holds a connection of the pool of the host
+        segments = max(1, min(
+            settings.DOWNLOAD_SEGMENTS, settings.HTTP_POOL_MAXSIZE, size // settings.DOWNLOAD_SEGMENT_MIN_SIZE
+        ))
+        bounds = [size * i // segments for i in range(segments + 1)]
+        if segments == 1:
+            _download_segment(url, path, 0, size, response)
+            return path
+
+        # The initial response already streams the first segment, the others are fetched with range requests
+        with ThreadPoolExecutor(max_workers=segments - 1) as executor:
+            futures = [
+                executor.submit(_download_segment, url, path, bounds[i], bounds[i + 1])
+                for i in range(1, segments)
+            ]
+            _download_segment(url, path, bounds[0], bounds[1], response)
+            for future in futures:
+                future.result()
+
+        return path
+    except Exception:
+        logger.error(f"Failed to download {url}")
+        if not settings.DEBUG:
+            shutil.rmtree(download_folder, ignore_errors=True)
+        raise
+
+
+def download_files(urls: List[str], folder: Path) -> List[Path]:
+    """
+    It downloads multiple files concurrently (at most DOWNLOAD_CONCURRENCY at a time)
+
+    :param urls: The urls of the files
+    :type urls: List[str]
+    :param folder: The folder to download the files into
+    :type folder: Path
+    :return: The paths of the downloaded files, in the order of the urls.
+    """
+    if not urls:
+        return []
+
+    with ThreadPoolExecutor(
+        max_workers=min(len(urls), settings.DOWNLOAD_CONCURRENCY),
+        thread_name_prefix='download',
+    ) as executor:
+        futures = [executor.submit(download_file, url, folder) for url in urls]
+        try:
+            return [future.result() for future in futures]
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
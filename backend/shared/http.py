@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+import weakref
+from typing import Dict, Tuple
+from urllib.parse import urlparse
+
+from requests import Session, Response
+from requests.adapters import HTTPAdapter
+
+from backend import settings
+from shared.logging import get_logger
+
+logger = get_logger()
+
+USER_AGENT = 'https://github.com/EgorDm/BOLD'
+"""The user agent sent with every outgoing request."""
+
+_sessions: Dict[Tuple[int, str], 'PooledSession'] = {}
+_sessions_lock = threading.Lock()
+
+
+class PooledSession(Session):
+    """
+    A keep-alive session bound to a single endpoint (scheme and host). Connections are kept in a bounded pool and the
+    session is evicted from the registry once it becomes unhealthy or exceeds its maximum age. Evicted sessions may
+    still be in use by other threads, so their connections are only closed once the session is no longer referenced.
+    """
+    key: Tuple[int, str]
+    created_at: float
+    failures: int
+
+    def __init__(self, key: Tuple[int, str]):
+        super().__init__()
+        self.key = key
+        self.created_at = time.monotonic()
+        self.failures = 0
+
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+            pool_block=False,
+        )
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+        self.headers['User-Agent'] = USER_AGENT
+        weakref.finalize(self, adapter.close)
+
+    def send(self, request, **kwargs) -> Response:
+        try:
+            response = super().send(request, **kwargs)
+        except Exception:
+            self.mark_failure()
+            raise
+
+        if response.status_code >= 500:
+            self.mark_failure()
+        else:
+            self.failures = 0
+        return response
+
+    def mark_failure(self):
+        self.failures += 1
+        if self.failures >= settings.HTTP_POOL_MAX_FAILURES:
+            logger.warning(f'Evicting unhealthy session for {self.key[1]} after {self.failures} failures')
+            evict_session(self)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() - self.created_at > settings.HTTP_POOL_MAX_AGE
+
+
+def _endpoint_key(url: str) -> Tuple[int, str]:
+    parsed = urlparse(url)
+    # Sessions are keyed by pid as well, since pooled sockets must not be shared with forked celery workers
+    return os.getpid(), f'{parsed.scheme}://{parsed.netloc}'
+
+
+def get_session(url: str) -> PooledSession:
+    """
+    It returns a process-wide pooled session for the endpoint of the given url, creating it if necessary
+
+    :param url: The url (or endpoint) the session will be used for
+    :type url: str
+    :return: A pooled session.
+    """
+    key = _endpoint_key(url)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is not None and session.expired:
+            _sessions.pop(key)
+            session = None
+
+        if session is None:
+            session = _sessions[key] = PooledSession(key)
+
+    return session
+
+
+def evict_session(session: PooledSession):
+    """
+    It removes the session from the registry, requests in flight on it finish and its pooled connections are closed
+    once it is no longer referenced
+
+    :param session: The session to evict
+    :type session: PooledSession
+    """
+    with _sessions_lock:
+        if _sessions.get(session.key) is session:
+            _sessions.pop(session.key)
+
+
+def follow_redirects(session: Session, response: Response, max_redirects: int = 3, **kwargs) -> Response:
+    """
+    It re-sends the original request to the redirect location over the same session (and thus the same connection pool)
+
+    :param session: The session to send the redirected requests with
+    :type session: Session
+    :param response: The initial response
+    :type response: Response
+    :param max_redirects: The maximum number of redirects to follow, defaults to 3
+    :type max_redirects: int (optional)
+    :return: The final response.
+    """
+    retry_count = 0
+    while response.status_code // 100 == 3 and retry_count < max_redirects:
+        request = response.request
+        request.url = response.headers.get('Location')
+        response.close()
+        response = session.send(request, allow_redirects=False, **kwargs)
+        retry_count += 1
+
+    return response
@@ -15,5 +15,22 @@ EXPORT_DIR = settings.STORAGE_DIR / 'export'
 DATA_DIR = settings.STORAGE_DIR / 'data'
 """The path to the data directory."""
 
+CURSOR_DIR = settings.STORAGE_DIR / 'cursors'
+"""The path to the directory where paginated query results are spilled."""
+
+ARTIFACT_DIR = settings.STORAGE_DIR / 'artifacts'
+"""The path to the directory where report cell outputs are stored."""
+
+SNAPSHOT_DIR = settings.STORAGE_DIR / 'snapshots'
+"""The path to the directory where the triples of imported datasets are kept for incremental refreshes."""
+
 DEFAULT_SEARCH_INDEX_NAME = 'search_index_default'
 """The name of the default search index."""
+
+DEFAULT_VOCABULARY_FILES = [
+    settings.BASE_DIR / 'data' / 'rdf.csv',
+    settings.BASE_DIR / 'data' / 'rdfs.csv',
+    settings.BASE_DIR / 'data' / 'owl.csv',
+    settings.BASE_DIR / 'data' / 'foaf.csv',
+]
+"""The terms files of the default vocabulary, which is searched next to every dataset."""
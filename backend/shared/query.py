@@ -1,6 +1,7 @@
 import json
-from typing import List, Any
+from typing import List, Any, Type
 
+from django.db import connection, models
 from django.db.models.expressions import RawSQL
 
 
@@ -25,3 +26,55 @@ def q_json_update(field: str, key: List[str], value: Any) -> RawSQL:
         f'{{{key}}}',
         json.dumps(value),
     ])
+
+
+def json_update_returning(
+        model: Type[models.Model],
+        pk: Any,
+        field: str,
+        key: List[str],
+        value: Any,
+        returning: List[str] = None,
+) -> Any:
+    """
+    It updates the JSON field of a single row at the given keys and returns the value at the `returning` keys in the
+    same statement (using UPDATE ... RETURNING), so that the row doesn't need to be fetched again after the update
+
+    :param model: The model of the row to update
+    :type model: Type[models.Model]
+    :param pk: The primary key of the row to update
+    :type pk: Any
+    :param field: The field to update
+    :type field: str
+    :param key: The key to update
+    :type key: List[str]
+    :param value: The value to be inserted into the JSON field
+    :type value: Any
+    :param returning: The key of the value to return, defaults to the updated key
+    :type returning: List[str]
+    :return: The value at the returning key after the update, or None if the row does not exist.
+    """
+    key = ','.join(key)
+    returning = ','.join(returning) if returning else key
+    table = connection.ops.quote_name(model._meta.db_table)
+    pk_column = connection.ops.quote_name(model._meta.pk.column)
+    field = connection.ops.quote_name(field)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            UPDATE {table}
+            SET {field} = jsonb_set({field}::jsonb, %s::text[], %s::jsonb, true)
+            WHERE {pk_column} = %s
+            RETURNING {field}::jsonb #> %s::text[]
+        ''', [
+            f'{{{key}}}',
+            json.dumps(value),
+            model._meta.pk.get_db_prep_value(pk, connection),
+            f'{{{returning}}}',
+        ])
+        row = cursor.fetchone()
+
+    if row is None or row[0] is None:
+        return None
+
+    return json.loads(row[0]) if isinstance(row[0], str) else row[0]
@@ -0,0 +1,159 @@
+import asyncio
+import select
+import socket
+import threading
+from typing import Union, List, Optional
+from urllib.parse import urlparse
+
+RespValue = Union[bytes, int, str, None, List['RespValue']]
+
+
+class RespError(Exception):
+    pass
+
+
+def encode_command(*args: Union[str, bytes, int]) -> bytes:
+    """
+    It encodes a command as a RESP (redis serialization protocol) array of bulk strings
+
+    :param args: The command name and its arguments
+    :return: The encoded command.
+    """
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode('utf-8')
+        elif isinstance(arg, int):
+            arg = str(arg).encode('utf-8')
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+
+    return b''.join(parts)
+
+
+def _parse_line(line: bytes) -> tuple:
+    if not line.endswith(b'\r\n'):
+        raise ConnectionError('Connection closed by RESP server')
+    return line[:1], line[1:-2]
+
+
+async def read_reply(reader: asyncio.StreamReader) -> RespValue:
+    """
+    It reads a single RESP value from an asyncio stream
+    """
+    kind, value = _parse_line(await reader.readline())
+    match kind:
+        case b'+':
+            return value.decode('utf-8')
+        case b'-':
+            raise RespError(value.decode('utf-8'))
+        case b':':
+            return int(value)
+        case b'$':
+            length = int(value)
+            if length < 0:
+                return None
+            return (await reader.readexactly(length + 2))[:-2]
+        case b'*':
+            length = int(value)
+            if length < 0:
+                return None
+            return [await read_reply(reader) for _ in range(length)]
+        case _:
+            raise RespError(f'Unknown RESP type {kind!r}')
+
+
+def read_reply_sync(stream) -> RespValue:
+    """
+    It reads a single RESP value from a blocking (socket) file object
+    """
+    kind, value = _parse_line(stream.readline())
+    match kind:
+        case b'+':
+            return value.decode('utf-8')
+        case b'-':
+            raise RespError(value.decode('utf-8'))
+        case b':':
+            return int(value)
+        case b'$':
+            length = int(value)
+            if length < 0:
+                return None
+            return stream.read(length + 2)[:-2]
+        case b'*':
+            length = int(value)
+            if length < 0:
+                return None
+            return [read_reply_sync(stream) for _ in range(length)]
+        case _:
+            raise RespError(f'Unknown RESP type {kind!r}')
+
+
+def parse_address(url: str) -> tuple:
+    """
+    It parses a `redis://host:port` (or `tcp://host:port`) url into a (host, port) address
+    """
+    parsed = urlparse(url)
+    return parsed.hostname or 'localhost', parsed.port or 6379
+
+
+class RespClient:
+    """
+    A minimal blocking RESP client which keeps a single connection open. It is thread-safe and reconnects if the
+    connection was dropped, but a command is only sent again if it never reached the server.
+    """
+
+    def __init__(self, url: str, timeout: float = 5):
+        self.address = parse_address(url)
+        self.timeout = timeout
+        self._socket: Optional[socket.socket] = None
+        self._stream = None
+        self._lock = threading.Lock()
+
+    def execute(self, *args) -> RespValue:
+        command = encode_command(*args)
+        with self._lock:
+            try:
+                self._send(command)
+            except OSError:
+                # The command was not (fully) sent, so the server did not execute it
+                self._close()
+                self._send(command)
+
+            try:
+                return read_reply_sync(self._stream)
+            except OSError:
+                # The command may have been executed, sending it again could for example publish an event twice
+                self._close()
+                raise
+
+    def publish(self, channel: str, message: bytes) -> int:
+        return self.execute('PUBLISH', channel, message)
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _send(self, command: bytes):
+        if self._socket is not None and self._is_stale():
+            self._close()
+
+        if self._socket is None:
+            self._socket = socket.create_connection(self.address, timeout=self.timeout)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._stream = self._socket.makefile('rb')
+
+        self._socket.sendall(command)
+
+    def _is_stale(self) -> bool:
+        # No reply is pending between commands, so a readable socket was closed by the server (or is out of sync)
+        readable, _, _ = select.select([self._socket], [], [], 0)
+        return bool(readable)
+
+    def _close(self):
+        if self._socket is not None:
+            try:
+                self._stream.close()
+                self._socket.close()
+            finally:
+                self._socket = None
+                self._stream = None
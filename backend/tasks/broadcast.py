@@ -0,0 +1,214 @@
+import atexit
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import List, Tuple, Optional
+
+from asgiref.sync import async_to_sync
+from celery.signals import worker_process_shutdown
+from channels.layers import get_channel_layer
+from channels_postgres.core import PostgresChannelLayer
+from django.conf import settings
+from django.db import connection
+
+from shared.logging import get_logger
+from shared.resp import RespClient
+from tasks.layers import SocketChannelLayer
+
+logger = get_logger()
+
+
+class BroadcastBackend(ABC):
+    """
+    Delivers messages from synchronous code (celery workers, signal handlers) to the websocket consumers of a group.
+    The backend is chosen to match the configured channel layer.
+    """
+
+    @abstractmethod
+    def send_group(self, group: str, message: dict):
+        pass
+
+    def flush(self):
+        pass
+
+
+def send_to_groups_sync(cur, messages: List[Tuple[str, bytes]], expire):
+    """
+    It inserts the given (group key, message) pairs for every channel of their group into the channel layer message
+    table, resolving the group members within the same statement. Messages keep the order in which they were given.
+    """
+    if not messages:
+        return
+
+    values_str = b','.join(
+        cur.mogrify('(%s, %s, %s)', (group_key, message, position))
+        for position, (group_key, message) in enumerate(messages)
+    )
+    group_keys = list(dict.fromkeys(group_key for group_key, _ in messages))
+    insert_message_sql = (
+        b'INSERT INTO channels_postgres_message (channel, message, expire) '
+        b'SELECT member.channel, pending.message, ' +
+        cur.mogrify("(NOW() + INTERVAL '%s seconds') ", (expire,)) +
+        b'FROM (VALUES ' + values_str + b') AS pending (group_key, message, position) '
+        b'JOIN (SELECT DISTINCT group_key, channel FROM channels_postgres_groupchannel ' +
+        cur.mogrify('WHERE group_key = ANY(%s)) AS member ', (group_keys,)) +
+        b'ON member.group_key = pending.group_key ORDER BY pending.position;'
+    )
+    cur.execute(insert_message_sql)
+
+
+class GroupBroadcaster:
+    """
+    Coalesces group messages sent within a short window and flushes them to the postgres channel layer in one
+    statement, which also looks up the channels of the groups.
+    """
+
+    def __init__(self, window: float, max_batch: int):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: List[Tuple[str, bytes]] = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+
+    def send(self, group_key: str, message: bytes):
+        if self.window <= 0:
+            self._flush([(group_key, message)])
+            return
+
+        with self._cond:
+            self._ensure_thread()
+            # Identical messages to the same group within a window are delivered once, at their latest position
+            if (group_key, message) in self._pending:
+                self._pending.remove((group_key, message))
+            self._pending.append((group_key, message))
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+    def flush(self):
+        with self._cond:
+            batch, self._pending = self._pending, []
+        self._flush(batch)
+
+    def _ensure_thread(self):
+        # The flusher thread does not survive a fork, so every (celery worker) process starts its own
+        if self._pid == os.getpid():
+            return
+
+        self._pid = os.getpid()
+        self._pending = []
+        threading.Thread(target=self._run, name='group-broadcaster', daemon=True).start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch, self._pending = self._pending, []
+
+            try:
+                self._flush(batch)
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                connection.close_if_unusable_or_obsolete()
+
+    def _flush(self, batch: List[Tuple[str, bytes]]):
+        if not batch:
+            return
+
+        channel_layer: PostgresChannelLayer = get_channel_layer()
+        with self._flush_lock, connection.cursor() as cur:
+            send_to_groups_sync(cur, batch, channel_layer.expiry)
+
+
+class PostgresBroadcastBackend(BroadcastBackend):
+    """
+    Writes messages directly into the tables of the postgres channel layer, coalescing bursts of messages.
+    """
+
+    def __init__(self, channel_layer: PostgresChannelLayer):
+        self.channel_layer = channel_layer
+        self.broadcaster = GroupBroadcaster(
+            window=settings.BROADCAST_WINDOW_MS / 1000,
+            max_batch=settings.BROADCAST_MAX_BATCH,
+        )
+
+    def send_group(self, group: str, message: dict):
+        assert self.channel_layer.valid_group_name(group), "Group name not valid"
+        group_key = self.channel_layer._group_key(group)
+        self.broadcaster.send(group_key, self.channel_layer.serialize(message))
+
+    def flush(self):
+        self.broadcaster.flush()
+
+
+class SocketBroadcastBackend(BroadcastBackend):
+    """
+    Publishes messages to the pub/sub server of the socket channel layer over a single blocking connection.
+    """
+
+    def __init__(self, channel_layer: SocketChannelLayer):
+        self.channel_layer = channel_layer
+        self.client = RespClient(channel_layer.url)
+
+    def send_group(self, group: str, message: dict):
+        assert self.channel_layer.valid_group_name(group), "Group name not valid"
+        self.client.publish(self.channel_layer.group_topic(group), self.channel_layer.serialize(message))
+
+
+class ChannelLayerBroadcastBackend(BroadcastBackend):
+    """
+    Sends messages through the generic channel layer api (for example with the in-memory channel layer, which only
+    reaches consumers in the same process).
+    """
+
+    def __init__(self, channel_layer):
+        self.channel_layer = channel_layer
+
+    def send_group(self, group: str, message: dict):
+        async_to_sync(self.channel_layer.group_send)(group, message)
+
+
+_backend: Optional[Tuple[int, BroadcastBackend]] = None
+_backend_lock = threading.Lock()
+
+
+def get_broadcast_backend() -> BroadcastBackend:
+    """
+    It returns the broadcast backend of this process, matching the configured channel layer
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None or _backend[0] != os.getpid():
+            channel_layer = get_channel_layer()
+            if isinstance(channel_layer, PostgresChannelLayer):
+                backend = PostgresBroadcastBackend(channel_layer)
+            elif isinstance(channel_layer, SocketChannelLayer):
+                backend = SocketBroadcastBackend(channel_layer)
+            else:
+                backend = ChannelLayerBroadcastBackend(channel_layer)
+            _backend = (os.getpid(), backend)
+
+        return _backend[1]
+
+
+@atexit.register
+def _flush_backend():
+    if _backend is not None and _backend[0] == os.getpid():
+        _backend[1].flush()
+
+
+@worker_process_shutdown.connect
+def _flush_worker_backend(**kwargs):
+    # Prefork pool processes exit with os._exit, which skips the atexit hooks
+    _flush_backend()
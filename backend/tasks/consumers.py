@@ -1,31 +1,36 @@
-from typing import Any
+from typing import Any, List
 
 from asgiref.sync import async_to_sync
 from channels.generic.websocket import WebsocketConsumer
 
 from shared.logging import get_logger
 from shared.websocket import Packet
-from tasks.models import Task
-from tasks.serializers import TaskSerializer
+from tasks.models import TASKS_PUBLIC_GROUP, TASKS_SUPERUSER_GROUP, task_user_group
 
 logger = get_logger()
 
-GLOBAL_TASKS_GROUP = 'TASKS_GLOBAL'
-
 
 class TasksConsumer(WebsocketConsumer):
+    event_groups: List[str]
+
     def connect(self):
         self.user = self.scope["user"]
+        self.last_updated = {}
+
+        # Every group only receives the events of tasks its members are allowed to view
+        self.event_groups = [TASKS_PUBLIC_GROUP]
+        if self.user.is_superuser:
+            self.event_groups.append(TASKS_SUPERUSER_GROUP)
+        if self.user.id is not None:
+            self.event_groups.append(task_user_group(self.user.id))
 
-        async_to_sync(self.channel_layer.group_add)(
-            str(GLOBAL_TASKS_GROUP), self.channel_name
-        )
+        for group in self.event_groups:
+            async_to_sync(self.channel_layer.group_add)(group, self.channel_name)
         self.accept()
 
     def disconnect(self, close_code):
-        async_to_sync(self.channel_layer.group_discard)(
-            str(GLOBAL_TASKS_GROUP), self.channel_name
-        )
+        for group in self.event_groups:
+            async_to_sync(self.channel_layer.group_discard)(group, self.channel_name)
 
     def receive(self, text_data):
         packet = Packet.loads_json(text_data)
@@ -35,6 +40,14 @@ class TasksConsumer(WebsocketConsumer):
         self.send(text_data=Packet(type, data).dumps())
 
     def task_updated(self, event):
-        task: Task = Task.objects.get(task_id=event['message'])
-        if task.can_view(self.user):
-            self.send_packet('TASK_UPDATED', TaskSerializer(task).data)
+        task = event['message']
+
+        # The same event arrives once for every group of the consumer it was published to
+        task_id, updated_at = task.get('task_id'), task.get('updated_at')
+        if updated_at is not None and self.last_updated.get(task_id) == updated_at:
+            return
+        if len(self.last_updated) > 1000:
+            self.last_updated.clear()
+        self.last_updated[task_id] = updated_at
+
+        self.send_packet('TASK_UPDATED', task)
@@ -0,0 +1,119 @@
+import atexit
+import os
+import threading
+import time
+from typing import Optional, Set
+
+from django.conf import settings
+from django.db import connection
+
+from shared.logging import get_logger
+from tasks.models import Task
+from tasks.serializers import TaskSerializer
+from tasks.utils import send_to_group_sync
+
+logger = get_logger()
+
+
+def publish_task_event(task: Task):
+    """
+    It sends the current state of a task to all the groups whose members can view it
+
+    :param task: The task to publish
+    """
+    # The task is serialized once here, consumers only forward the payload to the users in their groups
+    message = {
+        'type': 'task_updated',
+        'message': dict(TaskSerializer(task).data),
+    }
+    for group in task.get_event_groups():
+        send_to_group_sync(group, message)
+
+
+class TaskEventCoalescer:
+    """
+    Collects the ids of updated tasks and publishes the latest state of each of them once per window, so that a burst
+    of state transitions (created, published, started, finished) of a short task results in a single broadcast.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._pending: Set[str] = set()
+        self._cond = threading.Condition()
+        self._pid = None
+
+    def schedule(self, task_id):
+        if self.window <= 0:
+            self._publish({str(task_id)})
+            return
+
+        with self._cond:
+            self._ensure_thread()
+            self._pending.add(str(task_id))
+            self._cond.notify()
+
+    def flush(self):
+        with self._cond:
+            batch, self._pending = self._pending, set()
+        self._publish(batch)
+
+    def _ensure_thread(self):
+        # The flusher thread does not survive a fork, so every (celery worker) process starts its own
+        if self._pid == os.getpid():
+            return
+
+        self._pid = os.getpid()
+        self._pending = set()
+        threading.Thread(target=self._run, name='task-events', daemon=True).start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+
+            time.sleep(self.window)
+            with self._cond:
+                batch, self._pending = self._pending, set()
+
+            try:
+                self._publish(batch)
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                connection.close_if_unusable_or_obsolete()
+
+    def _publish(self, task_ids: Set[str]):
+        if not task_ids:
+            return
+
+        tasks = Task.objects.filter(task_id__in=task_ids).select_related('creator', 'content_type')
+        for task in tasks:
+            publish_task_event(task)
+
+
+_coalescer: Optional[TaskEventCoalescer] = None
+
+
+def schedule_task_event(task_id):
+    """
+    It publishes the state of a task to its websocket groups after the coalescing window
+
+    :param task_id: The id of the updated task
+    """
+    global _coalescer
+    if _coalescer is None:
+        _coalescer = TaskEventCoalescer(settings.TASK_EVENT_WINDOW_MS / 1000)
+
+    _coalescer.schedule(task_id)
+
+
+def flush_task_events():
+    if _coalescer is not None:
+        _coalescer.flush()
+
+
+@atexit.register
+def _flush_task_events():
+    if _coalescer is not None and _coalescer._pid in (None, os.getpid()):
+        flush_task_events()
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import uuid
+import weakref
+from typing import Dict, Set, Optional
+
+from channels.layers import BaseChannelLayer
+
+from shared.logging import get_logger
+from shared.random import random_string
+from shared.resp import encode_command, read_reply, parse_address
+
+logger = get_logger()
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        self.lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def usable(self) -> bool:
+        return not self.writer.is_closing() and self.loop is asyncio.get_running_loop()
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+        self.writer.close()
+
+
+class SocketChannelLayer(BaseChannelLayer):
+    """
+    A push based channel layer on top of a RESP (redis compatible) publish/subscribe server.
+    Every channel and group maps onto a pub/sub topic, messages are delivered to the processes that subscribed to it
+    without any polling. Either a redis server or the bundled `broadcast_broker` command can serve as the server.
+    Messages are serialized as JSON.
+    """
+    extensions = ['groups', 'flush']
+
+    def __init__(self, url: str = 'redis://localhost:6379', prefix: str = 'bold', expiry=60, capacity=100,
+                 channel_capacity=None):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.url = url
+        self.prefix = prefix
+        self.client_prefix = uuid.uuid4().hex
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._groups: Dict[str, Set[str]] = {}
+        self._subscriber: Optional[_Connection] = None
+        self._publisher: Optional[_Connection] = None
+        self._connect_locks = weakref.WeakKeyDictionary()
+
+    def channel_topic(self, channel: str) -> str:
+        return f'{self.prefix}:channel:{channel}'
+
+    def group_topic(self, group: str) -> str:
+        return f'{self.prefix}:group:{group}'
+
+    def serialize(self, message: dict) -> bytes:
+        return json.dumps(message).encode('utf-8')
+
+    def deserialize(self, data: bytes) -> dict:
+        return json.loads(data)
+
+    async def new_channel(self, prefix='specific.'):
+        channel = f'{prefix}{self.client_prefix}.{random_string(12)}'
+        self._queues[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        await self._subscribe(self.channel_topic(channel))
+        return channel
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        await self._publish(self.channel_topic(channel), self.serialize(message))
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        if channel not in self._queues:
+            self._queues[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+            await self._subscribe(self.channel_topic(channel))
+
+        try:
+            return await self._queues[channel].get()
+        except asyncio.CancelledError:
+            # The consumer went away, stop listening on its channel and groups
+            await self._remove_channel(channel)
+            raise
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        members = self._groups.setdefault(group, set())
+        if not members:
+            await self._subscribe(self.group_topic(group))
+        members.add(channel)
+
+    async def group_discard(self, group, channel):
+        members = self._groups.get(group)
+        if not members:
+            return
+
+        members.discard(channel)
+        if not members:
+            self._groups.pop(group)
+            await self._unsubscribe(self.group_topic(group))
+
+    async def group_send(self, group, message):
+        assert self.valid_group_name(group), 'Group name not valid'
+        await self._publish(self.group_topic(group), self.serialize(message))
+
+    async def flush(self):
+        await self.close()
+        self._queues.clear()
+        self._groups.clear()
+
+    async def close(self):
+        for connection in (self._subscriber, self._publisher):
+            if connection:
+                connection.close()
+        self._subscriber = None
+        self._publisher = None
+
+    async def _remove_channel(self, channel: str):
+        self._queues.pop(channel, None)
+        for group in [group for group, members in self._groups.items() if channel in members]:
+            await self.group_discard(group, channel)
+        await self._unsubscribe(self.channel_topic(channel))
+
+    async def _connect(self) -> _Connection:
+        host, port = parse_address(self.url)
+        reader, writer = await asyncio.open_connection(host, port)
+        return _Connection(reader, writer)
+
+    def _connect_lock(self) -> asyncio.Lock:
+        # Locks are bound to an event loop, and every async_to_sync call runs the layer on a new loop
+        loop = asyncio.get_running_loop()
+        lock = self._connect_locks.get(loop)
+        if lock is None:
+            lock = self._connect_locks[loop] = asyncio.Lock()
+        return lock
+
+    async def _publish(self, topic: str, data: bytes):
+        if self._publisher is None or not self._publisher.usable:
+            async with self._connect_lock():
+                # Another publish may have connected while waiting for the lock
+                if self._publisher is None or not self._publisher.usable:
+                    self._publisher = await self._connect()
+
+        connection = self._publisher
+        async with connection.lock:
+            connection.writer.write(encode_command('PUBLISH', topic, data))
+            await connection.writer.drain()
+            await read_reply(connection.reader)
+
+    async def _get_subscriber(self) -> _Connection:
+        if self._subscriber is not None and self._subscriber.usable:
+            return self._subscriber
+
+        # Only one subscriber connection (and listener) may exist, otherwise messages are delivered twice
+        async with self._connect_lock():
+            if self._subscriber is not None and self._subscriber.usable:
+                return self._subscriber
+
+            if self._subscriber is not None:
+                self._subscriber.close()
+
+            connection = self._subscriber = await self._connect()
+            connection.task = asyncio.create_task(self._listen(connection))
+
+            # Restore the subscriptions of a dropped connection
+            topics = [self.channel_topic(channel) for channel in self._queues] + \
+                     [self.group_topic(group) for group in self._groups]
+            if topics:
+                connection.writer.write(encode_command('SUBSCRIBE', *topics))
+                await connection.writer.drain()
+
+            return connection
+
+    async def _subscribe(self, topic: str):
+        connection = await self._get_subscriber()
+        connection.writer.write(encode_command('SUBSCRIBE', topic))
+        await connection.writer.drain()
+
+    async def _unsubscribe(self, topic: str):
+        if self._subscriber is None or not self._subscriber.usable:
+            return
+
+        self._subscriber.writer.write(encode_command('UNSUBSCRIBE', topic))
+        await self._subscriber.writer.drain()
+
+    async def _listen(self, connection: _Connection):
+        channel_prefix = self.channel_topic('').encode('utf-8')
+        group_prefix = self.group_topic('').encode('utf-8')
+
+        try:
+            while True:
+                reply = await read_reply(connection.reader)
+                if not isinstance(reply, list) or len(reply) != 3 or reply[0] != b'message':
+                    continue
+
+                _, topic, data = reply
+                if topic.startswith(channel_prefix):
+                    channels = [topic[len(channel_prefix):].decode('utf-8')]
+                elif topic.startswith(group_prefix):
+                    channels = list(self._groups.get(topic[len(group_prefix):].decode('utf-8'), ()))
+                else:
+                    continue
+
+                for channel in channels:
+                    queue = self._queues.get(channel)
+                    if queue is None:
+                        continue
+                    try:
+                        queue.put_nowait(self.deserialize(data))
+                    except asyncio.QueueFull:
+                        logger.warning(f'Dropping message for full channel {channel}')
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logger.warning(f'Lost connection to the broadcast server: {e}')
+            connection.writer.close()
+            if self._subscriber is connection:
+                asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = 0.5
+        while self._queues or self._groups:
+            try:
+                await self._get_subscriber()
+                return
+            except OSError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10)
+
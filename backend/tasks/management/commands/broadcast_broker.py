@@ -0,0 +1,92 @@
+import asyncio
+from collections import defaultdict
+from typing import Dict, Set
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from shared.logging import get_logger
+from shared.resp import read_reply, parse_address, RespError
+
+logger = get_logger()
+
+
+class Broker:
+    """
+    A minimal in-memory publish/subscribe server speaking the subset of the redis protocol used by the socket
+    channel layer (PUBLISH, SUBSCRIBE, UNSUBSCRIBE and PING). It can stand in for a redis server on a single host.
+    """
+
+    def __init__(self):
+        self.subscriptions: Dict[bytes, Set[asyncio.StreamWriter]] = defaultdict(set)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        topics: Set[bytes] = set()
+        try:
+            while True:
+                command = await read_reply(reader)
+                if not isinstance(command, list) or not command:
+                    raise RespError('Expected a command array')
+
+                name, args = command[0].upper(), command[1:]
+                match name:
+                    case b'PUBLISH':
+                        topic, data = args
+                        message = _encode(b'message', topic, data)
+                        subscribers = self.subscriptions.get(topic, ())
+                        for subscriber in subscribers:
+                            subscriber.write(message)
+                        writer.write(b':%d\r\n' % len(subscribers))
+                    case b'SUBSCRIBE':
+                        for topic in args:
+                            topics.add(topic)
+                            self.subscriptions[topic].add(writer)
+                            writer.write(_encode(b'subscribe', topic, len(topics)))
+                    case b'UNSUBSCRIBE':
+                        for topic in args:
+                            topics.discard(topic)
+                            self._remove(topic, writer)
+                            writer.write(_encode(b'unsubscribe', topic, len(topics)))
+                    case b'PING':
+                        writer.write(b'+PONG\r\n')
+                    case _:
+                        writer.write(b'-ERR unknown command\r\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, RespError):
+            pass
+        finally:
+            for topic in topics:
+                self._remove(topic, writer)
+            writer.close()
+
+    def _remove(self, topic: bytes, writer: asyncio.StreamWriter):
+        subscribers = self.subscriptions.get(topic)
+        if subscribers is not None:
+            subscribers.discard(writer)
+            if not subscribers:
+                self.subscriptions.pop(topic)
+
+
+def _encode(*items) -> bytes:
+    parts = [b'*%d\r\n' % len(items)]
+    for item in items:
+        if isinstance(item, int):
+            parts.append(b':%d\r\n' % item)
+        else:
+            parts.append(b'$%d\r\n%s\r\n' % (len(item), item))
+    return b''.join(parts)
+
+
+class Command(BaseCommand):
+    help = 'Runs a local publish/subscribe server for the socket channel layer'
+
+    def handle(self, *args, **options):
+        host, port = parse_address(settings.BROADCAST_URL)
+
+        async def serve():
+            server = await asyncio.start_server(Broker().handle, host, port)
+            logger.info(f'Broadcast broker listening on {host}:{port}')
+            async with server:
+                await server.serve_forever()
+
+        asyncio.run(serve())
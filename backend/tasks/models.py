@@ -1,7 +1,10 @@
+from typing import List
+
 from django.db import models
 from django.conf import settings
 from django.db.models import Q
 from django.db.models.query import QuerySet
+from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.auth.models import User
@@ -11,6 +14,17 @@ from celery.utils import uuid
 
 from shared.models import TimeStampMixin
 
+TASKS_PUBLIC_GROUP = 'tasks.public'
+"""The group receiving events of tasks that every user can view."""
+
+TASKS_SUPERUSER_GROUP = 'tasks.superusers'
+"""The group receiving events of all tasks."""
+
+
+def task_user_group(user_id) -> str:
+    """The group receiving events of tasks visible to the given user."""
+    return f'tasks.user.{user_id}'
+
 
 class TaskState(object):
     PENDING = 'PENDING'
@@ -19,10 +33,30 @@ class TaskState(object):
     FAILURE = 'FAILURE'
     SUCCESS = 'SUCCESS'
 
+    ORDER = {
+        PENDING: 0,
+        STARTED: 1,
+        RETRY: 1,
+        FAILURE: 2,
+        SUCCESS: 2,
+    }
+    """The rank of each state, a task only moves to states of a higher rank (or between STARTED and RETRY)."""
+
     @classmethod
     def lookup(cls, state):
         return getattr(cls, state)
 
+    @classmethod
+    def preceding(cls, state) -> List[str]:
+        """
+        The states from which a task may transition into the given state
+        """
+        rank = cls.ORDER[state]
+        return [
+            other for other, other_rank in cls.ORDER.items()
+            if other_rank < rank or (other_rank == rank == cls.ORDER[cls.STARTED] and other != state)
+        ]
+
 
 class TaskFilterMixin(object):
     objects: models.Manager()
@@ -62,6 +96,21 @@ class TaskManager(TaskFilterMixin, models.Manager):
     def get_queryset(self):
         return TaskQuerySet(self.model, using=self._db)
 
+    def transition(self, task_id, state: str) -> bool:
+        """
+        It moves a task into the given state with a single conditional UPDATE. States only move forward (see
+        `TaskState.ORDER`), so a late or duplicate celery signal can't overwrite a state the task has already passed.
+        Unlike `save`, no post_save signal is sent.
+
+        :param task_id: The id of the task
+        :param state: The new state
+        :return: Whether the task was updated.
+        """
+        return self.filter(task_id=task_id, state__in=TaskState.preceding(state)).update(
+            state=state,
+            updated_at=timezone.now(),
+        ) > 0
+
 
 class Task(TimeStampMixin):
     STATES = (
@@ -102,6 +151,25 @@ class Task(TimeStampMixin):
             self.content_object and self.content_object.can_view(user)
         )
 
+    def get_event_groups(self) -> List[str]:
+        """
+        The groups the events of this task are published to. Together they reach exactly the users that can view the
+        task (see `can_view`), so that consumers don't need to check permissions themselves.
+        """
+        groups = {TASKS_SUPERUSER_GROUP}
+        if self.creator_id:
+            groups.add(task_user_group(self.creator_id))
+
+        content_object = self.content_object
+        if content_object is not None and hasattr(content_object, 'get_viewer_ids'):
+            viewer_ids = content_object.get_viewer_ids()
+            if viewer_ids is None:
+                groups.add(TASKS_PUBLIC_GROUP)
+            else:
+                groups.update(task_user_group(viewer_id) for viewer_id in viewer_ids)
+
+        return sorted(groups)
+
 
 class ModelAsyncResult(AsyncResult):
     def forget(self):
@@ -215,6 +283,7 @@ class TaskMixin(models.Model):
             task.content_object = self
             task.name = name
             task.creator = creator
+            task.state = TaskState.PENDING
         except Task.DoesNotExist:
             task = Task(task_id=task_id, content_object=self, name=name)
             task.creator = creator
@@ -4,56 +4,43 @@ from django.dispatch import receiver
 from django.core.exceptions import ObjectDoesNotExist
 
 from shared.logging import get_logger
+from tasks.events import schedule_task_event
 from tasks.models import Task, TaskState
-from tasks.utils import send_to_group_sync
 
 logger = get_logger()
 
 
-@signals.after_task_publish.connect
-def handle_after_task_publish(sender=None, body=None, headers=None, **kwargs):
-    if headers and 'id' in headers:
-        try:
-            instance = Task.objects.get(task_id=headers['id'])
-            instance.state = TaskState.PENDING
-            instance.save()
-        except ObjectDoesNotExist:
-            pass
+def transition_task(task_id, state: str):
+    """
+    It moves a task into the given state and schedules a (coalesced) update for its websocket groups
+
+    :param task_id: The id of the task
+    :param state: The new state
+    """
+    if Task.objects.transition(task_id, state):
+        schedule_task_event(task_id)
 
 
 @signals.task_prerun.connect
 def handle_task_prerun(sender=None, task_id=None, **kwargs):
-    if not task_id:
-        return
-
-    try:
-        instance = Task.objects.get(task_id=task_id)
-        instance.state = TaskState.STARTED
-        instance.save()
-    except ObjectDoesNotExist:
-        pass
+    if task_id:
+        transition_task(task_id, TaskState.STARTED)
 
 
 @signals.task_postrun.connect
 def handle_task_postrun(sender=None, task_id=None, state=None, **kwargs):
     if task_id and state:
-        try:
-            instance = Task.objects.get(task_id=task_id)
-            instance.state = TaskState.lookup(state)
-            instance.save()
-        except ObjectDoesNotExist as e:
-            logger.exception(e)
+        if state not in TaskState.ORDER:
+            logger.warning(f'Ignoring unknown state {state} of task {task_id}')
+            return
+
+        transition_task(task_id, TaskState.lookup(state))
 
 
 @signals.task_failure.connect
 def handle_task_failure(sender=None, task_id=None, **kwargs):
     if task_id:
-        try:
-            instance = Task.objects.get(task_id=task_id)
-            instance.state = TaskState.FAILURE
-            instance.save()
-        except ObjectDoesNotExist:
-            pass
+        transition_task(task_id, TaskState.FAILURE)
 
 
 @signals.task_revoked.connect
@@ -67,8 +54,5 @@ def handle_task_revoked(sender=None, request=None, **kwargs):
 
 
 @receiver(post_save, sender=Task)
-def handle_task_update(sender, instance, created, **kwargs):
-    send_to_group_sync(str('TASKS_GLOBAL'), {
-        'type': 'task_updated',
-        'message': str(instance.task_id)
-    })
+def handle_task_update(sender, instance: Task, created, **kwargs):
+    schedule_task_event(instance.task_id)
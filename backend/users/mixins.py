@@ -1,3 +1,5 @@
+from typing import Optional, List
+
 from django.contrib.auth.models import User
 
 
@@ -7,3 +9,9 @@ class OwnableMixin:
 
     def can_view(self, user: User):
         return user.is_superuser
+
+    def get_viewer_ids(self) -> Optional[List[int]]:
+        """
+        The ids of the (non superuser) users that can view the object, or None if every user can view it
+        """
+        return []
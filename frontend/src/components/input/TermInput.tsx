@@ -11,6 +11,7 @@ import _ from "lodash";
 import throttle from "lodash/throttle";
 import React, { useMemo } from "react";
 import { useApi } from "../../hooks/useApi";
+import { searchTerms } from "../../services/search";
 import { Term, TermPos, SearchResult } from "../../types/terms";
 import { extractIriLabel, formatIri } from "../../utils/formatting";
 
@@ -28,6 +29,7 @@ export const TermInput = (props: {
   const [ valueInternal, setValue ] = React.useState<Term[]>([]);
   const [ inputValue, setInputValue ] = React.useState('');
   const [ options, setOptions ] = React.useState<readonly Term[]>([]);
+  const [ partial, setPartial ] = React.useState(false);
 
   const value = propValue ?? valueInternal;
   const apiClient = useApi();
@@ -37,14 +39,12 @@ export const TermInput = (props: {
       request: { query: string },
       callback: (result?: SearchResult<Term>) => void,
     ) => {
-      const result = await apiClient.get(`/datasets/${datasetId}/search`, {
-        params: {
-          limit: limit ?? 50,
-          query: request.query,
-          pos,
-        }
+      const result = await searchTerms(apiClient, datasetId, {
+        limit: limit ?? 50,
+        query: request.query,
+        pos,
       })
-      callback(result.data)
+      callback(result)
     }, 200), [ pos, datasetId, limit ]);
 
   React.useEffect(() => {
@@ -63,6 +63,7 @@ export const TermInput = (props: {
 
         const options = _.uniqBy(optionCandidates, 'value');
         setOptions(options);
+        setPartial(!!results?.partial);
       }
     });
 
@@ -77,8 +78,9 @@ export const TermInput = (props: {
       variant="filled"
       fullWidth
       label={label}
+      helperText={partial ? 'Some search services did not respond, the suggestions may be incomplete' : undefined}
     />
-  ), [ label ]);
+  ), [ label, partial ]);
 
   const renderOption = useMemo(() => (props, option: Term) => {
     const { key, className, ...rest } = props;
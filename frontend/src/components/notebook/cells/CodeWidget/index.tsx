@@ -9,6 +9,7 @@ import { CodeCellType } from "../../../../types/notebooks";
 import { cellOutputToYasgui } from "../../../../utils/yasgui";
 import { Yasr } from "../../../data/Yasr";
 import { Yasqe } from "../../../input/Yasqe";
+import { CellOutputStatus } from "../../outputs/CellOutputStatus";
 import { GPTModal } from "./GPTModal";
 
 
@@ -37,6 +38,7 @@ export const CodeWidget = () => {
   const result = useMemo(() => {
     if (!!outputs?.length) {
       return (<Box sx={{ width: '100%' }}>
+        <CellOutputStatus outputs={outputs}/>
         <Yasr
           result={cellOutputToYasgui(outputs[0])}
           prefixes={prefixes}
@@ -0,0 +1,31 @@
+import { Chip, Stack, Tooltip } from "@mui/material";
+import React from "react";
+import { CellOutput } from "../../../types/notebooks";
+
+
+export const CellOutputStatus = ({ outputs }: {
+  outputs: CellOutput[] | null;
+}) => {
+  const results = (outputs ?? []).filter(output => output.output_type === 'execute_result');
+  const cached = results.some(output => output.output_type === 'execute_result' && output.cached);
+  const truncated = results.some(output => output.output_type === 'execute_result' && output.truncated);
+
+  if (!cached && !truncated) {
+    return null;
+  }
+
+  return (
+    <Stack direction="row" spacing={1} sx={{ mb: 1 }}>
+      {cached && (
+        <Tooltip title="The result was served from the query cache">
+          <Chip label="Cached" size="small" variant="outlined"/>
+        </Tooltip>
+      )}
+      {truncated && (
+        <Tooltip title="The result was too large, only its first rows were kept">
+          <Chip label="Truncated" size="small" color="warning"/>
+        </Tooltip>
+      )}
+    </Stack>
+  )
+}
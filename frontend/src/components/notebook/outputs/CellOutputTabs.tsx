@@ -3,6 +3,7 @@ import React, { useCallback, useMemo } from "react";
 import { useCellContext } from "../../../providers/CellProvider";
 import { Cell, CellOutput } from "../../../types/notebooks";
 import { VirtualizedTabs } from "../../layout/VirtualizedTabs";
+import { CellOutputStatus } from "./CellOutputStatus";
 
 
 export const CellOutputTabs = ({
@@ -34,12 +35,15 @@ export const CellOutputTabs = ({
     };
 
     return (
-      ((outputs && outputs.length > 0) && <VirtualizedTabs
+      ((outputs && outputs.length > 0) && <>
+        <CellOutputStatus outputs={outputs}/>
+        <VirtualizedTabs
           value={mode ?? options[0].value}
           tabs={options}
           onChange={(event, value) => onChange(value)}
           renderTab={renderResultTab}
-      />)
+        />
+      </>)
     )
   }, [ (cell as any).data?.output_mode, outputs, extraData ])
 }
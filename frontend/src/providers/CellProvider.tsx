@@ -1,8 +1,11 @@
 import React, { useCallback, useEffect, useMemo } from "react";
-import { Cell, CellId, CellOutput, CellState, setCellState } from "../types/notebooks";
+import { useQuery } from "react-query";
+import { useApi } from "../hooks/useApi";
+import { Cell, CellId, CellOutput, CellState, isOutputsRef, setCellState } from "../types/notebooks";
 import { useCellFocusContext } from "./CellFocusProvider";
 import { useNotebookConnectionContext } from "./NotebookConnectionProvider";
 import { useNotebookContext } from "./NotebookProvider";
+import { useReportContext } from "./ReportProvider";
 import { useRunQueueContext } from "./RunQueueProvider";
 import { useUndoHistoryContext } from "./UndoHistoryProvider";
 
@@ -27,13 +30,26 @@ export const CellProvider = (props: {
   const { focus, setFocus } = useCellFocusContext();
   const { notebook, notebookRef } = useNotebookContext();
   const { setNotebook, setCell } = useUndoHistoryContext();
+  const { report } = useReportContext();
+  const apiClient = useApi();
   const cellRef = React.useRef<Cell>(null);
 
   const cell = notebook?.content?.cells[cellId];
   const state = notebook?.results?.states[cellId] || null;
-  const outputs = notebook?.results?.outputs[cellId] || null;
+  const storedOutputs = notebook?.results?.outputs[cellId] || null;
+  const outputsRef = isOutputsRef(storedOutputs) ? storedOutputs : null;
   cellRef.current = cell;
 
+  // Saved outputs are only referenced by the notebook, they are fetched once the cell is shown
+  const { data: fetchedOutputs } = useQuery([ 'cell-outputs', report?.id, cellId, outputsRef?.$artifact ], async () => {
+    const response = await apiClient.get<CellOutput[]>(`/reports/${report.id}/outputs/${cellId}/`);
+    return response.data;
+  }, {
+    enabled: !!outputsRef && !!report,
+    staleTime: Infinity,
+  });
+  const outputs = outputsRef ? (fetchedOutputs || null) : (storedOutputs as CellOutput[] | null);
+
   const cellIndex = notebook?.content?.cell_order.indexOf(cellId) ?? -1;
 
   const runCell = useCallback(() => {
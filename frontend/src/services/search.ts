@@ -0,0 +1,54 @@
+import { Axios } from "axios";
+import _ from "lodash";
+import { SearchResult, Term, TermPos } from "../types/terms";
+
+export interface TermSearchQuery {
+  query: string;
+  pos: TermPos;
+  limit?: number;
+  offset?: number;
+}
+
+interface PendingSearch {
+  query: TermSearchQuery;
+  resolve: (result: SearchResult<Term>) => void;
+  reject: (error: unknown) => void;
+}
+
+const BATCH_WINDOW = 10;
+const BATCH_SIZE = 32;
+
+const pendingSearches: Record<string, PendingSearch[]> = {};
+
+const flushSearches = async (apiClient: Axios, datasetId: string) => {
+  const pending = pendingSearches[datasetId] ?? [];
+  delete pendingSearches[datasetId];
+
+  for (const batch of _.chunk(pending, BATCH_SIZE)) {
+    try {
+      const response = await apiClient.post<{ results: SearchResult<Term>[] }>(
+        `/datasets/${datasetId}/search/batch`,
+        { queries: batch.map(({ query }) => query) },
+      );
+      batch.forEach(({ resolve }, i) => resolve(response.data.results[i]));
+    } catch (error) {
+      batch.forEach(({ reject }) => reject(error));
+    }
+  }
+}
+
+/**
+ * Searches the terms of a dataset. Searches issued within a few milliseconds of each other (like the inputs of a
+ * triple pattern) are sent together in a single batch request.
+ */
+export const searchTerms = (apiClient: Axios, datasetId: string, query: TermSearchQuery) =>
+  new Promise<SearchResult<Term>>((resolve, reject) => {
+    const pending = pendingSearches[datasetId];
+    if (pending) {
+      pending.push({ query, resolve, reject });
+      return;
+    }
+
+    pendingSearches[datasetId] = [ { query, resolve, reject } ];
+    setTimeout(() => flushSearches(apiClient, datasetId), BATCH_WINDOW);
+  });
@@ -11,7 +11,7 @@ export interface Notebook {
     cell_order: CellId[];
   };
   results: {
-    outputs: Record<CellId, CellOutput[]>;
+    outputs: Record<CellId, CellOutput[] | CellOutputsRef>;
     states: Record<CellId, CellState>;
   }
 }
@@ -78,6 +78,8 @@ export interface CellExecuteOutput extends BaseOutput {
   execution_count: number;
   data: OutputData;
   snapshot?: any;
+  cached?: boolean;
+  truncated?: boolean;
 }
 
 export interface CellStreamOutput extends BaseOutput {
@@ -93,6 +95,16 @@ export interface CellDisplayOutput extends BaseOutput {
 
 export type CellOutput = CellErrorOutput | CellExecuteOutput | CellStreamOutput | CellDisplayOutput;
 
+/** Outputs stored out-of-row by the server, they are fetched from the outputs endpoint of the report on demand */
+export interface CellOutputsRef {
+  '$artifact': string;
+  count: number;
+  size: number;
+}
+
+export const isOutputsRef = (outputs: CellOutput[] | CellOutputsRef | null): outputs is CellOutputsRef =>
+  !!outputs && !Array.isArray(outputs) && '$artifact' in outputs;
+
 export interface OutputData {
   'text/plain'?: string[];
   'image/png'?: string[];